@@ -0,0 +1,128 @@
+"""
+Benchmark of address extraction (src/address.py) on a synthetic corpus of ad descriptions : the
+row-by-row functions clean() used to apply versus the vectorized stage, whose output is checked to be
+exactly the same.
+
+Usage : python benchmarks/bench_address.py [--n-rows 100000]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from address import DEPARTMENTS, SEARCH_PATTERN, SPLIT_PATTERN, StationMatcher, get_addresses
+
+STATIONS = [
+    'Abbesses', 'Alesia', 'Alexandre Dumas', 'Alma - Marceau', 'Anatole France', 'Anvers', 'Argentine',
+    'Arts et Métiers', 'Assemblée nationale', 'Avenue Émile Zola', 'Avron', 'Balard', 'Barbès - Rochechouart',
+    'Bastille', 'Bel-Air', 'Belleville', 'Bercy', 'Bibliothèque François Mitterrand', 'Bir-Hakeim', 'Blanche',
+    'Bolivar', 'Bonne Nouvelle', 'Botzaris', 'Boucicaut', 'Bourse', 'Bréguet-Sabin', 'Buttes Chaumont',
+    'Cadet', 'Cambronne', 'Campo-Formio', 'Cardinal Lemoine', 'Censier - Daubenton', 'Charonne', 'Château Rouge',
+    "Château d'Eau", 'Châtelet', 'Chemin Vert', 'Cité', 'Commerce', 'Concorde', 'Convention', 'Corvisart',
+    'Cour Saint-Émilion', 'Courcelles', 'Couronnes', 'Crimée', 'Daumesnil', 'Denfert-Rochereau', 'Dupleix',
+    'Duroc', 'École Militaire', 'Edgar Quinet', 'Europe', 'Faidherbe - Chaligny', 'Falguière', 'Filles du Calvaire',
+    'Gaîté', 'Gambetta', 'Gare de Lyon', "Gare d'Austerlitz", 'Gare de l\'Est', 'Gare du Nord', 'Glacière',
+    'Goncourt', 'Guy Môquet', 'Hôtel de Ville', 'Invalides', 'Jasmin', 'Jaurès', 'Javel - André Citroën',
+    'Jourdain', 'Jussieu', 'La Chapelle', 'La Motte-Picquet - Grenelle', 'Lamarck - Caulaincourt', 'Ledru-Rollin',
+    'Louis Blanc', 'Lourmel', 'Mabillon', 'Madeleine', 'Maubert - Mutualité', 'Ménilmontant', 'Michel Bizot',
+    'Monge', 'Montparnasse - Bienvenüe', 'Nation', 'Oberkampf', 'Odéon', 'Opéra', 'Parmentier', 'Passy',
+    'Pasteur', 'Père Lachaise', 'Pigalle', 'Place d\'Italie', 'Place de Clichy', 'Porte de Bagnolet',
+    'Porte de Clichy', 'Porte de Versailles', 'Porte de Vincennes', 'Porte Dorée', 'Porte Maillot', 'Pyrénées',
+    'Quai de la Gare', 'Rambuteau', 'Ranelagh', 'Raspail', 'République', 'Richard-Lenoir', 'Saint-Ambroise',
+    'Saint-Germain-des-Prés', 'Saint-Lazare', 'Saint-Michel', 'Saint-Paul', 'Sèvres - Babylone', 'Strasbourg - Saint-Denis',
+    'Temple', 'Ternes', 'Trocadéro', 'Vaugirard', 'Vavin', 'Volontaires', 'Voltaire', 'Wagram',
+]
+
+STREETS = ['rue Oberkampf', 'avenue de la République', 'boulevard Voltaire', 'place des Vosges', 'quai de Jemmapes',
+           'rue de la Roquette', 'avenue Jean-Jaurès', 'rue du Faubourg Saint-Antoine', 'rue Sainte-Anne',
+           'rue calme', 'place de parking', 'boulevard périphérique', 'quai de Seine']
+CITIES = [('PARIS 11', 75011), ('PARIS 15', 75015), ('PARIS 01', 75001), ('PARIS 20', 75020), ('MONTREUIL', 93),
+          ('VINCENNES', 94), ('BOULOGNE-BILLANCOURT', 92), ('VERSAILLES', 78), ('MELUN', 77), ('EVRY', 91),
+          ('CERGY', 95), ('ORSAY', 91)]
+ENDINGS = [' proche du métro.', ' et ses commerces.', ' à proximité des écoles.', ', appartement lumineux.', '.']
+
+
+def synthetic_corpus(n_rows, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(n_rows):
+        city, dept = rng.choice(CITIES)
+        parts = ['Dans un immeuble ancien']
+        if rng.random() < .6:
+            parts.append(f' situé {rng.choice(STREETS)}{rng.choice(ENDINGS)}')
+        else:
+            parts.append(', bel appartement de standing.')
+        if rng.random() < .5:
+            parts.append(f' Métro {rng.choice(STATIONS)} à deux pas.')
+        parts.append(' Cuisine équipée, parquet, double vitrage, cave.' * rng.randint(1, 6))
+        rows.append((''.join(parts), city, dept))
+    return pd.DataFrame(rows, columns=['descr', 'city', 'dept'])
+
+
+def get_address_from_descr(row, metro):
+    """Row-by-row reference implementation, as clean() used to run it."""
+    descr = unidecode(row.descr)
+    descr = re.sub(r'(sainte?)\-(\w+)', r'\1 \2', descr, flags=re.IGNORECASE)
+    search = re.search(SEARCH_PATTERN.pattern, descr, flags=re.IGNORECASE)
+    if search:
+        city = row.city if not row.city.upper().startswith('PARIS') else 'PARIS'
+        addr = search.group(1).strip().lower()
+        addr = re.split(SPLIT_PATTERN.pattern, addr)[0]
+        return f'{addr} {city} {DEPARTMENTS.get(row.dept, row.dept)} France'.lower()
+    else:
+        if row.city.upper().startswith('PARIS'):
+            search = re.search(metro, row.descr, flags=re.IGNORECASE)
+            if search:
+                city = row.city if not row.city.startswith('PARIS') else 'PARIS'
+                return f'metro {search.group(1)} {city} {DEPARTMENTS.get(row.dept, row.dept)} France'.lower()
+            else:
+                return np.nan
+        else:
+            return np.nan
+
+
+def get_address_from_city_and_dept(row):
+    """Row-by-row reference implementation, as clean() used to run it."""
+    if row.city.upper().startswith('PARIS'):
+        arrn = re.sub(r'0(\d)', r'\1', row.city.split()[1])
+        arrn = '1er arrondissement' if arrn == '1' else f'{arrn}e arrondissement'
+        return f'paris {arrn} france'
+    else:
+        return f'{row.city} {DEPARTMENTS.get(row.dept, row.dept)} France'.lower()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    names = [unidecode(name).replace(' - ', '-').upper() for name in STATIONS]
+    metro = f'({"|".join(names)})'.replace('COMMERCE|', '')
+    df = synthetic_corpus(args.n_rows)
+
+    start = time.perf_counter()
+    expected = df.apply(lambda row: get_address_from_descr(row, metro), axis=1)
+    expected[expected.isna()] = df[expected.isna()].apply(get_address_from_city_and_dept, axis=1)
+    elapsed = time.perf_counter() - start
+    print(f'row by row  {elapsed:6.2f} s  {args.n_rows / elapsed:10,.0f} rows/s')
+
+    start = time.perf_counter()
+    stations = StationMatcher([name for name in names if name != 'COMMERCE'])
+    address = get_addresses(df.descr, df.city, df.dept, stations)
+    elapsed = time.perf_counter() - start
+    print(f'vectorized  {elapsed:6.2f} s  {args.n_rows / elapsed:10,.0f} rows/s')
+
+    assert address.tolist() == expected.tolist(), 'vectorized addresses differ from the row by row ones'
+    print(f'{address.str.startswith("metro").sum():,} metro addresses, identical outputs')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of the geospatial summaries of the ads (src/aggregation.py) : time and memory of the
+GeoDataFrame of one point per ad built by get_geo_df (dataviz.ipynb) and of the aggregates recomputed
+by plot_col for every figure, versus the summaries per département, arrondissement and grid cell
+computed with a single spatial join, then read from the cache.
+
+Usage : python benchmarks/bench_aggregation.py [--n-ads 50000 200000 1000000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import geopandas as gpd
+from shapely.geometry import Point
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from aggregation import load_summaries
+from bench_neighbourhood import synthetic_ads
+from spatial import load_areas
+
+SHAPEFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'shapefiles')
+
+
+def notebook(df):
+    """get_geo_df and the aggregates of the price and surface figures of dataviz.ipynb."""
+    geo_df = gpd.GeoDataFrame(df, crs='epsg:4326', geometry=[Point(xy) for xy in zip(df.lon, df.lat)])
+    for column in ['price', 'surface']:
+        geo_df.groupby('dept')[column].median()
+    return geo_df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-ads', type=int, nargs='+', default=[50000, 200000, 1000000])
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        shutil.copytree(SHAPEFILES, os.path.join(folder, 'shapefiles'))
+        areas = load_areas(os.path.join(folder, 'shapefiles'))
+        print(f'{"ads":>10} {"notebook s":>11} {"MiB":>6} {"summaries s":>12} {"MiB":>6} {"cached s":>9}')
+        for n in args.n_ads:
+            df = synthetic_ads(n)
+            df['dept'] = areas.get_departments(df.lat, df.lon)
+
+            start = time.perf_counter()
+            geo_df = notebook(df)
+            elapsed = time.perf_counter() - start
+            memory = geo_df.memory_usage(deep=True).sum() / 2 ** 20
+
+            start = time.perf_counter()
+            summaries = load_summaries(df, folder)
+            computed = time.perf_counter() - start
+            summary_memory = sum(summary.memory_usage(deep=True).sum() for summary in summaries.values()) / 2 ** 20
+            start = time.perf_counter()
+            load_summaries(df, folder)
+            cached = time.perf_counter() - start
+            print(f'{n:>10,} {elapsed:11.2f} {memory:6.0f} {computed:12.2f} {summary_memory:6.1f} {cached:9.3f}')
+    finally:
+        shutil.rmtree(folder)
+    print('\n' + '\n'.join(f'{level:<16} {len(summary):>6,} areas' for level, summary in summaries.items()))
+
+
+if __name__ == '__main__':
+    main()
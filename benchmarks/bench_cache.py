@@ -0,0 +1,52 @@
+"""
+Benchmark of the on-disk response cache (src/http_cache.py) : simulates a first scrape followed by
+a daily re-scrape in which only a fraction of the ads changed, and reports the cache statistics
+and the time taken by each run.
+
+Usage : python benchmarks/bench_cache.py [--n-pages 400] [--changed .1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fetcher import iter_pages
+from fixture_server import FixtureServer
+from http_cache import ResponseCache
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-pages', type=int, default=400)
+    parser.add_argument('--changed', type=float, default=.1)
+    parser.add_argument('--latency', type=float, default=.05)
+    args = parser.parse_args()
+
+    version = {'day': 0}
+    n_changed = int(args.n_pages * args.changed)
+
+    def pages(path):
+        i = int(path.rsplit('/', 1)[-1])
+        day = version['day'] if i < n_changed else 0
+        return f'<html><body><p>ad {i} day {day}</p>'.encode() + b'x' * 50_000 + b'</body></html>'
+
+    with FixtureServer(pages, latency=args.latency) as server, tempfile.TemporaryDirectory() as cache_dir:
+        urls = [server.url(f'/ad/{i}') for i in range(args.n_pages)]
+
+        # ttl=0 so that the second run revalidates every page, as a daily re-scrape would
+        for day, label in enumerate(['first run', 're-scrape']):
+            version['day'] = day
+            cache = ResponseCache(cache_dir, ttl=0)
+            start = time.perf_counter()
+            for _ in iter_pages(urls, concurrency=8, cache=cache):
+                pass
+            print(f'{label:<10} {time.perf_counter() - start:6.2f} s', end='  ')
+            cache.report()
+            cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of the cached stages of data_cleaner.clean on a synthetic corpus : a cold run, a rerun
+without any change, and a rerun after the Orpi file changed. Addresses are geocoded by an offline
+stand-in of the BAN geocoder.
+
+Usage : python benchmarks/bench_cleaning.py [--n-rows 20000]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from data_cleaner import clean
+from gazetteer import Gazetteer, normalize_station
+from synthetic_pages import STATIONS
+from synthetic_raw import LandmarkGeocoder, write_raw_corpus
+
+SHAPEFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'shapefiles')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-rows', type=int, default=20000, help='number of ads per source')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        shutil.copytree(SHAPEFILES, os.path.join(folder, 'shapefiles'))
+        stations = pd.DataFrame({'name': STATIONS, 'normalized': [normalize_station(name) for name in STATIONS],
+                                 'lat': 48.86, 'lon': 2.37})
+        Gazetteer(stations).save(os.path.join(folder, 'metro_stations.json'))
+        paths = write_raw_corpus(os.path.join(folder, 'raw'), args.n_rows)
+
+        timings = []
+        for label in ['cold run', 'rerun, no change', 'rerun, Orpi changed']:
+            if label == 'rerun, Orpi changed':
+                write_raw_corpus(os.path.join(folder, 'raw'), args.n_rows, start=args.n_rows, sources=['orpi'])
+            start = time.perf_counter()
+            clean(paths['guy_hoquet'], paths['laforet'], paths['orpi'], data_folder=folder,
+                  geocoder=LandmarkGeocoder(latency=.2))
+            timings.append((label, time.perf_counter() - start))
+            print()
+
+    for label, seconds in timings:
+        print(f'{label:<20} {seconds:6.2f} s  {3 * args.n_rows / seconds:10,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark of the near-duplicate detection of ads (src/dedup.py) : time to index an increasing number
+of synthetic ads (about a fifth of which are copies of other ads with a few words of their description
+changed and slightly different surfaces and prices, as published by another agency), precision and
+recall against the known duplicates, incremental indexing by chunks versus indexing at once, and
+pairwise comparison of the shingles of every ad on a small sample.
+
+Usage : python benchmarks/bench_dedup.py [--n-ads 25000 50000 100000 200000 400000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from dedup import DedupIndex, normalize_descr
+
+DEPTS = [75001 + i for i in range(20)] + [77, 78, 91, 92, 93, 94, 95]
+
+
+def synthetic_ads(n, duplicate_rate=.2, edit_rate=.05, seed=0):
+    """
+    Synthetic ads, the duplicate column giving the position of the ad each duplicate was copied from
+    (-1 for original ads).
+    """
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array([f'mot{i}' for i in range(5000)])
+    n_originals = int(n * (1 - duplicate_rate))
+    lengths = rng.integers(40, 120, n_originals)
+    words = [rng.integers(0, len(vocabulary), length) for length in lengths]
+    ads = pd.DataFrame({
+        'dept': rng.choice(DEPTS, n_originals),
+        'rooms': rng.integers(1, 6, n_originals),
+        'surface': rng.uniform(9, 150, n_originals).round(),
+        'price': rng.integers(400, 4000, n_originals),
+        'duplicate': -1,
+    })
+
+    # copies of random originals, with a few words replaced and the surface and price changed a little
+    copied = rng.integers(0, n_originals, n - n_originals)
+    copies = ads.iloc[copied].reset_index(drop=True)
+    copies['surface'] += rng.choice([-.5, 0, .5], len(copies))
+    copies['price'] += rng.integers(-20, 21, len(copies))
+    copies['duplicate'] = copied
+    for i in copied:
+        copy = words[i].copy()
+        n_edits = max(1, int(len(copy) * edit_rate))
+        copy[rng.integers(0, len(copy), n_edits)] = rng.integers(0, len(vocabulary), n_edits)
+        words.append(copy)
+
+    ads = pd.concat([ads, copies], ignore_index=True)
+    ads['descr'] = [' '.join(vocabulary[w]) for w in words]
+    return ads
+
+
+def evaluate(ads, labels):
+    """Precision and recall of the clusters against the known duplicates."""
+    truth = np.where(ads.duplicate.to_numpy() >= 0, ads.duplicate.to_numpy(), np.arange(len(ads)))
+    found = pd.DataFrame({'label': labels, 'truth': truth})
+    # pairs of ads in the same cluster, counted per cluster
+    pairs = lambda groups: (groups.size() * (groups.size() - 1) // 2).sum()
+    n_found = pairs(found.groupby('label'))
+    n_truth = pairs(found.groupby('truth'))
+    n_correct = pairs(found.groupby(['label', 'truth']))
+    return n_correct / max(n_found, 1), n_correct / max(n_truth, 1)
+
+
+def pairwise(ads):
+    """Exact Jaccard similarity of the shingles of every pair of ads of the same département, as a reference."""
+    words = normalize_descr(ads.descr).str.split()
+    shingles = [set(zip(w, w[1:], w[2:])) for w in words]
+    depts = ads.dept.to_numpy()
+    n_pairs = 0
+    for i in range(len(ads)):
+        for j in range(i):
+            if depts[i] == depts[j]:
+                len(shingles[i] & shingles[j]) / len(shingles[i] | shingles[j])
+                n_pairs += 1
+    return n_pairs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-ads', type=int, nargs='+', default=[25000, 50000, 100000, 200000, 400000])
+    parser.add_argument('--n-chunks', type=int, default=4)
+    parser.add_argument('--n-pairwise', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f'{"ads":>10} {"seconds":>8} {"ads/s":>10} {"precision":>10} {"recall":>8}')
+    for n in args.n_ads:
+        ads = synthetic_ads(n)
+        start = time.perf_counter()
+        labels = DedupIndex().add(ads.descr, ads.dept, ads.rooms, ads.surface, ads.price)
+        elapsed = time.perf_counter() - start
+        precision, recall = evaluate(ads, labels)
+        print(f'{n:>10,} {elapsed:8.2f} {n / elapsed:10,.0f} {precision:10.2%} {recall:8.2%}')
+
+    # incremental indexing, e.g. as new scrapes arrive
+    index = DedupIndex()
+    start = time.perf_counter()
+    for rows in np.array_split(np.arange(len(ads)), args.n_chunks):
+        chunk = ads.iloc[rows]
+        index.add(chunk.descr, chunk.dept, chunk.rooms, chunk.surface, chunk.price)
+    elapsed = time.perf_counter() - start
+    assert (index.labels == labels).all()
+    print(f'\n{len(ads):,} ads indexed in {args.n_chunks} chunks in {elapsed:.2f} s, same clusters as at once')
+
+    sample = synthetic_ads(args.n_pairwise)
+    start = time.perf_counter()
+    n_pairs = pairwise(sample)
+    elapsed = time.perf_counter() - start
+    print(f'pairwise comparison of {len(sample):,} ads : {n_pairs:,} pairs in {elapsed:.2f} s, '
+          f'{elapsed * (len(ads) / len(sample)) ** 2 / 3600:,.1f} h extrapolated to {len(ads):,} ads')
+
+
+if __name__ == '__main__':
+    main()
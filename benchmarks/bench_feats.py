@@ -0,0 +1,60 @@
+"""
+Benchmark of the parsing of the features of Guy Hoquet ads (src/data_cleaner.py) : the former parsing,
+which evaluated the list literals written by the scrapers and made one pass over the features per
+field, versus the single regex pass of parse_guy_hoquet_feats, on files written by current scrapers
+(features joined with '#') and by older ones (list literals).
+
+Usage : python benchmarks/bench_feats.py [--n-rows 200000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from data_cleaner import parse_guy_hoquet_feats
+from synthetic_raw import write_raw_corpus
+
+
+def former_parse(df):
+    """Parsing of the features before single-pass parsing, as a reference."""
+    df = df.copy()
+    df['feats'] = df.feats.apply(lambda x: eval(x))
+    df['surface'] = df.feats.str[0].str.replace(' m²', '').astype(float)
+    df['rooms'] = df.feats.str[1].str.split().str[0].astype(int)
+    df['bedrooms'] = df.feats.str.join('|').str.extract(r'\|(\d+)\schambre\(s\)\|')[0].fillna(0)
+    df['feats2'] = df.feats2.apply(lambda x: eval(x))
+    df['furnished'] = df.feats2.str.join('|').str.extract(r'\|(Meublé \w+)\|')[0].str.split().str[1]
+    return df[['surface', 'rooms', 'bedrooms', 'furnished']]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        legacy = pd.read_csv(write_raw_corpus(os.path.join(folder, 'legacy'), args.n_rows, sources=['guy_hoquet'],
+                                              legacy=True)['guy_hoquet'], sep='|')
+        joined = pd.read_csv(write_raw_corpus(os.path.join(folder, 'joined'), args.n_rows,
+                                              sources=['guy_hoquet'])['guy_hoquet'], sep='|')
+
+    start = time.perf_counter()
+    expected = former_parse(legacy)
+    elapsed = time.perf_counter() - start
+    print(f'eval, pass per field  {elapsed:6.2f} s  {args.n_rows / elapsed:10,.0f} rows/s')
+
+    for name, df in [('legacy files', legacy), ('joined files', joined)]:
+        start = time.perf_counter()
+        feats = parse_guy_hoquet_feats(df.feats, df.feats2)
+        elapsed = time.perf_counter() - start
+        print(f'single pass, {name}  {elapsed:6.2f} s  {args.n_rows / elapsed:10,.0f} rows/s')
+        pd.testing.assert_frame_equal(feats, expected, check_dtype=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""
+Benchmark of the concurrent fetch engine (src/fetcher.py) against a local fixture server adding
+artificial latency to every response. Ads per second should grow linearly with the concurrency
+setting until the server or the machine saturates.
+
+Usage : python benchmarks/bench_fetch.py [--n-pages 400] [--latency .05]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fetcher import iter_pages
+from fixture_server import FixtureServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-pages', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=.05)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    page = b'<html><body>' + b'x' * 20_000 + b'</body></html>'
+
+    with FixtureServer(lambda path: page, latency=args.latency) as server:
+        urls = [server.url(f'/ad/{i}') for i in range(args.n_pages)]
+
+        print(f'{args.n_pages} pages, {args.latency * 1000:.0f} ms latency')
+        print(f'{"concurrency":>12} {"seconds":>8} {"ads/sec":>8}')
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            n = sum(content is not None for _, content in iter_pages(urls, concurrency=concurrency, rate_limit=None))
+            elapsed = time.perf_counter() - start
+            print(f'{concurrency:>12} {elapsed:>8.2f} {n / elapsed:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
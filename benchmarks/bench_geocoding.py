@@ -0,0 +1,71 @@
+"""
+Benchmark of geocoding (src/geocoder.py) against a stub geocoder simulating the latency of the BAN
+API : row-by-row geocoding (what clean() used to do) versus deduplicated batch geocoding, first
+with an empty cache and then with a warm cache.
+
+Usage : python benchmarks/bench_geocoding.py [--n-rows 2000] [--n-unique 300]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from geocoder import GeocodeCache, geocode_addresses
+
+
+class StubGeocoder:
+    """Deterministic fake geocoder : every request costs latency seconds plus per_address seconds per address."""
+    def __init__(self, latency=.02, per_address=.0002):
+        self.latency = latency
+        self.per_address = per_address
+        self.n_requests = 0
+
+    def locate(self, address):
+        rng = random.Random(address)
+        return 48.5 + rng.random(), 1.8 + 1.5 * rng.random()
+
+    def geocode(self, address):
+        self.n_requests += 1
+        time.sleep(self.latency + self.per_address)
+        return self.locate(address)
+
+    def geocode_batch(self, addresses):
+        self.n_requests += 1
+        time.sleep(self.latency + self.per_address * len(addresses))
+        return {address: self.locate(address) for address in addresses}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-rows', type=int, default=2000)
+    parser.add_argument('--n-unique', type=int, default=300)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    unique = [f'{rng.randint(1, 200)} rue numero {i} paris france' for i in range(args.n_unique)]
+    addresses = pd.Series([rng.choice(unique) for _ in range(args.n_rows)])
+
+    geocoder = StubGeocoder()
+    start = time.perf_counter()
+    addresses.map(geocoder.geocode)
+    print(f'row by row          {time.perf_counter() - start:6.2f} s  {geocoder.n_requests:,} requests')
+
+    with tempfile.TemporaryDirectory() as folder:
+        for label in ['batch, cold cache', 'batch, warm cache']:
+            geocoder = StubGeocoder()
+            cache = GeocodeCache(os.path.join(folder, 'geocode_cache.sqlite'))
+            start = time.perf_counter()
+            coords = geocode_addresses(addresses, cache, geocoder)
+            print(f'{label:<19} {time.perf_counter() - start:6.2f} s  {geocoder.n_requests:,} requests, '
+                  f'{coords.lat.notna().sum():,} rows geocoded')
+            cache.close()
+
+
+if __name__ == '__main__':
+    main()
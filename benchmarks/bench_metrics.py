@@ -0,0 +1,72 @@
+"""
+Benchmark of the instrumentation (src/metrics.py) : fetch -> parse pipeline on a synthetic fixture
+corpus served with latency and transient errors, run without recording metrics, with metrics written
+to a JSON-lines file, and with metrics and each profiler, then the metrics of the runs side by side.
+
+Usage : python benchmarks/bench_metrics.py [--n-pages 2000] [--error-rate 0.02] [--output metrics.jsonl]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import metrics
+from fetcher import iter_pages
+from fixture_server import FixtureServer
+from parse_pool import parse_pages
+from synthetic_pages import AD_PAGES
+
+RUNS = [('no metrics', None, None), ('metrics', True, None), ('cprofile', True, 'cprofile'),
+        ('sampling', True, 'sampling')]
+
+
+def scrape(site, urls, concurrency):
+    """Fetch and parse stages of the scrapers, instrumented as in scraper.py."""
+    with metrics.span('scrape', source=site):
+        pages = metrics.timed(iter_pages(urls, concurrency=concurrency, retries=2, backoff=.01), 'fetch', source=site)
+        n = 0
+        for _, record in parse_pages(site, pages):
+            if record is None:
+                metrics.count('ads.dead', source=site)
+                continue
+            n += 1
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--site', default='laforet', choices=list(AD_PAGES))
+    parser.add_argument('--n-pages', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=.005)
+    parser.add_argument('--error-rate', type=float, default=.02)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--output', default=None, help='metrics file, a temporary file if None')
+    args = parser.parse_args()
+
+    corpus = [AD_PAGES[args.site](i).encode('utf-8') for i in range(args.n_pages)]
+    folder = tempfile.mkdtemp()
+    path = args.output or os.path.join(folder, 'metrics.jsonl')
+
+    with FixtureServer(lambda path: corpus[int(path.rsplit('/', 1)[-1])], latency=args.latency,
+                       error_rate=args.error_rate) as server:
+        urls = [server.url(f'/ad/{i}') for i in range(args.n_pages)]
+        print(f'{args.n_pages} {args.site} pages, {args.error_rate:.0%} of errors')
+        print(f'{"run":<12} {"seconds":>8} {"ads/s":>8}')
+        for name, record, profile in RUNS:
+            with metrics.run(path if record else None, profile, run_id=name):
+                start = time.perf_counter()
+                n = scrape(args.site, urls, args.concurrency)
+                elapsed = time.perf_counter() - start
+            print(f'{name:<12} {elapsed:8.2f} {n / elapsed:8.1f}')
+
+    print(f'\n{path} ({os.path.getsize(path) / 1024:.1f} KiB), with {path}.prof and {path}.folded')
+    print(metrics.compare([path]).to_string(float_format='{:,.2f}'.format))
+    shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
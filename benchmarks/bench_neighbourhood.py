@@ -0,0 +1,97 @@
+"""
+Benchmark of the neighbourhood features (src/neighbourhood.py) : time to build the KD-tree and to
+query the k nearest ads and the ads within a radius of every ad by vectorized batches, for an
+increasing number of synthetic ads spread over Île-de-France, versus a per-row loop computing the
+haversine distance to every ad on a sample, and time of the out-of-fold features computed and then
+read from the cache.
+
+Usage : python benchmarks/bench_neighbourhood.py [--n-ads 10000 50000 200000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from gazetteer import Gazetteer
+from neighbourhood import EARTH_RADIUS, FEATURES, Neighbourhood, add_neighbourhood_features
+from training import split_folds
+
+
+def synthetic_ads(n, seed=0):
+    """Synthetic ads, denser and more expensive around the center of Paris."""
+    rng = np.random.default_rng(seed)
+    distance = rng.exponential(8, n)  # km from the center of Paris
+    angle = rng.uniform(0, 2 * np.pi, n)
+    surface = rng.uniform(9, 150, n).round()
+    return pd.DataFrame({
+        'lat': 48.8566 + distance * np.sin(angle) / 111.,
+        'lon': 2.3522 + distance * np.cos(angle) / 73.,
+        'surface': surface,
+        'price': (surface * (35 * np.exp(-distance / 15) + rng.normal(0, 3, n))).round().clip(200),
+    })
+
+
+def naive(df, sample, k=10, radius=1., max_neighbours=100):
+    """Neighbourhood features of sample computed row by row, with the haversine distance to every ad of df."""
+    lat, lon = np.radians(df.lat.to_numpy()), np.radians(df.lon.to_numpy())
+    price_m2 = (df.price / df.surface).to_numpy()
+    features = []
+    for row in sample.itertuples():
+        a = (np.sin((lat - np.radians(row.lat)) / 2) ** 2
+             + np.cos(lat) * np.cos(np.radians(row.lat)) * np.sin((lon - np.radians(row.lon)) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+        nearest = np.argsort(distances)[:max_neighbours]
+        within = nearest[distances[nearest] <= radius]
+        features.append((np.median(price_m2[nearest[:k]]), distances[nearest[:k]].mean(), (distances <= radius).sum(),
+                         np.median(price_m2[within]) if len(within) else np.nan))
+    return np.array(features)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-ads', type=int, nargs='+', default=[10000, 50000, 200000])
+    parser.add_argument('--n-naive', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'{"ads":>10} {"build s":>8} {"query s":>8} {"ads/s":>10} {"naive ads/s":>12}')
+    for n in args.n_ads:
+        df = synthetic_ads(n)
+        start = time.perf_counter()
+        neighbourhood = Neighbourhood(df.lat, df.lon, df.price / df.surface)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        features = neighbourhood.query(df.lat, df.lon)
+        query = time.perf_counter() - start
+
+        sample = df.iloc[:args.n_naive]
+        start = time.perf_counter()
+        expected = naive(df, sample)
+        elapsed = time.perf_counter() - start
+        assert np.allclose(features.iloc[:len(sample)].to_numpy(), expected, equal_nan=True)
+        print(f'{n:>10,} {build:8.2f} {query:8.2f} {n / query:10,.0f} {len(sample) / elapsed:12,.0f}')
+
+    with tempfile.TemporaryDirectory() as folder:
+        # random metro stations, as the gazetteer is only built by an explicit refresh
+        stations = synthetic_ads(300, seed=1)[['lat', 'lon']]
+        stations.insert(0, 'name', [f'Station {i}' for i in range(len(stations))])
+        stations.insert(1, 'normalized', stations.name.str.upper())
+        gazetteer_path = os.path.join(folder, 'metro_stations.json')
+        Gazetteer(stations).save(gazetteer_path)
+        # folds of training.py, stratified by département (a single one here)
+        folds = split_folds(np.full(len(df), 75), 5, 0)
+        print(f'\nOut-of-fold features of {len(df):,} ads')
+        for run in ['computed', 'cached']:
+            start = time.perf_counter()
+            features = add_neighbourhood_features(df, folds, folder, gazetteer_path=gazetteer_path)
+            print(f'{run:<10} {time.perf_counter() - start:8.2f} s')
+    print(features[FEATURES].describe().T.to_string())
+
+
+if __name__ == '__main__':
+    main()
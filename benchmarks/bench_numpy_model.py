@@ -0,0 +1,108 @@
+"""
+Benchmark of the NumPy-only inference engine (src/numpy_model.py) versus Keras on CPU : cold start
+(time and peak memory of a fresh process loading the model and scoring a first ad), latency per batch
+at batch sizes 1, 64 and 4096, and largest difference with model.predict.
+
+The trained model (output/rent_predictor.h5 and output/scaler.pkl) is used if it exists, otherwise
+a model with the architecture of modeling.ipynb and random weights.
+
+Usage : python benchmarks/bench_numpy_model.py [--n-ads 20000] [--model output/rent_predictor.h5]
+"""
+import argparse
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.preprocessing import RobustScaler
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+from bench_predictor import BATCH_SIZES, build_model, random_ads
+from numpy_model import NumpyModel, export_model
+from predictor import NUMCOLS, RentPredictor, load_model
+
+# run in a fresh process : imports, loading of the model and scoring of a first ad
+COLD_START = '''
+import json, re, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {src!r})
+from predictor import RentPredictor
+predictor = RentPredictor({model!r}, {scaler!r})
+predictor.predict({{'rooms': 2, 'bedrooms': 1, 'is_house': 0, 'furnished': 0, 'surface': 45., 'lat': 48.86, 'lon': 2.37}})
+seconds = time.perf_counter() - start
+# peak RSS of this process (ru_maxrss would include the RSS of the benchmark process it's forked from)
+with open('/proc/self/status') as f:
+    max_rss = int(re.search(r'VmHWM:\s+(\d+) kB', f.read()).group(1))
+print(json.dumps({{'seconds': seconds, 'max_rss': max_rss}}))
+'''
+
+
+def cold_start(model_path, scaler_path):
+    code = COLD_START.format(src=SRC, model=model_path, scaler=scaler_path)
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-ads', type=int, default=20000)
+    parser.add_argument('--model', default=os.path.join('output', 'rent_predictor.h5'))
+    parser.add_argument('--scaler', default=os.path.join('output', 'scaler.pkl'))
+    args = parser.parse_args()
+
+    ads = random_ads(args.n_ads)
+    with tempfile.TemporaryDirectory() as folder:
+        if os.path.isfile(args.model) and os.path.isfile(args.scaler):
+            model_path, scaler_path = args.model, args.scaler
+            model = load_model(model_path)
+        else:
+            print('No trained model found, using random weights.')
+            model_path, scaler_path = os.path.join(folder, 'rent_predictor.keras'), os.path.join(folder, 'scaler.pkl')
+            model = build_model()
+            model.save(model_path)
+            with open(scaler_path, 'wb') as f:
+                pickle.dump(RobustScaler().fit(ads[NUMCOLS].to_numpy()), f)
+        npz_path = os.path.join(folder, 'rent_predictor.npz')
+        export_model(model, npz_path)
+        print(f'{os.path.getsize(npz_path) / 1024:.0f} KiB exported')
+
+        print('\nCold start')
+        print('==========')
+        for name, path in [('Keras', model_path), ('NumPy', npz_path)]:
+            result = cold_start(path, scaler_path)
+            print(f'{name:<6} {result["seconds"]:6.2f} s  {result["max_rss"] / 1024:8.0f} MiB peak RSS')
+
+        keras_predictor = RentPredictor(scaler_path=scaler_path, model=model)
+        numpy_predictor = RentPredictor(scaler_path=scaler_path, model=NumpyModel(npz_path))
+
+    inputs = keras_predictor.encode(ads)
+    expected = model.predict(inputs, verbose=0).reshape(-1)
+    predictions = numpy_predictor.predict_inputs(inputs)
+    # relative to the scale of the predictions, whatever the weights of the model
+    error = np.abs(predictions - expected).max() / np.abs(expected).max()
+    print(f'\nlargest difference with model.predict : {error:.2e} of the largest prediction')
+    assert error < 1e-5
+
+    print('\nLatency per batch')
+    print('=================')
+    for batch_size in BATCH_SIZES:
+        n = args.n_ads if batch_size > 1 else min(args.n_ads, 2000)
+        batches = [{name: values[i:i + batch_size] for name, values in inputs.items()} for i in range(0, n, batch_size)]
+        for name, engine in [('Keras', model), ('NumPy', numpy_predictor.model)]:
+            latencies = []
+            for batch in batches:
+                start = time.perf_counter()
+                engine.predict_on_batch(batch)
+                latencies.append(time.perf_counter() - start)
+            print(f'{name:<6} batch {batch_size:>5}  p50 {np.median(latencies) * 1000:8.3f} ms  '
+                  f'p99 {np.quantile(latencies, .99) * 1000:8.3f} ms  {n / sum(latencies):12,.0f} ads/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Benchmark of listing discovery for Orpi and Guy Hoquet : HTTP pagination (get_links_http) versus
+browser pagination in Firefox, both reading the same saved HTML fixtures served locally.
+The browser mode is skipped when selenium or Firefox isn't available.
+
+Usage : python benchmarks/bench_pagination.py [--n-pages 50] [--latency .05]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fixture_server import FixtureServer
+from scraper import (get_guy_hoquet_links_browser, get_links_http, get_orpi_links_browser, guy_hoquet_has_next,
+                     orpi_has_next)
+from synthetic_pages import save_listing_fixtures
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    try:
+        links = function(*args)
+    except Exception as e:
+        return None, f'skipped ({type(e).__name__})'
+    return len(links), f'{time.perf_counter() - start:.2f} s'
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-pages', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=.05)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        pages = save_listing_fixtures(folder, args.n_pages)
+
+        with FixtureServer(pages, latency=args.latency) as server:
+            orpi_url = server.url('/orpi/listing?page={page}')
+            guy_hoquet_url = server.url('/guy-hoquet/biens/result?p={page}')
+
+            runs = [
+                ('orpi', 'http', get_links_http, (orpi_url, 'a.u-link-unstyled.c-overlay__link', orpi_has_next)),
+                ('orpi', 'browser', get_orpi_links_browser, (orpi_url.format(page=1),)),
+                ('guy_hoquet', 'http', get_links_http, (guy_hoquet_url, 'a.property_link_block', guy_hoquet_has_next)),
+                ('guy_hoquet', 'browser', get_guy_hoquet_links_browser, (guy_hoquet_url.format(page=1),)),
+            ]
+
+            print(f'{args.n_pages} listing pages per site, {args.latency * 1000:.0f} ms latency')
+            for site, mode, function, function_args in runs:
+                n_links, result = timed(function, *function_args)
+                print(f'{site:<12} {mode:<8} {result:<24} {n_links if n_links is not None else "-"} links')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""
+Micro-benchmark of ad page parsing : the compiled lxml extractors of src/extractors.py versus the
+BeautifulSoup code the scrapers used before (kept below as a reference), over synthetic fixture
+pages. Both paths are checked to return the same records.
+
+Usage : python benchmarks/bench_parsing.py [--n-pages 500]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from extractors import EXTRACTORS
+from synthetic_pages import AD_PAGES
+
+
+def bs4_laforet(content):
+    temp_soup = BeautifulSoup(content)
+    try:
+        ref = temp_soup.select_one('div.property__title span').text.strip()
+    except AttributeError:
+        return None
+    title = temp_soup.select_one('div.property__title h1').text
+    price = (
+        temp_soup.select_one('div.property__price').text
+        .replace('\u202f', '').replace('\xa0', '').replace('\n', '').strip()
+    )
+    descr = ' '.join([text.strip()
+                      for text in temp_soup.select_one('div.property-content__description.mb-4').text.split('\n')
+                      if text.strip() != ''])
+    try:
+        conso = temp_soup.select('div.mb-4.col')[0].select_one('span.indicator__value').text.replace('\n', '').strip()
+    except AttributeError:
+        conso = ''
+    try:
+        emiss = temp_soup.select('div.mb-4.col')[1].select_one('span.indicator__value').text.replace('\n', '').strip()
+    except AttributeError:
+        emiss = ''
+    feats = [feat.text.replace('\n', '').strip()
+             for feat in temp_soup.select('div.property-features__content span.property-feature')]
+    return [ref, title, price, descr, conso, emiss, feats]
+
+
+def bs4_orpi(content):
+    soup = BeautifulSoup(content)
+    try:
+        ref = soup.select_one('span.u-text-xs').text
+    except AttributeError:
+        return None
+    prop_type = soup.select_one('span.u-text-xl').text.replace('\n', '').strip()
+    rooms, surface = soup.select_one('span.u-h3.u-color-primary').text.split(' • ')
+    city = soup.select_one('span.u-text-lg').text
+    price = soup.select_one('span.u-h1').text.replace('\xa0', '')
+    descr = soup.select_one('div.c-section__inner div.o-container p').text.replace('\n', '').strip()
+    feats = [span.text for span in soup.select('span.c-badge__text')]
+    try:
+        conso = soup.select_one('abbr.c-dpe__index.c-dpe__index--5').text
+    except AttributeError:
+        conso = ''
+    try:
+        emiss = soup.select_one('abbr.c-dpe__index.c-dpe__index--3').text
+    except AttributeError:
+        emiss = ''
+    return [ref, prop_type, rooms, surface, city, price, descr, feats, conso, emiss]
+
+
+def bs4_guy_hoquet(content):
+    soup = BeautifulSoup(content)
+    try:
+        prop_type = soup.select_one('h1.name.property-name').text
+        city = soup.select_one('div.add').text
+        price = soup.select_one('div.price').text.replace('\n', '').strip()
+        descr = soup.select_one('span.description-more').text.replace('\n', '').replace('Voir moins', '').strip()
+        feats = [tag.text for tag in soup.select('div.ttl')]
+        feats2 = [re.sub(r'\s+', ' ', re.sub(r'\n+', '', tag.text)).strip() for tag in soup.select('div.horaires-item')]
+        neighborhood = re.sub(r'\s+', ' ', re.sub(r'\n+', '', soup.select_one('div.quartier-info.mt-4').text)).strip()
+    except AttributeError:
+        return None
+    return [prop_type, city, price, descr, feats, feats2, neighborhood]
+
+
+BS4_PARSERS = {
+    'laforet': bs4_laforet,
+    'orpi': bs4_orpi,
+    'guy_hoquet': bs4_guy_hoquet,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-pages', type=int, default=500)
+    args = parser.parse_args()
+
+    print(f'{"site":<12} {"bs4 pages/s":>12} {"lxml pages/s":>13} {"speedup":>8}')
+    for site, render in AD_PAGES.items():
+        pages = [render(i).encode('utf-8') for i in range(args.n_pages)]
+        extractor = EXTRACTORS[site]
+
+        # both paths must return the same records
+        for content in pages[:20]:
+            assert list(extractor.extract(content).values()) == BS4_PARSERS[site](content), site
+
+        start = time.perf_counter()
+        for content in pages:
+            BS4_PARSERS[site](content)
+        bs4_rate = len(pages) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for content in pages:
+            extractor.extract(content)
+        lxml_rate = len(pages) / (time.perf_counter() - start)
+
+        print(f'{site:<12} {bs4_rate:>12.0f} {lxml_rate:>13.0f} {lxml_rate / bs4_rate:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
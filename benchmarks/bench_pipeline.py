@@ -0,0 +1,52 @@
+"""
+End-to-end benchmark of the fetch -> parse pipeline : ad pages of a synthetic fixture corpus are
+downloaded from a local server by the async fetchers and parsed by parse_pages with an increasing
+number of worker processes. Throughput should scale with the number of workers until parsing stops
+being the bottleneck (or the machine runs out of cores).
+
+Usage : python benchmarks/bench_pipeline.py [--n-pages 2000] [--workers 0 1 2 4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from fetcher import iter_pages
+from fixture_server import FixtureServer
+from parse_pool import parse_pages
+from synthetic_pages import AD_PAGES
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--site', default='laforet', choices=list(AD_PAGES))
+    parser.add_argument('--n-pages', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=.005)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--ordered', action='store_true')
+    args = parser.parse_args()
+
+    corpus = [AD_PAGES[args.site](i).encode('utf-8') for i in range(args.n_pages)]
+
+    with FixtureServer(lambda path: corpus[int(path.rsplit('/', 1)[-1])], latency=args.latency) as server:
+        urls = [server.url(f'/ad/{i}') for i in range(args.n_pages)]
+
+        print(f'{args.n_pages} {args.site} pages, {os.cpu_count()} CPUs, {"ordered" if args.ordered else "unordered"}')
+        print(f'{"workers":>8} {"seconds":>8} {"ads/sec":>8}')
+        for workers in args.workers:
+            executor = ProcessPoolExecutor(workers) if workers else None
+            start = time.perf_counter()
+            pages = iter_pages(urls, concurrency=args.concurrency)
+            n = sum(record is not None for _, record in parse_pages(args.site, pages, executor, args.ordered))
+            elapsed = time.perf_counter() - start
+            if executor is not None:
+                executor.shutdown()
+            print(f'{workers:>8} {elapsed:>8.2f} {n / elapsed:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
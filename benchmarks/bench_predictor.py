@@ -0,0 +1,147 @@
+"""
+Benchmark of the inference service (src/predictor.py) : latency and throughput of RentPredictor at
+batch sizes 1, 64 and 4096 versus model.predict fed as in modeling.ipynb (one pandas Series per
+input), and throughput of the MicroBatcher for single requests sent by concurrent clients.
+
+The trained model (output/rent_predictor.h5 and output/scaler.pkl) is used if it exists, otherwise
+a model with the architecture of modeling.ipynb and random weights.
+
+Usage : python benchmarks/bench_predictor.py [--n-ads 20000] [--model output/rent_predictor.h5]
+"""
+import argparse
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import RobustScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from predictor import CATCOLS, NUMCOLS, MicroBatcher, RentPredictor, load_model
+
+BATCH_SIZES = [1, 64, 4096]
+
+
+def build_model(seed=0):
+    """
+    Model with the architecture of modeling.ipynb (make_model) and random weights, batch normalization
+    layers included : their moving statistics, scales and offsets are random too (instead of the
+    identity they are initialized to), as after training.
+    """
+    from tensorflow.keras import layers
+    from tensorflow.keras.models import Model
+
+    inputs, outputs = [], []
+    for col, nunique in zip(CATCOLS, [5, 4, 2, 2]):
+        inp = layers.Input(shape=(1,), name=col)
+        h = layers.Embedding(nunique + 1, 32)(inp)
+        h = layers.SpatialDropout1D(.3)(h)
+        outputs.append(layers.Reshape(target_shape=(32,))(h))
+        inputs.append(inp)
+    num_input = layers.Input(shape=(len(NUMCOLS),), name='numcols')
+    inputs.append(num_input)
+    outputs.append(num_input)
+
+    h = layers.Concatenate()(outputs)
+    for units in [96, 48]:
+        h = layers.Dense(units, activation='relu')(h)
+        h = layers.BatchNormalization()(h)
+        h = layers.Dropout(.3)(h)
+    model = Model(inputs=inputs, outputs=layers.Dense(1, activation='linear')(h))
+
+    rng = np.random.default_rng(seed)
+    for layer in model.layers:
+        if isinstance(layer, layers.BatchNormalization):
+            n = layer.gamma.shape[0]
+            # gamma, beta, moving mean and moving variance
+            layer.set_weights([rng.uniform(.5, 2, n), rng.normal(0, .5, n), rng.normal(0, 1, n), rng.uniform(.1, 4, n)])
+    return model
+
+
+def random_ads(n):
+    rng = np.random.default_rng(0)
+    rooms = rng.integers(1, 8, n)
+    return pd.DataFrame({
+        'rooms': rooms,
+        'bedrooms': np.maximum(rooms - 1 - rng.integers(0, 2, n), 0),
+        'is_house': rng.integers(0, 2, n),
+        'furnished': rng.integers(0, 2, n),
+        'surface': rng.uniform(9, 200, n),
+        'lat': rng.uniform(48.1, 49.2, n),
+        'lon': rng.uniform(1.5, 3.5, n),
+    })
+
+
+def notebook_predict(model, scaler, ads):
+    """
+    Predictions fed as in modeling.ipynb : a pandas Series per categorical input and the numerical
+    features scaled by the fitted RobustScaler.
+    """
+    inputs = {col: ads[col] for col in CATCOLS}
+    inputs['rooms'] = inputs['rooms'].clip(upper=5) - 1
+    inputs['bedrooms'] = inputs['bedrooms'].clip(upper=3)
+    inputs['numcols'] = scaler.transform(ads[NUMCOLS].to_numpy())
+    return model.predict(inputs, verbose=0).reshape(-1)
+
+
+def run(name, predict, ads, batch_size):
+    latencies = []
+    start = time.perf_counter()
+    for i in range(0, len(ads), batch_size):
+        batch_start = time.perf_counter()
+        predict(ads.iloc[i:i + batch_size])
+        latencies.append(time.perf_counter() - batch_start)
+    elapsed = time.perf_counter() - start
+    print(f'{name:<16} batch {batch_size:>5}  p50 {np.median(latencies) * 1000:8.2f} ms  '
+          f'p99 {np.quantile(latencies, .99) * 1000:8.2f} ms  {len(ads) / elapsed:10,.0f} ads/s')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-ads', type=int, default=20000)
+    parser.add_argument('--model', default=os.path.join('output', 'rent_predictor.h5'))
+    parser.add_argument('--scaler', default=os.path.join('output', 'scaler.pkl'))
+    parser.add_argument('--clients', type=int, default=16)
+    args = parser.parse_args()
+
+    ads = random_ads(args.n_ads)
+    with tempfile.TemporaryDirectory() as folder:
+        if os.path.isfile(args.model) and os.path.isfile(args.scaler):
+            model, scaler_path = load_model(args.model), args.scaler
+            with open(scaler_path, 'rb') as f:
+                scaler = pickle.load(f)
+        else:
+            print('No trained model found, using random weights.')
+            model, scaler_path = build_model(), os.path.join(folder, 'scaler.pkl')
+            scaler = RobustScaler().fit(ads[NUMCOLS].to_numpy())
+            with open(scaler_path, 'wb') as f:
+                pickle.dump(scaler, f)
+        predictor = RentPredictor(scaler_path=scaler_path, model=model)
+
+    expected = notebook_predict(model, scaler, ads.iloc[:1000])
+    assert np.allclose(predictor.predict(ads.iloc[:1000]), expected, rtol=1e-4, atol=1e-2)
+
+    for batch_size in BATCH_SIZES:
+        # model.predict is too slow to go through every ad one by one
+        n = args.n_ads if batch_size > 1 else min(args.n_ads, 1000)
+        run('model.predict', lambda batch: notebook_predict(model, scaler, batch), ads.iloc[:n], batch_size)
+        run('RentPredictor', predictor.predict, ads.iloc[:n], batch_size)
+
+    requests = ads.to_dict('records')
+    batcher = MicroBatcher(predictor)
+    with ThreadPoolExecutor(args.clients) as clients:
+        start = time.perf_counter()
+        list(clients.map(batcher.predict, requests))
+        elapsed = time.perf_counter() - start
+    batcher.close()
+    print(f'MicroBatcher, {args.clients} clients : {len(requests) / elapsed:,.0f} requests/s, '
+          f'{len(requests) / batcher.n_batches:.1f} requests per micro-batch')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Benchmark of the département check of geocoded points (src/spatial.py) : point-in-polygon tests row by
+row versus the vectorized STRtree query, on random points around Ile-de-France. Also reports how many
+points the former bounding box let through although they were outside of their département.
+
+Usage : python benchmarks/bench_spatial.py [--n-points 200000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import Point
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from spatial import AdminAreas
+
+SHAPEFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'shapefiles')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-points', type=int, default=200000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    areas = AdminAreas(SHAPEFILES)
+    print(f'shapefiles loaded in {time.perf_counter() - start:.2f} s')
+
+    rng = np.random.default_rng(0)
+    lat = pd.Series(rng.uniform(48, 49.4, args.n_points))
+    lon = pd.Series(rng.uniform(1.3, 3.9, args.n_points))
+    dept = pd.Series(rng.choice(areas.departments.index, args.n_points))
+
+    start = time.perf_counter()
+    expected = np.array([areas.departments[d].contains(Point(x, y)) for y, x, d in zip(lat, lon, dept)])
+    elapsed = time.perf_counter() - start
+    print(f'row by row  {elapsed:6.2f} s  {args.n_points / elapsed:12,.0f} points/s')
+
+    start = time.perf_counter()
+    valid = areas.contains(lat, lon, dept)
+    elapsed = time.perf_counter() - start
+    print(f'vectorized  {elapsed:6.2f} s  {args.n_points / elapsed:12,.0f} points/s')
+
+    # only points exactly on a border may differ, contains excluding the boundary
+    print(f'{(valid != expected).sum():,} differences')
+    bounding_box = ((lat < 49.3) & (lat > 48) & (lon < 3.8)).to_numpy()
+    print(f'{(bounding_box & ~valid).sum():,} points kept by the bounding box but outside of their département')
+
+
+if __name__ == '__main__':
+    main()
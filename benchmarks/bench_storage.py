@@ -0,0 +1,93 @@
+"""
+Benchmark of the storage of the datasets (src/storage.py) : size on disk, load time and memory of the
+loaded DataFrame for the pipe-separated CSV files versus the partitioned Parquet datasets with compact
+dtypes, for full loads, column projections and filtered loads. Raw data is the synthetic corpus of
+synthetic_raw, clean data is random.
+
+Usage : python benchmarks/bench_storage.py [--n-rows 200000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from storage import RAW_DTYPES, compact, read_clean, read_raw, write_clean, write_raw
+from synthetic_raw import write_raw_corpus
+
+
+def folder_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, files in os.walk(path) for name in files)
+
+
+def clean_data(n_rows):
+    rng = np.random.default_rng(0)
+    depts = np.array([75001 + i for i in range(20)] + [77, 78, 91, 92, 93, 94, 95])
+    return pd.DataFrame({
+        'price': rng.integers(400, 5000, n_rows),
+        'is_house': rng.integers(0, 2, n_rows),
+        'surface': rng.uniform(9, 200, n_rows).round(1),
+        'rooms': rng.integers(1, 7, n_rows),
+        'bedrooms': rng.integers(0, 5, n_rows),
+        'furnished': rng.integers(0, 2, n_rows),
+        'dept': rng.choice(depts, n_rows),
+        'lat': rng.uniform(48.1, 49.2, n_rows),
+        'lon': rng.uniform(1.5, 3.5, n_rows),
+        'source': rng.choice(['laforet', 'orpi', 'guy_hoquet'], n_rows),
+    })
+
+
+def measure(name, load):
+    start = time.perf_counter()
+    df = load()
+    elapsed = time.perf_counter() - start
+    print(f'{name:<40} {elapsed:7.3f} s {df.memory_usage(deep=True).sum() / 2**20:9.1f} MiB {len(df):10,} rows')
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-rows', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        print('Raw data')
+        print('========')
+        paths = write_raw_corpus(os.path.join(folder, 'csv'), args.n_rows)
+        for source, path in paths.items():
+            partition = write_raw(pd.read_csv(path, sep='|', dtype=str), folder, source, '2020-10-27')
+            print(f'{source} : CSV {folder_size(path) / 2**20:.1f} MiB, Parquet {folder_size(partition) / 2**20:.1f} MiB')
+            csv = measure('  CSV', lambda: pd.read_csv(path, sep='|'))
+            parquet = measure('  Parquet', lambda: read_raw(folder, source))
+            pd.testing.assert_frame_equal(parquet.drop('date', axis=1),
+                                          compact(pd.read_csv(path, sep='|', dtype=str), RAW_DTYPES[source]),
+                                          check_categorical=False)
+            measure('  CSV, price & descr', lambda: pd.read_csv(path, sep='|', usecols=['price', 'descr']))
+            measure('  Parquet, price & descr', lambda: read_raw(folder, source, columns=['price', 'descr']))
+
+        print('\nClean data')
+        print('==========')
+        df = clean_data(args.n_rows)
+        path = os.path.join(folder, 'clean.csv')
+        df.to_csv(path, sep='|', index=False)
+        write_clean(df, folder, '2020-10-27')
+        print(f'CSV {folder_size(path) / 2**20:.1f} MiB, Parquet {folder_size(os.path.join(folder, "clean")) / 2**20:.1f} MiB')
+        measure('CSV', lambda: pd.read_csv(path, sep='|'))
+        measure('Parquet', lambda: read_clean(folder))
+        measure('CSV, price & surface', lambda: pd.read_csv(path, sep='|', usecols=['price', 'surface']))
+        measure('Parquet, price & surface', lambda: read_clean(folder, columns=['price', 'surface']))
+        csv = measure('CSV, Orpi ads in 75011', lambda: pd.read_csv(path, sep='|').query('source == "orpi" & dept == 75011'))
+        parquet = measure('Parquet, Orpi ads in 75011',
+                          lambda: read_clean(folder, filters=[('source', '=', 'orpi'), ('dept', '=', 75011)]))
+        assert len(csv) == len(parquet)
+
+
+if __name__ == '__main__':
+    main()
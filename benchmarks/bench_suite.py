@@ -0,0 +1,252 @@
+"""
+Reproducible benchmark suite of the scraping and cleaning pipelines, run offline on synthetic fixtures :
+
+- discovery : listing pages of Orpi and Guy Hoquet read by get_links_http (synthetic_pages listing
+  fixtures),
+- scrape_<site> : scraper.scrap_<site> run end to end (discovery -> fetch -> parse -> RecordWriter ->
+  raw Parquet partition) on a synthetic website (synthetic_pages.site_fixtures) of n_pages ad pages
+  served by FixtureServer with latency and transient errors,
+- clean : data_cleaner.clean on a synthetic raw corpus (synthetic_raw) of n_rows ads, geocoded by
+  the offline LandmarkGeocoder.
+
+Every scenario runs in its own Python process so that its peak RSS (VmHWM) is its own, under
+metrics.run so that its stage timings are recorded. One JSON line per scenario is appended to the
+results file, with the throughput (pages/s or rows/s), the peak RSS and the stage timings, and
+every result is compared with the previous result of the same scenario and parameters : a throughput
+drop or a peak RSS increase above the tolerance is reported as a regression.
+
+Usage : python benchmarks/bench_suite.py [--scale small|medium|large] [--scenarios clean scrape_orpi]
+        [--parse-workers 0] [--results benchmarks/results.jsonl] [--tolerance .1] [--fail-on-regression]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime as dt
+
+import pandas as pd
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARKS, '..', 'src'))
+
+import metrics
+
+SHAPEFILES = os.path.join(BENCHMARKS, '..', 'data', 'shapefiles')
+
+SCENARIOS = ['discovery', 'scrape_laforet', 'scrape_orpi', 'scrape_guy_hoquet', 'clean']
+
+# number of searches of every scraper : Laforet searches every département for furnished and unfurnished
+# properties, Orpi every département and Guy Hoquet the whole region at once
+N_SEARCHES = {'laforet': 16, 'orpi': 8, 'guy_hoquet': 1}
+
+# number of ad pages per site, listing pages per site and raw rows (all sources) of every scale
+SCALES = {
+    'small': {'n_pages': 500, 'n_listing_pages': 20, 'n_rows': 10000},
+    'medium': {'n_pages': 2000, 'n_listing_pages': 100, 'n_rows': 100000},
+    'large': {'n_pages': 10000, 'n_listing_pages': 400, 'n_rows': 1000000},
+}
+
+
+def get_peak_rss():
+    """Peak RSS of the current process, in MiB (VmHWM, Linux only, None elsewhere)."""
+    try:
+        with open('/proc/self/status') as f:
+            return int(re.search(r'VmHWM:\s+(\d+) kB', f.read()).group(1)) / 1024
+    except (OSError, AttributeError):
+        return None
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARKS, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def get_stages(path):
+    """Total seconds of the spans and timers of a metrics file, by name (and stage of data_cleaner.clean)."""
+    df = metrics.read_metrics(path)
+    df = df[df.type != 'counter']
+    names = [tags['stage'] if name == 'stage' else name for name, tags in zip(df.name, df.tags)]
+    return df.seconds.groupby(names, sort=False).sum().round(4).to_dict()
+
+
+def run_discovery(folder, params):
+    from fixture_server import FixtureServer
+    from scraper import get_links_http, guy_hoquet_has_next, orpi_has_next
+    from synthetic_pages import save_listing_fixtures
+
+    pages = save_listing_fixtures(os.path.join(folder, 'listings'), params['n_listing_pages'])
+    with FixtureServer(pages, latency=params['latency']) as server:
+        start = time.perf_counter()
+        for source, url, selector, has_next in [
+                ('orpi', '/orpi/listing?page={page}', 'a.u-link-unstyled.c-overlay__link', orpi_has_next),
+                ('guy_hoquet', '/guy-hoquet/biens/result?p={page}', 'a.property_link_block', guy_hoquet_has_next)]:
+            with metrics.span('discovery', source=source):
+                get_links_http(server.url(url), selector, has_next)
+        return server.n_requests, 'pages', time.perf_counter() - start
+
+
+def run_scrape(folder, params, site):
+    import scraper
+    from fixture_server import FixtureServer
+    from storage import read_raw
+    from synthetic_pages import site_fixtures
+
+    data_folder = os.path.join(folder, 'data')
+    pages = site_fixtures(site, params['n_pages'], N_SEARCHES[site])
+    with FixtureServer(pages, latency=params['latency'], error_rate=params['error_rate']) as server:
+        start = time.perf_counter()
+        # progress bars of the scrapers
+        with contextlib.redirect_stderr(io.StringIO()):
+            getattr(scraper, f'scrap_{site}')(data_folder, 'replace', concurrency=params['concurrency'],
+                                              rate_limit=None, parse_workers=params['parse_workers'],
+                                              base_url=server.url())
+        seconds = time.perf_counter() - start
+    n_records = len(read_raw(data_folder, site, columns=['descr']))
+    assert n_records == params['n_pages'], f'{n_records} records written out of {params["n_pages"]} ad pages'
+    return params['n_pages'], 'pages', seconds
+
+
+def run_clean(folder, params):
+    from data_cleaner import clean
+    from gazetteer import Gazetteer, normalize_station
+    from synthetic_pages import STATIONS
+    from synthetic_raw import LandmarkGeocoder, write_raw_corpus
+
+    shutil.copytree(SHAPEFILES, os.path.join(folder, 'shapefiles'))
+    stations = pd.DataFrame({'name': STATIONS, 'normalized': [normalize_station(name) for name in STATIONS],
+                             'lat': 48.86, 'lon': 2.37})
+    Gazetteer(stations).save(os.path.join(folder, 'metro_stations.json'))
+    paths = write_raw_corpus(os.path.join(folder, 'raw'), params['n_rows'] // 3)
+
+    start = time.perf_counter()
+    clean(paths['guy_hoquet'], paths['laforet'], paths['orpi'], data_folder=folder,
+          geocoder=LandmarkGeocoder(latency=params['latency']))
+    return params['n_rows'] // 3 * 3, 'rows', time.perf_counter() - start
+
+
+def run_scenario(scenario, params):
+    """
+    Runs a scenario in the current process (see main), the fixtures being created before the
+    measured work.
+
+    Returns
+    -------
+    dict, result of the scenario : number of items (pages or rows) processed, seconds, throughput,
+    peak RSS and stage timings (seconds of every span and timer recorded)
+
+    """
+    folder = tempfile.mkdtemp()
+    path = os.path.join(folder, 'metrics.jsonl')
+    try:
+        with metrics.run(path, run_id=scenario):
+            if scenario == 'discovery':
+                n, unit, seconds = run_discovery(folder, params)
+            elif scenario.startswith('scrape_'):
+                n, unit, seconds = run_scrape(folder, params, scenario[len('scrape_'):])
+            else:
+                n, unit, seconds = run_clean(folder, params)
+        stages = get_stages(path)
+    finally:
+        shutil.rmtree(folder)
+    return {'items': n, 'unit': unit, 'seconds': round(seconds, 4), 'throughput': round(n / seconds, 2),
+            'peak_rss_mb': get_peak_rss(), 'stages': stages}
+
+
+def read_results(path):
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_regressions(result, previous, tolerance):
+    """Regressions of result with respect to previous : throughput drop and peak RSS increase above tolerance."""
+    regressions = []
+    if result['throughput'] < previous['throughput'] * (1 - tolerance):
+        regressions.append(f'throughput {result["throughput"] / previous["throughput"] - 1:+.0%}')
+    if result['peak_rss_mb'] and previous['peak_rss_mb'] and \
+            result['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+        regressions.append(f'peak RSS {result["peak_rss_mb"] / previous["peak_rss_mb"] - 1:+.0%}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the benchmark suite and checks it for regressions.')
+    parser.add_argument('--scale', default='small', choices=list(SCALES))
+    parser.add_argument('--scenarios', nargs='+', default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument('--n-pages', type=int, default=None, help='ad pages per site, set by the scale if None')
+    parser.add_argument('--n-listing-pages', type=int, default=None, help='listing pages per site, set by the scale if None')
+    parser.add_argument('--n-rows', type=int, default=None, help='raw rows (all sources), set by the scale if None')
+    parser.add_argument('--latency', type=float, default=.005, help='latency of the server and the geocoder, in s')
+    parser.add_argument('--error-rate', type=float, default=.02, help='probability of a 503 for every request')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--parse-workers', type=int, default=0, help='processes of the parse pool of the scrapers, none if 0')
+    parser.add_argument('--results', default=os.path.join(BENCHMARKS, 'results.jsonl'), help='path of the results file')
+    parser.add_argument('--tolerance', type=float, default=.1, help='relative change reported as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 if anything regressed')
+    parser.add_argument('--child', nargs=2, help=argparse.SUPPRESS)  # scenario and output path, see run_scenario
+    args = parser.parse_args()
+
+    params = {**SCALES[args.scale], 'latency': args.latency, 'error_rate': args.error_rate,
+              'concurrency': args.concurrency, 'parse_workers': args.parse_workers}
+    params.update({key: getattr(args, key) for key in ['n_pages', 'n_listing_pages', 'n_rows']
+                   if getattr(args, key) is not None})
+
+    if args.child is not None:
+        scenario, output = args.child
+        result = run_scenario(scenario, params)
+        with open(output, 'w') as f:
+            json.dump(result, f)
+        return
+
+    history = read_results(args.results)
+    run = {'run': dt.now().isoformat(timespec='seconds'), 'commit': get_commit(), 'python': sys.version.split()[0],
+           'cpus': os.cpu_count()}
+    print(f'{"scenario":<18} {"items":>10} {"seconds":>8} {"per s":>10} {"peak MiB":>9}  {"vs previous":<12} regressions')
+    n_regressions = 0
+    for scenario in args.scenarios:
+        with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+            output = f.name
+        try:
+            command = [sys.executable, os.path.abspath(__file__), '--scale', args.scale, '--child', scenario, output]
+            command += [arg for key in ['n_pages', 'n_listing_pages', 'n_rows', 'latency', 'error_rate', 'concurrency']
+                        for arg in [f'--{key.replace("_", "-")}', str(params[key])]]
+            subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+            with open(output) as f:
+                result = {**run, 'scenario': scenario, 'params': params, **json.load(f)}
+        finally:
+            os.remove(output)
+
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(result) + '\n')
+
+        previous = next((r for r in reversed(history) if r['scenario'] == scenario and r['params'] == params), None)
+        change, regressions = '-', []
+        if previous is not None:
+            change = f'{result["throughput"] / previous["throughput"] - 1:+.1%}'
+            regressions = get_regressions(result, previous, args.tolerance)
+            n_regressions += bool(regressions)
+        print(f'{scenario:<18} {result["items"]:>10,} {result["seconds"]:>8.2f} '
+              f'{result["throughput"]:>10,.1f} {result["peak_rss_mb"] or 0:>9.0f}  {change:<12} '
+              f'{", ".join(regressions) or "-"}')
+
+    print('\nstages (s)')
+    print(pd.DataFrame({r['scenario']: r['stages'] for r in read_results(args.results)[-len(args.scenarios):]})
+          .to_string(na_rep='', float_format='{:,.2f}'.format))
+    print(f'\nresults appended to {args.results}')
+    if n_regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Benchmark of the cross-validated training (src/training.py) : time to prepare the inputs of a fold
+from the encoded dataset versus split_data and the input dicts of modeling.ipynb (pandas), and wall
+time of a few short folds trained in the current process versus by pools of 2 and 4 workers (only
+faster on machines with as many cores).
+
+Usage : python benchmarks/bench_training.py [--n-ads 20000] [--epochs 3] [--workers 1 2 4]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import RobustScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from bench_predictor import random_ads
+from predictor import CATCOLS
+from training import cross_validate, get_fold, init_worker, save_dataset
+
+DEPTS = [75001 + i for i in range(20)] + [77, 78, 91, 92, 93, 94, 95]
+
+
+def synthetic_dataset(n):
+    ads = random_ads(n)
+    rng = np.random.default_rng(1)
+    ads['dept'] = rng.choice(DEPTS, n)
+    ads['price'] = (ads.surface * rng.uniform(15, 35, n)).round().astype(int)
+    return ads
+
+
+def notebook_fold(df, random_state):
+    """split_data and the input dicts of fit_model in modeling.ipynb."""
+    X = df.drop(['price'], axis=1)
+    for col in CATCOLS:
+        X[col] = X[col].astype('category').cat.codes
+    y = df.filter(['price'], axis=1)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=.2, stratify=X.dept, random_state=random_state)
+    X_train, X_test = X_train.drop(['dept'], axis=1), X_test.drop(['dept'], axis=1)
+    numcols = X_train.drop(CATCOLS, axis=1).columns
+    scaler = RobustScaler()
+    X_train = pd.concat([pd.DataFrame(scaler.fit_transform(X_train.drop(CATCOLS, axis=1)), columns=numcols),
+                         X_train[CATCOLS].reset_index(drop=True)], axis=1)
+    X_test = pd.concat([pd.DataFrame(scaler.transform(X_test.drop(CATCOLS, axis=1)), columns=numcols),
+                        X_test[CATCOLS].reset_index(drop=True)], axis=1)
+    inputs_train = {col: X_train[col] for col in CATCOLS}
+    inputs_train['numcols'] = X_train.loc[:, numcols]
+    inputs_test = {col: X_test[col] for col in CATCOLS}
+    inputs_test['numcols'] = X_test.loc[:, numcols]
+    return inputs_train, y_train, inputs_test, y_test
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-ads', type=int, default=20000)
+    parser.add_argument('--n-folds', type=int, default=4)
+    parser.add_argument('--epochs', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+
+    df = synthetic_dataset(args.n_ads)
+    folder = tempfile.mkdtemp()
+    try:
+        print('Inputs of a fold')
+        print('================')
+        start = time.perf_counter()
+        for seed in range(10):
+            notebook_fold(df, seed)
+        print(f'modeling.ipynb     {(time.perf_counter() - start) / 10 * 1000:8.1f} ms')
+        start = time.perf_counter()
+        path = save_dataset(df, folder)
+        print(f'encoding (once)    {(time.perf_counter() - start) * 1000:8.1f} ms')
+        init_worker(path, threads=0)
+        start = time.perf_counter()
+        for seed in range(10):
+            get_fold(5, seed, 0)
+        print(f'encoded dataset    {(time.perf_counter() - start) / 10 * 1000:8.1f} ms')
+
+        print(f'\n{args.n_folds} folds of {args.epochs} epochs ({os.cpu_count()} CPUs)')
+        print('=' * 30)
+        start = time.perf_counter()
+        cross_validate(df, n_folds=args.n_folds, n_workers=0, threads=0, epochs=args.epochs, cache_folder=folder)
+        print(f'in process         {time.perf_counter() - start:8.1f} s')
+        for n_workers in args.workers:
+            start = time.perf_counter()
+            cross_validate(df, n_folds=args.n_folds, n_workers=n_workers, epochs=args.epochs, cache_folder=folder)
+            print(f'{n_workers} worker(s)        {time.perf_counter() - start:8.1f} s')
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Benchmark of the streaming record writer (src/record_writer.py) : peak Python memory (tracemalloc)
+while writing an increasing number of synthetic records should stay flat, whereas it grows
+linearly when every record is kept in a list until the end.
+
+Usage : python benchmarks/bench_writer.py [--n-records 1000 10000 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from record_writer import RecordWriter
+
+COLUMNS = ['ref', 'title', 'price', 'descr', 'conso', 'emiss', 'feats', 'dept', 'furnitures']
+
+
+def record(i):
+    return [f'REF{i}', 'Appartement Paris 11', '1 250€', 'Bel appartement lumineux rue Oberkampf. ' * 20,
+            '150', '20', '45 m²#2 pièces#1 chbre', 75, 'is_not_furnished']
+
+
+def in_memory(path, n):
+    data = [record(i) for i in range(n)]
+    pd.DataFrame(data, columns=COLUMNS).to_csv(path, sep='|', index=False)
+
+
+def streamed(path, n):
+    writer = RecordWriter(path, COLUMNS, replace_strategy='replace')
+    for i in range(n):
+        writer.write(f'/link/{i}', record(i))
+    writer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--n-records', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    args = parser.parse_args()
+
+    print(f'{"mode":<10} {"records":>8} {"seconds":>8} {"peak MB":>8}')
+    with tempfile.TemporaryDirectory() as folder:
+        for mode, function in [('in-memory', in_memory), ('streamed', streamed)]:
+            for n in args.n_records:
+                path = os.path.join(folder, f'{mode}_{n}.csv')
+                tracemalloc.start()
+                start = time.perf_counter()
+                function(path, n)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+                tracemalloc.stop()
+                print(f'{mode:<10} {n:>8,} {elapsed:>8.2f} {peak:>8.1f}')
+
+
+if __name__ == '__main__':
+    main()
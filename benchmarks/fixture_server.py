@@ -0,0 +1,86 @@
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FixtureServer:
+    """
+    Local HTTP server used by the benchmarks in place of the real websites. Every request waits
+    latency seconds before being answered so that fetching is bound by round-trip time, as it is
+    when scraping the live sites. Pages are sent with an ETag and conditional requests for unchanged
+    pages are answered with 304 Not Modified.
+
+    Parameters
+    ----------
+    pages: callable
+        function mapping a request path to the page body (bytes), or None for a 404
+    latency: float, default .05
+        delay in seconds added before answering each request
+    error_rate: float, default 0
+        probability of answering a request with a 503 instead of the page
+
+    Usage
+    -----
+    with FixtureServer(pages) as server:
+        url = server.url('/some/path')
+
+    """
+    def __init__(self, pages, latency=.05, error_rate=0):
+        self.pages = pages
+        self.latency = latency
+        self.error_rate = error_rate
+        self.n_requests = 0
+
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                fixture.n_requests += 1
+                time.sleep(fixture.latency)
+                if random.random() < fixture.error_rate:
+                    self.send_response(503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = fixture.pages(self.path)
+                if body is None:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path=''):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}{path}'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,201 @@
+"""
+Synthetic HTML pages mimicking the structure of the scraped websites (only the elements targeted
+by the selectors in src/scraper.py are reproduced), used as fixtures by the benchmarks.
+"""
+import os
+import random
+import re
+import threading
+
+FILLER = '<div class="c-section"><p>' + 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 40 + '</p></div>'
+
+
+def page(body):
+    return f'<!DOCTYPE html><html><head><title>fixture</title></head><body>{FILLER}{body}{FILLER}</body></html>'
+
+
+def orpi_listing_page(n, n_pages, per_page=24, links=None):
+    links = links or [f'/annonce-location-appartement-{n}-{i}/' for i in range(per_page)]
+    cards = ''.join(
+        f'<article><a class="u-link-unstyled c-overlay__link" href="{link}">Appartement</a></article>'
+        for link in links
+    )
+    pagination = ''.join(f'<a class="c-pagination__link" href="/orpi/listing?page={p}"><span>{p}</span></a>'
+                         for p in range(max(1, n - 2), n + 1))
+    if n < n_pages:
+        pagination += f'<a class="c-pagination__link" href="/orpi/listing?page={n + 1}"><span>Suivant</span></a>'
+    return page(f'<button class="c-btn c-btn--lg">Accepter</button><div class="c-results">{cards}</div>'
+                f'<nav>{pagination}</nav>')
+
+
+def guy_hoquet_listing_page(n, n_pages, per_page=12, links=None):
+    links = links or [f'/biens/location-appartement-{n}-{i}' for i in range(per_page)]
+    cards = ''.join(
+        f'<div class="property"><a class="property_link_block" href="{link}">Appartement</a></div>'
+        for link in links
+    )
+    pagination = ''
+    if n < n_pages:
+        pagination = f'<ul><li class="page-item next"><a href="/guy-hoquet/biens/result?p={n + 1}">&gt;</a></li></ul>'
+    return page(f'<div id="accept-all-cookies">Accepter</div><div class="results">{cards}</div>{pagination}')
+
+
+def laforet_search_page(links):
+    cards = ''.join(f'<div class="property-card"><a class="property-card__link" href="{link}">Appartement</a></div>'
+                    for link in links)
+    return page(f'<div class="properties">{cards}</div>')
+
+
+def save_listing_fixtures(folder, n_pages=50):
+    """
+    Writes n_pages listing pages for Orpi and Guy Hoquet in folder and returns a function mapping
+    request paths to the content of the matching fixture, to be served by FixtureServer.
+    """
+    for site, render in [('orpi', orpi_listing_page), ('guy_hoquet', guy_hoquet_listing_page)]:
+        os.makedirs(os.path.join(folder, site), exist_ok=True)
+        for n in range(1, n_pages + 1):
+            with open(os.path.join(folder, site, f'listing_{n}.html'), 'w', encoding='utf-8') as f:
+                f.write(render(n, n_pages))
+
+    def pages(path):
+        if path.startswith('/orpi/listing'):
+            site, n = 'orpi', path.split('page=')[-1].split('&')[0]
+        elif path.startswith('/guy-hoquet/biens/result'):
+            site, n = 'guy_hoquet', path.split('p=')[-1].split('&')[0]
+        else:
+            return None
+        try:
+            with open(os.path.join(folder, site, f'listing_{n or 1}.html'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    return pages
+
+
+STREETS = ['rue Oberkampf', 'avenue de la République', 'boulevard Voltaire', 'place des Vosges', 'quai de Jemmapes',
+           'rue de la Roquette', 'avenue Jean Jaurès', 'rue du Faubourg Saint-Antoine', 'rue Lecourbe']
+CITIES = [('Paris', '75011'), ('Paris', '75015'), ('Montreuil', '93100'), ('Vincennes', '94300'),
+          ('Boulogne-Billancourt', '92100'), ('Versailles', '78000'), ('Melun', '77000'), ('Évry', '91000'),
+          ('Cergy', '95000')]
+STATIONS = ['Parmentier', 'République', 'Nation', 'Bastille', 'Convention', 'Vaugirard']
+
+
+def ad_values(i):
+    """Deterministic pseudo-random values of the i-th synthetic ad."""
+    rng = random.Random(i)
+    city, postcode = rng.choice(CITIES)
+    rooms = rng.randint(1, 6)
+    surface = rng.randint(9, 30) + 18 * rooms
+    return {
+        'i': i,
+        'city': city,
+        'postcode': postcode,
+        'rooms': rooms,
+        'bedrooms': max(0, rooms - 1),
+        'surface': surface,
+        'price': int(surface * rng.uniform(18, 38)),
+        'is_house': rng.random() < .15,
+        'furnished': rng.random() < .3,
+        'descr': (f'Au coeur du quartier, {rng.choice(STREETS)}, bel appartement lumineux de {surface} m² '
+                  f'comprenant {rooms} pièces, proche métro {rng.choice(STATIONS)}. ' + 'Cuisine équipée, parquet. ' * 8),
+        'conso': rng.randint(50, 400),
+        'emiss': rng.randint(5, 90),
+    }
+
+
+def laforet_ad_page(i):
+    v = ad_values(i)
+    prop_type = 'Maison' if v['is_house'] else 'Appartement'
+    city = f'{v["city"].upper()} {v["postcode"][-2:]}' if v['city'] == 'Paris' else v['city']
+    feats = [f'{v["surface"]} m²', f'{v["rooms"]} pièces'] + ([f'{v["bedrooms"]} chbre'] if v['bedrooms'] else [])
+    feats_html = ''.join(f'<span class="property-feature">\n  {feat}\n</span>' for feat in feats)
+    return page(
+        f'<div class="property__title"><h1>{prop_type} {city}</h1><span> Réf : LAF{i:07d} </span></div>'
+        + f'<div class="property__price">\n{v["price"]:,}\u202f€\xa0/mois\n</div>'.replace(',', '\u202f') +
+        f'<div class="property-content__description mb-4">\n  {v["descr"]}\n  \n  Honoraires : 10 €/m²\n</div>'
+        f'<div class="row"><div class="mb-4 col"><span class="indicator__value">\n{v["conso"]}\n</span></div>'
+        f'<div class="mb-4 col"><span class="indicator__value">\n{v["emiss"]}\n</span></div></div>'
+        f'<div class="property-features__content">{feats_html}</div>'
+        '<footer><div class="mb-4 col">Newsletter</div></footer>'
+    )
+
+
+def orpi_ad_page(i):
+    v = ad_values(i)
+    prop_type = 'Maison' if v['is_house'] else 'Appartement'
+    city = f'Paris {int(v["postcode"][-2:])}' if v['city'] == 'Paris' else v['city']
+    badges = [f'{v["bedrooms"]} chambres'] + (['Meublé'] if v['furnished'] else []) + ['Ascenseur']
+    return page(
+        f'<span class="u-text-xl">\n  {prop_type}\n</span><span class="u-text-lg">{city}</span>'
+        f'<span class="u-h3 u-color-primary">{v["rooms"]} pièces • {v["surface"]},5 m²</span>'
+        f'<span class="u-h1">{v["price"]}\xa0€</span><span class="u-text-xs">Réf. ORP{i:07d}</span>'
+        f'<div class="c-section__inner"><div class="o-container"><p>\n{v["descr"]}\n</p></div></div>'
+        + ''.join(f'<span class="c-badge"><span class="c-badge__text">{b}</span></span>' for b in badges) +
+        f'<abbr class="c-dpe__index c-dpe__index--5">{"ABCDEFG"[v["conso"] // 60]}</abbr>'
+        f'<abbr class="c-dpe__index c-dpe__index--3">{"ABCDEFG"[v["emiss"] // 15]}</abbr>'
+        '<footer><span class="u-text-xs">© Orpi</span></footer>'
+    )
+
+
+def guy_hoquet_ad_page(i):
+    v = ad_values(i)
+    prop_type = 'Maison' if v['is_house'] else 'Appartement'
+    feats = [f'{v["surface"]} m²', f'{v["rooms"]} pièce(s)', f'{v["bedrooms"]} chambre(s)', '1 salle(s) de bain']
+    feats2 = ['Type de chauffage\n  Individuel', f'Meublé\n  {"Oui" if v["furnished"] else "Non"}', 'Étage\n  2']
+    return page(
+        f'<h1 class="name property-name">{prop_type} {v["rooms"]} pièces</h1>'
+        f'<div class="add">{v["postcode"]} {v["city"]}</div><div class="price">\n{v["price"]:,} € CC\n</div>'.replace(',', ' ')
+        + f'<span class="description-more">\n{v["descr"]}\nVoir moins</span>'
+        + ''.join(f'<div class="ttl">{feat}</div>' for feat in feats)
+        + ''.join(f'<div class="horaires-item">\n\n  {feat}\n</div>' for feat in feats2)
+        + '<div class="quartier-info mt-4">\n  Quartier   animé\n\n  et commerçant\n</div>'
+        '<footer><div class="price">Newsletter</div></footer>'
+    )
+
+
+AD_PAGES = {
+    'laforet': laforet_ad_page,
+    'orpi': orpi_ad_page,
+    'guy_hoquet': guy_hoquet_ad_page,
+}
+
+# paths of the search (or listing) pages of every site, as requested by scraper.scrap_<site>, and number of
+# ads per listing page (a single search page for Laforet)
+SEARCH_PATHS = {'laforet': '/louer/rechercher', 'orpi': '/recherche/rent', 'guy_hoquet': '/biens/result'}
+PER_PAGE = {'laforet': None, 'orpi': 24, 'guy_hoquet': 12}
+
+
+def site_fixtures(site, n_ads, n_searches):
+    """
+    Function mapping request paths to the pages of a synthetic website as browsed by scraper.scrap_<site>
+    (base_url being the URL of FixtureServer) : its search or listing pages, linking to n_ads ad pages
+    (/ad/<i>) split between n_searches searches, and the ad pages. Searches are told apart by their
+    query string (without the page number), and get their share of the ads in the order they are
+    first requested.
+    """
+    searches = {}
+    lock = threading.Lock()
+
+    def pages(path):
+        if path.startswith('/ad/'):
+            i = int(path[len('/ad/'):])
+            return AD_PAGES[site](i).encode('utf-8') if i < n_ads else None
+        if not path.startswith(SEARCH_PATHS[site]):
+            return None
+
+        match = re.search(r'[?&](?:p|page)=(\d*)', path)
+        n = int(match.group(1) or 1) if match is not None else 1
+        with lock:
+            search = searches.setdefault(re.sub(r'([?&])(?:p|page)=\d*', r'\1', path), len(searches))
+        links = [f'/ad/{i}' for i in range(search % n_searches, n_ads, n_searches)]
+        if site == 'laforet':
+            return laforet_search_page(links).encode('utf-8')
+
+        per_page = PER_PAGE[site]
+        n_pages = max(-(-len(links) // per_page), 1)
+        links = links[(n - 1) * per_page:n * per_page]
+        render = orpi_listing_page if site == 'orpi' else guy_hoquet_listing_page
+        return render(n, n_pages, per_page, links).encode('utf-8') if links else None
+
+    return pages
@@ -0,0 +1,156 @@
+"""
+Synthetic raw data files, in the format written by the scrapers (src/scraper.py) for the ads of
+synthetic_pages, used as fixtures by the data cleaning benchmarks. Records are built directly
+instead of parsing the synthetic pages, so that large corpora are generated quickly ; check_records
+verifies that both ways give the same records.
+"""
+import os
+import random
+import re
+import time
+
+import pandas as pd
+
+from synthetic_pages import ad_values
+
+COLUMNS = {
+    'laforet': ['ref', 'title', 'price', 'descr', 'conso', 'emiss', 'feats', 'dept', 'furnitures'],
+    'orpi': ['ref', 'prop_type', 'city', 'dept', 'rooms', 'surface', 'price', 'descr', 'conso', 'emiss', 'feats'],
+    'guy_hoquet': ['prop_type', 'city', 'price', 'descr', 'feats', 'feats2', 'neighborhood'],
+}
+
+
+def laforet_record(i):
+    v = ad_values(i)
+    prop_type = 'Maison' if v['is_house'] else 'Appartement'
+    city = f'{v["city"].upper()} {v["postcode"][-2:]}' if v['city'] == 'Paris' else v['city']
+    feats = [f'{v["surface"]} m²', f'{v["rooms"]} pièces'] + ([f'{v["bedrooms"]} chbre'] if v['bedrooms'] else [])
+    return {
+        'ref': f'Réf : LAF{i:07d}',
+        'title': f'{prop_type} {city}',
+        'price': f'{v["price"]}€/mois',
+        'descr': f'{v["descr"].strip()} Honoraires : 10 €/m²',
+        'conso': str(v['conso']),
+        'emiss': str(v['emiss']),
+        'feats': feats,
+    }
+
+
+def orpi_record(i):
+    v = ad_values(i)
+    city = f'Paris {int(v["postcode"][-2:])}' if v['city'] == 'Paris' else v['city']
+    return {
+        'ref': f'Réf. ORP{i:07d}',
+        'prop_type': 'Maison' if v['is_house'] else 'Appartement',
+        'rooms': f'{v["rooms"]} pièces',
+        'surface': f'{v["surface"]},5 m²',
+        'city': city,
+        'price': f'{v["price"]}€',
+        'descr': v['descr'].strip(),
+        'feats': [f'{v["bedrooms"]} chambres'] + (['Meublé'] if v['furnished'] else []) + ['Ascenseur'],
+        'conso': 'ABCDEFG'[v['conso'] // 60],
+        'emiss': 'ABCDEFG'[v['emiss'] // 15],
+    }
+
+
+def guy_hoquet_record(i):
+    v = ad_values(i)
+    return {
+        'prop_type': f'{"Maison" if v["is_house"] else "Appartement"} {v["rooms"]} pièces',
+        'city': f'{v["postcode"]} {v["city"]}',
+        'price': f'{v["price"]:,} € CC'.replace(',', ' '),
+        'descr': v['descr'].strip(),
+        'feats': [f'{v["surface"]} m²', f'{v["rooms"]} pièce(s)', f'{v["bedrooms"]} chambre(s)', '1 salle(s) de bain'],
+        'feats2': ['Type de chauffage Individuel', f'Meublé {"Oui" if v["furnished"] else "Non"}', 'Étage 2'],
+        'neighborhood': 'Quartier animé et commerçant',
+    }
+
+
+RECORDS = {
+    'laforet': laforet_record,
+    'orpi': orpi_record,
+    'guy_hoquet': guy_hoquet_record,
+}
+
+
+def scraped_record(source, i, legacy=False):
+    """
+    Record of the i-th ad as written by the scraper of source, which adds a few fields to the parsed
+    ones and joins list fields with '#' (written as Python list literals by older scrapers if legacy).
+    """
+    record = RECORDS[source](i)
+    v = ad_values(i)
+    for field in ['feats', 'feats2']:
+        if field in record and (source == 'laforet' or not legacy):
+            record[field] = '#'.join(record[field])
+    if source == 'laforet':
+        record['dept'] = int(v['postcode'][:2])
+        record['furnitures'] = 'is_furnished' if v['furnished'] else 'is_not_furnished'
+    elif source == 'orpi':
+        record['dept'] = int(v['postcode'][:2])
+    return [record[col] for col in COLUMNS[source]]
+
+
+def write_raw_corpus(folder, n_rows, start=0, sources=tuple(RECORDS), legacy=False, chunk_size=50000):
+    """
+    Writes n_rows synthetic ads (numbered from start) per source in folder, as the scrapers would
+    (as older scrapers would if legacy, see scraped_record).
+
+    Returns
+    -------
+    dict of source -> path of the data file
+
+    """
+    os.makedirs(folder, exist_ok=True)
+    paths = {}
+    for source in sources:
+        paths[source] = os.path.join(folder, f'{source}.csv')
+        with open(paths[source], 'w', encoding='utf-8', newline='') as f:
+            pd.DataFrame(columns=COLUMNS[source]).to_csv(f, sep='|', index=False)
+            for chunk in range(start, start + n_rows, chunk_size):
+                end = min(chunk + chunk_size, start + n_rows)
+                rows = [scraped_record(source, i, legacy) for i in range(chunk, end)]
+                pd.DataFrame(rows, columns=COLUMNS[source]).to_csv(f, sep='|', index=False, header=False)
+    return paths
+
+
+def check_records(n=100):
+    """Checks that the records built directly are the ones the extractors get from the synthetic pages."""
+    from extractors import EXTRACTORS
+    from synthetic_pages import AD_PAGES
+
+    for source, render in AD_PAGES.items():
+        for i in range(n):
+            expected = EXTRACTORS[source].extract(render(i).encode('utf-8'))
+            assert RECORDS[source](i) == expected, (source, i, RECORDS[source](i), expected)
+
+
+class LandmarkGeocoder:
+    """
+    Offline stand-in for the BAN geocoder : addresses are located a few hundred meters away from the
+    landmark (see spatial.py) of their arrondissement or département, after latency seconds per request.
+    """
+    def __init__(self, latency=0):
+        from address import DEPARTMENTS
+        from spatial import ARRONDISSEMENT_LANDMARKS, DEPARTMENT_LANDMARKS
+
+        self.latency = latency
+        self.landmarks = dict(ARRONDISSEMENT_LANDMARKS)
+        self.names = {name.lower(): DEPARTMENT_LANDMARKS[dept] for dept, name in DEPARTMENTS.items() if name}
+        self.n_requests = 0
+
+    def locate(self, address):
+        postcode = re.search(r'\b(750\d\d)\b', address)
+        if postcode is not None:
+            lon, lat = self.landmarks.get(int(postcode.group(1)), (None, None))
+        else:
+            lon, lat = next((coords for name, coords in self.names.items() if name in address), (None, None))
+        if lat is None:
+            return None, None
+        rng = random.Random(address)
+        return lat + rng.uniform(-.003, .003), lon + rng.uniform(-.004, .004)
+
+    def geocode_batch(self, addresses):
+        self.n_requests += 1
+        time.sleep(self.latency)
+        return {address: self.locate(address) for address in addresses}
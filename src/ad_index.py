@@ -0,0 +1,92 @@
+import os
+import sqlite3
+from datetime import datetime as dt
+
+
+class AdIndex:
+    """
+    Persistent index of the property ads scraped in previous runs, used to only fetch the ads that
+    appeared since the last run.
+
+    Ads are identified by their reference (the ref field) or by their URL for websites that don't
+    display any reference, and are stored with the dates they were first and last seen in the
+    listing pages. Ads that disappear from the listing pages are tombstoned (removed_at is set).
+
+    Changes are only committed by commit, called by the RecordWriter of the scraper whenever it
+    commits a chunk of records, and by tombstone : an ad is never in the index without being in a
+    committed chunk of the data, and the uncommitted changes of a crashed run are discarded.
+
+    Parameters
+    ----------
+    path: str
+        path of the sqlite file holding the index, created when needed
+
+    """
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS ads ('
+            'source TEXT, key TEXT, url TEXT, first_seen TEXT, last_seen TEXT, removed_at TEXT, '
+            'PRIMARY KEY (source, key))'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS ads_url ON ads (source, url)')
+        self.db.commit()
+        self.now = dt.now().isoformat(timespec='seconds')
+
+    def diff(self, source, urls):
+        """
+        Splits the URLs found in the listing pages into new and already known ads. Known ads have their
+        last_seen date updated (and are resurrected if they had been tombstoned).
+
+        Returns
+        -------
+        list of the URLs of ads which aren't in the index yet, in the order of urls
+
+        """
+        urls = list(dict.fromkeys(urls))
+        known = set()
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            known.update(url for url, in self.db.execute(
+                f'SELECT url FROM ads WHERE source = ? AND url IN ({",".join("?" * len(chunk))})', [source] + chunk
+            ))
+        self.db.executemany('UPDATE ads SET last_seen = ?, removed_at = NULL WHERE source = ? AND url = ?',
+                            [(self.now, source, url) for url in known])
+        return [url for url in urls if url not in known]
+
+    def add(self, source, key, url):
+        """Records a newly scraped ad, key being its reference or its URL when it has none."""
+        self.db.execute(
+            'INSERT INTO ads VALUES (?, ?, ?, ?, ?, NULL) ON CONFLICT (source, key) '
+            'DO UPDATE SET url = excluded.url, last_seen = excluded.last_seen, removed_at = NULL',
+            (source, key, url, self.now, self.now)
+        )
+
+    def tombstone(self, source):
+        """
+        Marks as removed the ads of source that weren't seen during this run (diff must have been
+        called with every URL of the listing pages beforehand).
+
+        Returns
+        -------
+        list of (key, url, first_seen, last_seen) of the ads removed since the previous run
+
+        """
+        removed = self.db.execute(
+            'SELECT key, url, first_seen, last_seen FROM ads WHERE source = ? AND last_seen < ? AND removed_at IS NULL',
+            (source, self.now)
+        ).fetchall()
+        self.db.execute('UPDATE ads SET removed_at = ? WHERE source = ? AND last_seen < ? AND removed_at IS NULL',
+                        (self.now, source, self.now))
+        self.db.commit()
+        return removed
+
+    def commit(self):
+        self.db.commit()
+
+    def close(self):
+        """Closes the index, discarding the changes that weren't committed."""
+        self.db.close()
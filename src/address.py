@@ -0,0 +1,185 @@
+import re
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+DEPARTMENTS = {
+    75: '',
+    77: 'SEINE-ET-MARNE',
+    78: 'YVELINES',
+    91: 'ESSONNE',
+    92: 'HAUTS-DE-SEINE',
+    93: 'SEINE-SAINT-DENIS',
+    94: 'VAL-DE-MARNE',
+    95: 'VAL D\'OISE'
+}
+
+SAINT_PATTERN = re.compile(r'(sainte?)\-(\w+)', flags=re.IGNORECASE)
+
+SEARCH_PATTERN = re.compile(r'((?:rue(?!(?: tres)? calme| commercante| pavillonnaire| pietonne| sans passage'
+                            r'| tres re| a deux pas| au pied de)'
+                            r'|place(?! de? parking| (?:de )?statio| dans | de moto| pour y| les dispo| perdue'
+                            r'|et de l\'ecole| privative| a moins de)'
+                            r'|avenue(?! bordee de maisons| principale)'
+                            r'|boulevard(?! peripherique)|quai(?! de seine))\s+[a-z\s\']+)', flags=re.IGNORECASE)
+
+SPLIT_PATTERN = re.compile(r' a (?:montreuil|vincennes|suresnes|asnieres sur seine|neuilly|noisy le sec|'
+                           r'ablon sur seine|etampes)|'
+                           r'(?:au)?(?: pied du)? metro| qui se | a$|'
+                           r' a proximite| (?:un )?studio| proche| agreable| ideal(?:ement)?(?: coloc)?|'
+                           r' deux pieces| au$| anime le quartier| et | et$|'
+                           r'(?<!de) paris$| appartement| dans | location| au sein | situe |'
+                           r' en plein| centre levallois|place a deux minutes de la gare  ligne  reseau  est '
+                           )
+
+NON_ASCII = re.compile(r'[^\x00-\x7f]')
+
+END = ''
+
+
+class StationMatcher:
+    """
+    Finds the first metro station name quoted in a text, with the same result as
+    re.search('(NAME_1|NAME_2|...)', text, flags=re.IGNORECASE) : the match starting the leftmost in
+    the text and, among the names matching at that position, the first one of names.
+
+    Station names are stored in a trie. The leftmost position is found by a single regex compiled
+    from the trie (the alternation being factorized on common prefixes, there is no need to try every
+    name at every position), then the trie is walked from that position to pick the matching name.
+
+    Parameters
+    ----------
+    names: list of str
+        station names, matched literally and case-insensitively
+
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.trie = {}
+        for rank, name in enumerate(self.names):
+            node = self.trie
+            for char in name.lower():
+                node = node.setdefault(char, {})
+            node.setdefault(END, rank)
+        self.scanner = re.compile(self._trie_regex(self.trie), flags=re.IGNORECASE)
+
+    @classmethod
+    def _trie_regex(cls, node):
+        # only the start of the match matters : names extending a shorter name are left out
+        if END in node:
+            return ''
+        alternatives = [re.escape(char) + cls._trie_regex(child) for char, child in node.items()]
+        if not alternatives:
+            return '(?!)' # no station at all
+        return alternatives[0] if len(alternatives) == 1 else f'(?:{"|".join(alternatives)})'
+
+    def search(self, text):
+        """Returns the station name found in text, as written in text, or None."""
+        match = self.scanner.search(text)
+        if match is None:
+            return None
+        start = match.start()
+        node = self.trie
+        best, end = node.get(END), start
+        for position in range(start, len(text)):
+            node = node.get(text[position].lower())
+            if node is None:
+                break
+            rank = node.get(END)
+            if rank is not None and (best is None or rank < best):
+                best, end = rank, position + 1
+        return text[start:end]
+
+
+def transliterate(text):
+    """
+    Same as text.map(unidecode), unidecode working character by character : each distinct non-ASCII
+    character of the Series is transliterated only once, then substituted wherever it appears.
+    """
+    table = {char: unidecode(char) for char in set(''.join(text)) if not char.isascii()}
+    if not table:
+        return text
+    return text.str.replace(NON_ASCII, lambda match: table[match.group()], regex=True)
+
+
+def format_depts(dept):
+    """Department part of the addresses : name of the department, or the department itself if unknown."""
+    return pd.Series([f'{DEPARTMENTS.get(d, d)}' for d in dept], index=dept.index)
+
+
+def get_addresses_from_descr(descr, city, dept, stations=None):
+    """
+    Extracts addresses (street names, or metro stations for ads in Paris) from the descriptions of ads.
+
+    Parameters
+    ----------
+    descr: pandas.Series
+        descriptions of the ads
+    city: pandas.Series
+        upper case cities of the ads ('PARIS <arrondissement>' for Paris)
+    dept: pandas.Series
+        departments of the ads (postcodes for Paris)
+    stations: StationMatcher or None, default None
+        metro stations searched in the descriptions of ads in Paris without any street name
+
+    Returns
+    -------
+    pandas.Series of lower case addresses, NaN when no address was found, indexed like descr
+
+    """
+    is_paris = city.str.upper().str.startswith('PARIS').to_numpy()
+    depts = format_depts(dept)
+
+    text = transliterate(descr).str.replace(SAINT_PATTERN, r'\1 \2', regex=True)
+    street = text.str.extract(SEARCH_PATTERN)[0].str.strip().str.lower()
+    street = street.str.split(SPLIT_PATTERN, n=1, regex=True).str[0]
+    found = street.notna().to_numpy()
+
+    address = np.full(len(descr), np.nan, dtype=object)
+    street_city = pd.Series(np.where(is_paris, 'PARIS', city), index=city.index)
+    address[found] = (street + ' ' + street_city + ' ' + depts + ' France').str.lower().to_numpy()[found]
+
+    metro = ~found & is_paris
+    if stations is not None and metro.any():
+        station = descr[metro].map(stations.search)
+        metro_city = city[metro].where(~city[metro].str.startswith('PARIS'), 'PARIS')
+        metro_address = ('metro ' + station + ' ' + metro_city + ' ' + depts[metro] + ' France').str.lower()
+        address[metro] = metro_address.to_numpy()
+
+    return pd.Series(address, index=descr.index, dtype=object)
+
+
+def get_addresses_from_city_and_dept(city, dept):
+    """
+    Fallback addresses built from the city and department of ads : the arrondissement for Paris,
+    the city and department elsewhere.
+
+    Returns
+    -------
+    pandas.Series of lower case addresses, indexed like city
+
+    """
+    is_paris = city.str.upper().str.startswith('PARIS').to_numpy()
+
+    address = (city + ' ' + format_depts(dept) + ' France').str.lower().to_numpy(dtype=object)
+    if is_paris.any():
+        arrn = city[is_paris].str.split().str[1].str.replace(r'0(\d)', r'\1', regex=True)
+        arrn = (arrn + 'e').where(arrn != '1', '1er')
+        address[is_paris] = ('paris ' + arrn + ' arrondissement france').to_numpy()
+
+    return pd.Series(address, index=city.index, dtype=object)
+
+
+def get_addresses(descr, city, dept, stations=None):
+    """
+    Addresses of ads : extracted from their description when possible (see get_addresses_from_descr),
+    built from their city and department otherwise (see get_addresses_from_city_and_dept).
+    """
+    address = get_addresses_from_descr(descr, city, dept, stations)
+    missing = address.isna().to_numpy()
+    if missing.any():
+        values = address.to_numpy(copy=True)
+        values[missing] = get_addresses_from_city_and_dept(city[missing], dept[missing]).to_numpy()
+        address = pd.Series(values, index=descr.index, dtype=object)
+    return address
@@ -0,0 +1,192 @@
+"""
+Geospatial summaries of the ads for the maps of dataviz.ipynb : statistics of the ads of every
+département of Ile-de-France, arrondissement of Paris and cell of a regular grid, as GeoDataFrames
+plotted as choropleths instead of one point per ad.
+
+Ads are located with a single vectorized spatial join against the shapefiles (see
+spatial.AdminAreas.locate), and the summaries are cached on disk, keyed by the version of the dataset.
+
+Usage : python src/aggregation.py data/locations_2020_10_clean.csv --cell-size 1
+"""
+import argparse
+import os
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+import spatial
+from neighbourhood import dataset_version
+from spatial import load_areas
+from stages import Pipeline, file_digest
+
+# statistics of every area
+STATISTICS = ['count', 'price', 'price_m2', 'surface_q25', 'surface', 'surface_q75']
+
+# length of a degree of latitude, in km
+KM_PER_DEGREE = 111.32
+
+DEPARTMENT_NAMES = {
+    75: 'Paris',
+    77: 'Seine-et-Marne',
+    78: 'Yvelines',
+    91: 'Essonne',
+    92: 'Hauts-de-Seine',
+    93: 'Seine-Saint-Denis',
+    94: 'Val-de-Marne',
+    95: 'Val-d\'Oise',
+}
+
+
+def get_arrondissement_names(codes):
+    """Names of arrondissements (e.g. 75011 -> '11e arr.'), as in dataviz.ipynb."""
+    return [f'{code - 75000}{"er" if code == 75001 else "e"} arr.' for code in codes]
+
+
+def aggregate(df, by):
+    """
+    Statistics of the ads of df grouped by by (vectorized) : number of ads, median monthly rent,
+    median rent per m² and quartiles of the surface.
+    """
+    groups = df.assign(price_m2=df.price / df.surface).groupby(by)
+    surface = groups.surface.quantile([.25, .5, .75]).unstack()
+    return pd.DataFrame({
+        'count': groups.size(),
+        'price': groups.price.median(),
+        'price_m2': groups.price_m2.median(),
+        'surface_q25': surface[.25],
+        'surface': surface[.5],
+        'surface_q75': surface[.75],
+    })
+
+
+def get_grid_cells(lat, lon, cell_size):
+    """
+    Cells of a regular grid of cells of about cell_size km × cell_size km (at the latitude of Paris)
+    containing points.
+
+    Returns
+    -------
+    tuple (row, col) of numpy.ndarray of int, indices of the cells, and tuple (lat step, lon step) in degrees
+
+    """
+    lat_step = cell_size / KM_PER_DEGREE
+    lon_step = cell_size / (KM_PER_DEGREE * np.cos(np.radians(48.8566)))
+    rows = np.floor(np.asarray(lat, dtype=float) / lat_step).astype(int)
+    cols = np.floor(np.asarray(lon, dtype=float) / lon_step).astype(int)
+    return (rows, cols), (lat_step, lon_step)
+
+
+def summarize(df, shapefiles=os.path.join('data', 'shapefiles'), cell_size=1.):
+    """
+    Statistics of the ads (see aggregate) of every département, arrondissement and grid cell.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        clean dataset, with price, surface, lat and lon columns
+    shapefiles: str, default 'data/shapefiles'
+        folder of the shapefiles of the départements and arrondissements
+    cell_size: float, default 1
+        size of the grid cells, in km
+
+    Returns
+    -------
+    dict of level ('departments', 'arrondissements' or 'grid') -> geopandas.GeoDataFrame with the
+    statistics of STATISTICS, a name column and the polygon of every area, areas without any ad
+    being left out
+
+    """
+    areas = load_areas(shapefiles)
+    df = df[['price', 'surface', 'lat', 'lon']].dropna().reset_index(drop=True)
+    located = areas.locate(df.lat, df.lon)
+
+    summaries = {}
+    stats = aggregate(df, located.dept.rename('code'))
+    stats = stats.drop(0, errors='ignore')
+    summaries['departments'] = gpd.GeoDataFrame(
+        stats.assign(name=stats.index.map(DEPARTMENT_NAMES)), geometry=areas.departments.reindex(stats.index).values,
+        crs='epsg:4326')
+
+    stats = aggregate(df, located.arrn.rename('code'))
+    stats = stats.drop(0, errors='ignore')
+    summaries['arrondissements'] = gpd.GeoDataFrame(
+        stats.assign(name=get_arrondissement_names(stats.index)),
+        geometry=areas.arrondissements.reindex(stats.index).values, crs='epsg:4326')
+
+    (rows, cols), (lat_step, lon_step) = get_grid_cells(df.lat, df.lon, cell_size)
+    stats = aggregate(df, [pd.Series(rows, name='row'), pd.Series(cols, name='col')]).reset_index()
+    cells = shapely.box(stats.col * lon_step, stats.row * lat_step, (stats.col + 1) * lon_step,
+                        (stats.row + 1) * lat_step)
+    summaries['grid'] = gpd.GeoDataFrame(stats.assign(name=stats.row.astype(str) + '_' + stats.col.astype(str)),
+                                         geometry=cells, crs='epsg:4326')
+    return summaries
+
+
+def load_summaries(df, data_folder='data', cell_size=1., use_cache=True):
+    """
+    Summaries of a clean dataset (see summarize), cached in data_folder/aggregation_cache and keyed by
+    the version of the dataset (see neighbourhood.dataset_version), the shapefiles, the size of the
+    cells and the code, so that they're only computed once per dataset.
+    """
+    shapefiles = os.path.join(data_folder, 'shapefiles')
+    pipeline = Pipeline(os.path.join(data_folder, 'aggregation_cache'), use_cache)
+    summaries = pipeline.stage('summaries', summarize,
+                               inputs=[dataset_version(df), file_digest(shapefiles), repr(float(cell_size))],
+                               code=[aggregate, get_grid_cells, get_arrondissement_names, spatial], df=df,
+                               shapefiles=shapefiles, cell_size=cell_size)
+    return summaries.result()
+
+
+def plot_choropleth(summary, column, ax=None, outline=None, **kwargs):
+    """
+    Choropleth of a statistic of a summary (see summarize), in the style of dataviz.ipynb.
+
+    Parameters
+    ----------
+    summary: geopandas.GeoDataFrame
+        summary of a level
+    column: str
+        statistic to plot, any from STATISTICS
+    ax: matplotlib Axes or None, default None
+        axes to plot on, new axes if None
+    outline: geopandas.GeoSeries or None, default None
+        polygons drawn in light gray below the choropleth (e.g. the départements under the grid)
+    **kwargs:
+        passed to GeoDataFrame.plot (e.g. vmin, vmax, cax)
+
+    Returns
+    -------
+    matplotlib Axes
+
+    """
+    if outline is not None:
+        ax = outline.plot(ax=ax, color='lightgray', edgecolor='k')
+    kwargs = {'cmap': 'Spectral_r', 'alpha': .8, 'edgecolor': (0, 0, 0, .2), 'legend': True,
+              'legend_kwds': {'orientation': 'horizontal'}, **kwargs}
+    ax = summary.plot(ax=ax, column=column, **kwargs)
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    ax.set_xticks([])
+    ax.set_yticks([])
+    return ax
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summaries of the ads per département, arrondissement and grid cell.')
+    parser.add_argument('path', help='path of the clean dataset (CSV file or folder of the Parquet dataset)')
+    parser.add_argument('--data-folder', default='data')
+    parser.add_argument('--cell-size', type=float, default=1., help='size of the grid cells, in km')
+    args = parser.parse_args()
+
+    from storage import read_table
+
+    summaries = load_summaries(read_table(args.path), args.data_folder, args.cell_size)
+    for level, summary in summaries.items():
+        print(f'\n{level} ({len(summary):,})')
+        print(summary.drop(columns='geometry').sort_values('count', ascending=False).head(20).to_string())
+
+
+if __name__ == '__main__':
+    main()
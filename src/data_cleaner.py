@@ -3,75 +3,87 @@
 ##################################################################
 import numpy as np
 import pandas as pd
-from tqdm.notebook import tqdm
-tqdm().pandas()
-
-from geopy.geocoders import BANFrance
-from geopy.exc import GeocoderTimedOut
-geolocator = BANFrance()
 
 import os
 
-import requests
-from bs4 import BeautifulSoup
+import ast
 import re
-from unidecode import unidecode
 
 from datetime import datetime as dt
 
+import address
+import dedup
+import metrics
+import gazetteer
+import geocoder as geocoding
+import spatial
+import storage
+from address import get_addresses
+from dedup import DedupIndex
+from gazetteer import load_gazetteer
+from geocoder import GeocodeCache, geocode_addresses
+from spatial import load_areas
+from stages import Pipeline, file_digest
+from storage import read_table, write_clean
+
+##################################################################
+# UTILITY FUNCTIONS
 ##################################################################
 
-def clean(data_folder='data',
-          guy_hoquet_path,
-          laforet_path,
-          orpi_path):
-
-    # Utility functions
-    def print_shape(df):
-        print(f'Number of rows    = {df.shape[0]:,}')
-        print(f'Number of columns = {df.shape[1]}')
-
-    def get_address_from_descr(row, search_pattern, split_pattern):
-        descr = unidecode(row.descr)
-        descr = re.sub(r'(sainte?)\-(\w+)', r'\1 \2', descr, flags=re.IGNORECASE)
-        search = re.search(search_pattern, descr, flags=re.IGNORECASE)
-        if search:
-            city = row.city if not row.city.upper().startswith('PARIS') else 'PARIS'
-            addr = search.group(1).strip().lower()
-            addr = re.split(split_pattern, addr)[0]
-            return f'{addr} {city} {dept_dict.get(row.dept, row.dept)} France'.lower()
-        else:
-            if row.city.upper().startswith('PARIS'):
-                search = re.search(metro, row.descr, flags=re.IGNORECASE)
-                if search:
-                    city = row.city if not row.city.startswith('PARIS') else 'PARIS'
-                    return f'metro {search.group(1)} {city} {dept_dict.get(row.dept, row.dept)} France'.lower()
-                else:
-                    return np.nan
-            else:
-                return np.nan
-
-    def get_address_from_city_and_dept(row):
-        if row.city.upper().startswith('PARIS'):
-            arrn = re.sub(r'0(\d)', r'\1', row.city.split()[1])
-            arrn = '1er arrondissement' if arrn == '1' else f'{arrn}e arrondissement'
-            return f'paris {arrn} france'
-        else:
-            return f'{row.city} {dept_dict.get(row.dept, row.dept)} France'.lower()
-
-    def get_coords(row):
-        loc = geolocator.geocode(row.address)
-        try:
-            return loc.latitude, loc.longitude
-        except GeocoderTimedOut:
-            return np.nan
-        except AttributeError:
-            return
-
-    ##################################################################
-    # READ AND PARSE GUY HOQUET DATA
-    ##################################################################
-    df_guy_hoquet = pd.read_csv(guy_hoquet_path, sep='|')
+def print_shape(df):
+    print(f'Number of rows    = {df.shape[0]:,}')
+    print(f'Number of columns = {df.shape[1]}')
+
+
+def join_feats(feats):
+    """
+    Features of ads as written by the scrapers, joined with '#'. Files written before the scrapers
+    joined them hold Python list literals instead, which are converted (without eval).
+    """
+    legacy = feats.str.startswith('[', na=False)
+    if legacy.any():
+        feats = feats.where(~legacy, feats[legacy].map(lambda lst: '#'.join(ast.literal_eval(lst))))
+    return feats
+
+
+# patterns extracting every field from the features of an ad at once, each lookahead matching the
+# first occurrence of a field anywhere in the features (fields missing from the features are NaN).
+# Guy Hoquet features are matched against feats + '\x1f' + feats2.
+GUY_HOQUET_FEATS = re.compile(r'^(?=[^\x1f]*?#(?P<bedrooms>\d+)\schambre\(s\)#)?'
+                              r'(?=[^\x1f]*\x1f.*?#Meublé (?P<furnished>\w+)#)?'
+                              r'(?P<surface>[^#\x1f]*)(?:#(?P<rooms>[^#\x1f]*))?', flags=re.DOTALL)
+
+
+def parse_guy_hoquet_feats(feats, feats2):
+    """
+    Parses the features of Guy Hoquet ads in a single pass.
+
+    Returns
+    -------
+    pandas.DataFrame with surface, rooms, bedrooms and furnished ('Oui', 'Non' or NaN if not in feats2) columns
+
+    """
+    feats = (join_feats(feats).fillna('') + '\x1f' + join_feats(feats2).fillna('')).str.extract(GUY_HOQUET_FEATS)
+    return pd.DataFrame({
+        'surface': feats.surface.str.replace(' m²', '').astype(float),
+        'rooms': feats.rooms.str.split().str[0].astype(int),
+        'bedrooms': feats.bedrooms.fillna(0),
+        'furnished': feats.furnished,
+    })
+
+
+LAFORET_FEATS = re.compile(r'^(?=.*?(?P<surface>\d+) m²)?(?=.*?(?P<rooms>\d+) pièce)?(?=.*?(?P<bedrooms>\d+) chbre)?',
+                           flags=re.DOTALL)
+ORPI_FEATS = re.compile(r'^(?=.*?(?P<furnished>Meublé))?(?=.*?(?P<bedrooms>\d+) chambres?)?', flags=re.DOTALL)
+
+##################################################################
+# READ AND PARSE GUY HOQUET DATA
+##################################################################
+
+def parse_guy_hoquet(path):
+    """Reads and parses the data scraped by scraper.scrap_guy_hoquet."""
+    df_guy_hoquet = read_table(path)
+    n_read = df_guy_hoquet.shape[0]
 
     # parse property type into new column : type
     df_guy_hoquet.loc[df_guy_hoquet['prop_type'].str.contains('Appartement|Studio|Duplex', flags=re.IGNORECASE), 'type'] = 'Appartement'
@@ -87,21 +99,16 @@ def clean(data_folder='data',
     # parse price
     df_guy_hoquet['price'] = df_guy_hoquet['price'].str.split('€').str[0].str.replace(' ', '').astype(int)
 
-    # parse feats to extract surface, rooms & bedrooms
-    df_guy_hoquet['feats'] = df_guy_hoquet['feats'].apply(lambda lst: eval(lst))
-    df_guy_hoquet['surface'] = df_guy_hoquet['feats'].str[0].str.replace(' m²', '').astype(float)
-    df_guy_hoquet['rooms'] = df_guy_hoquet['feats'].str[1].str.split().str[0].astype(int)
-    df_guy_hoquet['bedrooms'] = df_guy_hoquet['feats'].str.join('|').str.extract(r'\|(\d+)\schambre\(s\)\|')[0].fillna(0)
-    df_guy_hoquet = df_guy_hoquet.drop('feats', axis=1)
+    # parse feats & feats2 in a single pass to extract surface, rooms, bedrooms & furnished
+    feats = parse_guy_hoquet_feats(df_guy_hoquet['feats'], df_guy_hoquet['feats2'])
+    df_guy_hoquet[feats.columns] = feats
+    df_guy_hoquet = df_guy_hoquet.drop(['feats', 'feats2'], axis=1)
 
-    # parse feats2 to extract furnished
-    df_guy_hoquet['feats2'] = df_guy_hoquet['feats2'].apply(lambda lst: eval(lst))
-    df_guy_hoquet['furnished'] = df_guy_hoquet['feats2'].str.join('|').str.extract(r'\|(Meublé \w+)\|')[0].str.split().str[1]
+    # parse furnished from descr if it isn't in feats2
     df_guy_hoquet.loc[(df_guy_hoquet.furnished.isna()) & (df_guy_hoquet.descr.str.contains('(?<!non )meublé', flags=re.IGNORECASE)),
            'furnished'] = 'Oui'
     df_guy_hoquet.loc[(df_guy_hoquet.furnished.isna()) & (df_guy_hoquet.descr.str.contains('meublé', flags=re.IGNORECASE)),
            'furnished'] = 'Non'
-    df_guy_hoquet = df_guy_hoquet.drop('feats2', axis=1)
     df_guy_hoquet = df_guy_hoquet.loc[df_guy_hoquet.furnished.notna(), :]
     df_guy_hoquet['furnished'] = (df_guy_hoquet['furnished'] == 'Oui').astype(int)
 
@@ -109,31 +116,41 @@ def clean(data_folder='data',
     df_guy_hoquet['dept'] = df_guy_hoquet['city'].str.extract(r'(\d\d)\d\d\d').astype(int)
     df_guy_hoquet = df_guy_hoquet.loc[df_guy_hoquet.dept != 29, :]
     df_guy_hoquet['postcode'] = df_guy_hoquet['city'].str.extract(r'(\d+)')
-    df_guy_hoquet['city'] = df_guy_hoquet['city'].str.replace(r'\d+', '').str.strip().str.upper()
+    df_guy_hoquet['city'] = df_guy_hoquet['city'].str.replace(r'\d+', '', regex=True).str.strip().str.upper()
     df_guy_hoquet.loc[df_guy_hoquet.city == 'PARIS', 'city'] = 'PARIS ' + df_guy_hoquet['postcode'].str[-2:]
     df_guy_hoquet.loc[df_guy_hoquet.city == '', 'city'] = 'ORSAY'
+    df_guy_hoquet['dept'] = df_guy_hoquet.dept.astype(object)
     df_guy_hoquet.loc[df_guy_hoquet.city.str.startswith('PARIS'), 'dept'] = df_guy_hoquet.postcode
     df_guy_hoquet = df_guy_hoquet.drop(['neighborhood', 'postcode'], axis=1)
 
     # drop duplicates
     df_guy_hoquet = df_guy_hoquet.drop_duplicates()
 
+    metrics.count('rows.dropped', n_read - df_guy_hoquet.shape[0], stage='parse_guy_hoquet')
+
     print('Guy Hoquet DataFrame shape')
     print('==========================')
     print_shape(df_guy_hoquet)
 
-    ##################################################################
-    # READ AND PARSE LAFORET DATA
-    ##################################################################
-    df_laforet = pd.read_csv(laforet_path, sep='|').drop(['conso', 'emiss', 'ref'], axis=1)
+    return df_guy_hoquet
+
+##################################################################
+# READ AND PARSE LAFORET DATA
+##################################################################
+
+def parse_laforet(path):
+    """Reads and parses the data scraped by scraper.scrap_laforet."""
+    df_laforet = read_table(path, columns=['title', 'price', 'descr', 'feats', 'dept', 'furnitures'])
+    n_read = df_laforet.shape[0]
 
     # parse price
     df_laforet['price'] = df_laforet.price.str.split('€').str[0].astype(int)
 
-    # parse feats to extract surface, rooms & bedrooms
-    df_laforet['surface'] = df_laforet.feats.str.extract(r'(\d+) m²').astype(int)
-    df_laforet['rooms'] = df_laforet.feats.str.extract(r'(\d+) pièce').astype(int)
-    df_laforet['bedrooms'] = df_laforet.feats.str.extract(r'(\d+) chbre').fillna(0)
+    # parse feats in a single pass to extract surface, rooms & bedrooms
+    feats = df_laforet.feats.str.extract(LAFORET_FEATS)
+    df_laforet['surface'] = feats.surface.astype(int)
+    df_laforet['rooms'] = feats.rooms.astype(int)
+    df_laforet['bedrooms'] = feats.bedrooms.fillna(0)
     df_laforet = df_laforet.drop('feats', axis=1)
 
     # parse title to extract property type and city
@@ -145,6 +162,7 @@ def clean(data_folder='data',
 
     # add arrondissement to paris dept
     mask = df_laforet.city.str.startswith('PARIS')
+    df_laforet['dept'] = df_laforet.dept.astype(object)
     df_laforet.loc[mask, 'dept'] = (
         df_laforet.loc[mask, 'dept'].astype(str) + '0' + df_laforet.loc[mask, 'city'].str[-2:]
     )
@@ -160,20 +178,29 @@ def clean(data_folder='data',
     # drop duplicates
     df_laforet = df_laforet.drop_duplicates()
 
+    metrics.count('rows.dropped', n_read - df_laforet.shape[0], stage='parse_laforet')
+
     print('Laforêt DataFrame shape')
     print('=======================')
     print_shape(df_laforet)
 
-    ##################################################################
-    # READ AND PARSE ORPI DATA
-    ##################################################################
-    df_orpi = pd.read_csv(orpi_path, sep='|').drop(['conso', 'emiss', 'ref'], axis=1)
+    return df_laforet
+
+##################################################################
+# READ AND PARSE ORPI DATA
+##################################################################
+
+def parse_orpi(path):
+    """Reads and parses the data scraped by scraper.scrap_orpi."""
+    df_orpi = read_table(path, columns=['prop_type', 'city', 'dept', 'rooms', 'surface', 'price', 'descr', 'feats'])
+    n_read = df_orpi.shape[0]
 
     # add arrondissement to paris dept
     df_orpi['city'] = df_orpi.city.str.upper()
     df_orpi.loc[df_orpi.city.str.startswith('PARIS'), 'city'] = df_orpi.city.str.replace(r'PARIS (\d)(?!\d)',
-                                                                                         r'PARIS 0\1')
+                                                                                         r'PARIS 0\1', regex=True)
     mask = df_orpi.city.str.startswith('PARIS')
+    df_orpi['dept'] = df_orpi.dept.astype(object)
     df_orpi.loc[mask, 'dept'] = (
         df_orpi.loc[mask, 'dept'].astype(str) + '0' + df_orpi.loc[mask, 'city'].str[-2:]
     )
@@ -188,9 +215,10 @@ def clean(data_folder='data',
     # parse surface
     df_orpi['surface'] = df_orpi.surface.str.split().str[0].str.replace(',', '.').astype(float)
 
-    # parse furnished & bedrooms from feats
-    df_orpi['furnished'] = df_orpi.feats.str.contains('Meublé').astype(int)
-    df_orpi['bedrooms'] = df_orpi.feats.str.extract(r'(\d+) chambres?')[0].fillna(0).astype(int)
+    # parse furnished & bedrooms from feats in a single pass
+    feats = join_feats(df_orpi.feats).fillna('').str.extract(ORPI_FEATS)
+    df_orpi['furnished'] = feats.furnished.notna().astype(int)
+    df_orpi['bedrooms'] = feats.bedrooms.fillna(0).astype(int)
     df_orpi = df_orpi.drop('feats', axis=1)
 
     # parse price
@@ -201,83 +229,159 @@ def clean(data_folder='data',
     # drop duplicates
     df_orpi = df_orpi.drop_duplicates()
 
+    metrics.count('rows.dropped', n_read - df_orpi.shape[0], stage='parse_orpi')
+
     print('Orpi DataFrame shape')
     print('====================')
     print_shape(df_orpi)
 
-    ##################################################################
-    # CONCAT DATAFRAMES AND GEOCODE ADDRESSES
-    ##################################################################
+    return df_orpi
+
+##################################################################
+# CONCAT DATAFRAMES AND GEOCODE ADDRESSES
+##################################################################
+
+def merge(df_guy_hoquet, df_laforet, df_orpi):
+    """Concatenates the parsed data of the three websites (source column) and harmonizes city names."""
     # concatenate dataframes
-    df = pd.concat([df_guy_hoquet, df_laforet, df_orpi])
+    df = pd.concat([df_guy_hoquet.assign(source='guy_hoquet'), df_laforet.assign(source='laforet'),
+                    df_orpi.assign(source='orpi')])
 
     # replace "ST(E)" by "SAINT(E)" to harmonize city names
-    df.city = df.city.str.replace(r'\bST(?!E)\b', 'SAINT')
-    df.city = df.city.str.replace(r'\bSTE\b', 'SAINTE')
+    df.city = df.city.str.replace(r'\bST(?!E)\b', 'SAINT', regex=True)
+    df.city = df.city.str.replace(r'\bSTE\b', 'SAINTE', regex=True)
 
     print_shape(df)
 
-    # get list of subway stations in Paris from wikipedia
-    URL = 'https://fr.wikipedia.org/wiki/Liste_des_stations_du_m%C3%A9tro_de_Paris'
-    soup = BeautifulSoup(requests.get(URL).content)
-    metro = '|'.join([unidecode(el.select_one('td a').text).replace(' - ', '-').upper()
-                      for el in soup.select_one('table.wikitable').select('tr')[1:]])
-    metro = f'({metro})'.replace('COMMERCE|', '')
-
-    # prepare variables to be used in geocoding functions
-    dept_dict = {
-        75: '',
-        77: 'SEINE-ET-MARNE',
-        78: 'YVELINES',
-        91: 'ESSONNE',
-        92: 'HAUTS-DE-SEINE',
-        93: 'SEINE-SAINT-DENIS',
-        94: 'VAL-DE-MARNE',
-        95: 'VAL D\'OISE'
-    }
-
-    search_pattern = (r'((?:rue(?!(?: tres)? calme| commercante| pavillonnaire| pietonne| sans passage'
-                      r'| tres re| a deux pas| au pied de)'
-                      r'|place(?! de? parking| (?:de )?statio| dans | de moto| pour y| les dispo| perdue'
-                      r'|et de l\'ecole| privative| a moins de)'
-                      r'|avenue(?! bordee de maisons| principale)'
-                      r'|boulevard(?! peripherique)|quai(?! de seine))\s+[a-z\s\']+)')
-
-    split_pattern = (r' a (?:montreuil|vincennes|suresnes|asnieres sur seine|neuilly|noisy le sec|'
-                     r'ablon sur seine|etampes)|'
-                     r'(?:au)?(?: pied du)? metro| qui se | a$|'
-                     r' a proximite| (?:un )?studio| proche| agreable| ideal(?:ement)?(?: coloc)?|'
-                     r' deux pieces| au$| anime le quartier| et | et$|'
-                     r'(?<!de) paris$| appartement| dans | location| au sein | situe |'
-                     r' en plein| centre levallois|place a deux minutes de la gare  ligne  reseau  est '
-                    )
-
-    # get address from descr
-    df['address'] = df.progress_apply(lambda row: get_address_from_descr(row, search_pattern, split_pattern), axis=1)
-
-    # get address from city and dept if getting address from descr isn't possible
-    df.loc[df.address.isna(), 'address'] = df.loc[df.address.isna()].progress_apply(get_address_from_city_and_dept,
-                                                                                    axis=1)
-
-    # geocode addresses
-    df['coords'] = df.progress_apply(get_coords, axis=1)
-
-    # parse coords
-    df = pd.concat([
-        df.drop('coords', axis=1).reset_index(drop=True),
-        pd.DataFrame(df.coords.tolist(), columns=['lat', 'lon'])
-    ], axis=1)
-
-    ##################################################################
-    # REMOVE WRONGLY GEODED DATA AND SAVE DATA ON DISK
-    ##################################################################
-    # drop wrongly geocoded datapoints
-    n = df.loc[(df.lat >= 49.3) | (df.lat < 48) | (df.lon >= 3.8)].shape[0]
-    print(f'At least {n} addresses ({n/df.shape[0]:.2%}) were wrongly geocoded and will be dropped.')
-    df = df.loc[(df.lat < 49.3) & (df.lat > 48) & (df.lon < 3.8), :]
+    return df.reset_index(drop=True)
+
+
+def drop_near_duplicates(df):
+    """
+    Drops the ads published by several agencies with slightly different descriptions (see
+    dedup.DedupIndex) : in every cluster of near-duplicates spanning several websites, only the ads of
+    the website of its first ad are kept. Near-duplicates from a single website are all kept, as an
+    agency often advertises similar flats (e.g. in the same building) with the same description.
+    """
+    labels = DedupIndex().add(df.descr, df.dept, df.rooms, df.surface, df.price)
+    sources = df.source.to_numpy()
+    keep = sources == sources[labels]
+    n = (~keep).sum()
+    print(f'{n} ads ({n/df.shape[0]:.2%}) are near-duplicates of ads of another website and will be dropped.')
+    metrics.count('rows.dropped', n, stage='dedup')
+    return df.loc[keep, :].reset_index(drop=True)
+
+
+def add_addresses(df, gazetteer_path):
+    """Adds the address column, extracted from descr or built from city and dept."""
+    # get list of subway stations in Paris from the local gazetteer ("commerce" being mostly a common word)
+    stations = load_gazetteer(gazetteer_path).matcher(exclude={'COMMERCE'})
+
+    # get address from descr, or from city and dept if getting address from descr isn't possible
+    return df.assign(address=get_addresses(df.descr, df.city, df.dept, stations))
+
+
+def geocode(df, data_folder, gazetteer_path, geocoder=None):
+    """
+    Adds the lat and lon columns and drops the datapoints which couldn't be geocoded or whose
+    location isn't in the département of the ad. The number of addresses which couldn't be geocoded
+    because of errors (e.g. timeouts) is stored in df.attrs['n_failed'].
+    """
+    # locate metro stations with the gazetteer and arrondissements with their centroid, then geocode the
+    # other addresses, each unique address being geocoded only once thanks to the cache
+    areas = load_areas(os.path.join(data_folder, 'shapefiles'))
+    coords = load_gazetteer(gazetteer_path).locate_addresses(df.address).fillna(areas.locate_addresses(df.address))
+    todo = coords.lat.isna()
+    cache = GeocodeCache(os.path.join(data_folder, 'geocode_cache.sqlite'))
+    geocoded = geocode_addresses(df.address[todo], cache, geocoder)
+    coords.loc[todo] = geocoded
+    cache.close()
+    df = pd.concat([df, coords], axis=1)
+
+    # drop datapoints which couldn't be geocoded or whose location isn't in the département of the ad
+    valid = areas.contains(df.lat, df.lon, df.dept)
+    n = (~valid).sum()
+    print(f'{n} addresses ({n/df.shape[0]:.2%}) were wrongly geocoded and will be dropped.')
+    metrics.count('rows.dropped', n, stage='geocode')
+    df = df.loc[valid, :]
+
+    df.attrs['n_failed'] = geocoded.attrs['n_failed']
+    return df
+
+##################################################################
+# CLEAN DATA AND SAVE IT ON DISK
+##################################################################
+
+@metrics.spanned('clean')
+def clean(guy_hoquet_path,
+          laforet_path,
+          orpi_path,
+          data_folder='data',
+          geocoder=None,
+          use_cache=True):
+    """
+    Reads, parses, merges and geocodes the data scraped from the three websites, then writes the
+    clean dataset on disk as data_folder/locations_<year>_<month>_clean.csv and in the partitions of
+    the clean Parquet dataset (see storage.write_clean).
+
+    Every step (parsing of each source, merge, removal of near-duplicates across sources, address
+    extraction, geocoding) is a stage whose result is cached in data_folder/clean_cache, keyed by the
+    content of its input files, the results of the stages it depends on and its code : a rerun only
+    recomputes the stages whose inputs changed (e.g. only the parsing of the Orpi data and the stages after it if only the Orpi
+    file changed). Geocoding results are only cached if no address failed to be geocoded.
+
+    Parameters
+    ----------
+    guy_hoquet_path: str
+        path of the data scraped by scraper.scrap_guy_hoquet : CSV file or partition of the raw Parquet dataset
+    laforet_path: str
+        path of the data scraped by scraper.scrap_laforet : CSV file or partition of the raw Parquet dataset
+    orpi_path: str
+        path of the data scraped by scraper.scrap_orpi : CSV file or partition of the raw Parquet dataset
+    data_folder: str, default 'data'
+        path of the folder where the clean data, the stage cache (clean_cache folder) and the geocoding
+        cache (geocode_cache.sqlite) are written, and where the metro stations gazetteer
+        (metro_stations.json) and the shapefiles (shapefiles folder) are read from
+    geocoder: object or None, default None
+        batch geocoder used for addresses missing from the geocoding cache, defaults to
+        geocoder.BANBatchGeocoder
+    use_cache: bool, default True
+        whether to reuse the cached results of the stages, every stage being recomputed if False
+
+    Returns
+    -------
+    None
+
+    """
+    gazetteer_path = os.path.join(data_folder, 'metro_stations.json')
+    shapefiles = [os.path.join(data_folder, 'shapefiles', f'{name}.shp')
+                  for name in ['geoflar-departements', 'arrondissements']]
+
+    pipeline = Pipeline(os.path.join(data_folder, 'clean_cache'), use_cache)
+    df_guy_hoquet = pipeline.stage('parse_guy_hoquet', parse_guy_hoquet, inputs=[file_digest(guy_hoquet_path)],
+                                   code=[storage, join_feats, parse_guy_hoquet_feats, GUY_HOQUET_FEATS],
+                                   path=guy_hoquet_path)
+    df_laforet = pipeline.stage('parse_laforet', parse_laforet, inputs=[file_digest(laforet_path)],
+                                code=[storage, LAFORET_FEATS], path=laforet_path)
+    df_orpi = pipeline.stage('parse_orpi', parse_orpi, inputs=[file_digest(orpi_path)],
+                             code=[storage, join_feats, ORPI_FEATS], path=orpi_path)
+    df = pipeline.stage('merge', merge, df_guy_hoquet, df_laforet, df_orpi)
+    df = pipeline.stage('dedup', drop_near_duplicates, df, code=[address, dedup])
+    df = pipeline.stage('addresses', add_addresses, df, inputs=[file_digest(gazetteer_path)], code=[address, gazetteer],
+                        gazetteer_path=gazetteer_path)
+    df = pipeline.stage('geocode', geocode, df, inputs=[file_digest(path) for path in [gazetteer_path] + shapefiles],
+                        code=[geocoding, gazetteer, spatial], cache=lambda df: df.attrs['n_failed'] == 0,
+                        data_folder=data_folder, gazetteer_path=gazetteer_path, geocoder=geocoder)
+    df = df.result()
 
     # drop descr, address and city columns
     df = df.drop(['descr', 'address', 'city'], axis=1)
 
-    # write df on disk
-    df.to_csv(os.path.join(data_folder, f'locations_{dt.now().year}_{dt.now().month}_clean.csv'), sep='|', index=False)
+    # write df on disk, as a CSV file and in the partitions of the clean Parquet dataset
+    with metrics.span('write', stage='clean'):
+        df.drop('source', axis=1).to_csv(
+            os.path.join(data_folder, f'locations_{dt.now().year}_{dt.now().month}_clean.csv'), sep='|', index=False)
+        write_clean(df, data_folder)
+    metrics.count('rows.written', df.shape[0], stage='clean')
+
+    pipeline.report()
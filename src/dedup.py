@@ -0,0 +1,312 @@
+"""
+Near-duplicate detection of ads across websites : the same flat is often advertised by several
+agencies, with slightly different descriptions.
+
+Descriptions are normalized and split into shingles (sequences of 3 words), each ad being summarized
+by a MinHash signature whose values agree with those of another ad in proportion to the Jaccard
+similarity of their shingles. Signatures are cut into bands, and ads whose bands are equal in at
+least one band (LSH) and which fall in the same block (département, rooms, rounded surface and
+price) are candidate duplicates, checked on their whole signatures. Every ad is only compared with
+the few ads it shares a bucket with, so that the cost grows linearly with the number of ads instead
+of quadratically for pairwise comparisons.
+
+Buckets are held in a dict keyed by département and number of rooms, so that adding ads only merges
+their keys into the buckets of their own départements and numbers of rooms, and the neighbouring
+blocks of an ad are probed by shifting its rounded surface and price.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from address import transliterate
+
+FORMAT_VERSION = 1
+
+# odd multipliers used to combine 64-bit hashes (wrapping multiplications)
+MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93], dtype=np.uint64)
+
+# shifts of the rounded surface and price of a block to its neighbouring blocks, itself included
+NEIGHBOURS = np.array([(surface, price) for surface in (-1, 0, 1) for price in (-1, 0, 1)])
+
+
+def normalize_descr(descr):
+    """Descriptions in lower case ASCII, punctuation and repeated whitespace removed (vectorized)."""
+    descr = transliterate(descr.fillna('').str.lower())
+    return descr.str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+
+
+def word_hashes(words):
+    """Stable 64-bit hashes of words, each distinct word being hashed only once."""
+    codes, uniques = pd.factorize(words)
+    hashes = np.array([int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+                       for word in uniques], dtype=np.uint64)
+    return hashes[codes]
+
+
+def mix(*arrays):
+    """Combines arrays of integers element-wise into 64-bit hashes."""
+    with np.errstate(over='ignore'):
+        h = np.zeros(len(arrays[0]), dtype=np.uint64)
+        for i, array in enumerate(arrays):
+            h = (h ^ np.asarray(array).astype(np.uint64)) * MIX[i % len(MIX)]
+            h ^= h >> np.uint64(29)
+    return h
+
+
+def get_shingles(descr, size=3):
+    """
+    Hashes of the shingles (sequences of size words) of normalized descriptions, descriptions shorter
+    than size words having a single shingle of their first word (vectorized).
+
+    Returns
+    -------
+    tuple (hashes, counts) of numpy.ndarray : hashes of the shingles of every description one after
+    the other, and number of shingles of every description (0 for empty descriptions)
+
+    """
+    words = descr.str.split()
+    n_words = words.str.len().to_numpy()
+    flat = words.explode().dropna().to_numpy(dtype=object)
+    hashes = word_hashes(flat) if len(flat) else np.zeros(0, dtype=np.uint64)
+
+    counts = np.where(n_words >= size, n_words - size + 1, np.minimum(n_words, 1))
+    word_starts = np.cumsum(n_words) - n_words
+    starts = np.repeat(word_starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    short = np.repeat(n_words < size, counts)
+
+    shingles = hashes[starts]
+    with np.errstate(over='ignore'):
+        for offset in range(1, size):
+            following = hashes[np.minimum(starts + offset, len(hashes) - 1)]
+            shingles = np.where(short, shingles, (shingles * MIX[0]) ^ following)
+    return shingles, counts
+
+
+def get_signatures(shingles, counts, num_perm, seed=0):
+    """
+    MinHash signatures of sets of shingles : minimum of every one of num_perm random hash functions
+    over the shingles of every set (vectorized).
+
+    Returns
+    -------
+    numpy.ndarray of shape (number of sets, num_perm), all zeros for empty sets
+
+    """
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+    signatures = np.zeros((len(counts), num_perm), dtype=np.uint64)
+    nonempty = counts > 0
+    if not nonempty.any():
+        return signatures
+    starts = (np.cumsum(counts) - counts)[nonempty]
+    with np.errstate(over='ignore'):
+        for i in range(num_perm):
+            signatures[nonempty, i] = np.minimum.reduceat(shingles * a[i] + b[i], starts)
+    return signatures
+
+
+def group_blocks(blocks):
+    """Distinct rows (tuples) of an array of blocks, and positions of the rows equal to every one of them."""
+    if not len(blocks):
+        return []
+    uniques, inverse = np.unique(blocks, axis=0, return_inverse=True)
+    order = np.argsort(inverse.reshape(-1), kind='stable')
+    rows = np.split(order, np.cumsum(np.bincount(inverse.reshape(-1)))[:-1])
+    return [(tuple(block), positions) for block, positions in zip(uniques.tolist(), rows)]
+
+
+class DedupIndex:
+    """
+    Incremental near-duplicate index of ads : add indexes new ads (e.g. the ads of a new scrape) and
+    clusters them with the near-duplicates found among every ad indexed so far.
+
+    Parameters
+    ----------
+    threshold: float, default 0.5
+        estimated Jaccard similarity of shingles above which two ads of the same block are duplicates
+    num_perm: int, default 32
+        number of hash functions of the MinHash signatures
+    bands: int, default 8
+        number of LSH bands the signatures are cut into, pairs with a similarity s being candidates
+        with probability 1 - (1 - s^(num_perm / bands))^bands
+    surface_step: float, default 5
+        surface (m²) rounding of the blocks
+    price_step: float, default 100
+        monthly rent (€) rounding of the blocks
+    chunk_size: int, default 20000
+        number of ads whose signatures are computed, or whose buckets are probed, at once
+
+    Ads are compared with the ads of their block and of the neighbouring blocks (surface and price
+    rounded one step up or down), so that rounding doesn't separate ads with close surfaces or prices.
+
+    """
+    def __init__(self, threshold=.5, num_perm=32, bands=8, surface_step=5, price_step=100, chunk_size=20000):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands.')
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.surface_step = surface_step
+        self.price_step = price_step
+        self.chunk_size = chunk_size
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint64)
+        self.blocks = np.zeros((0, 4), dtype=np.int64)
+        self.edges = np.zeros((0, 2), dtype=np.int64)
+        # (département, rooms) -> sorted bucket keys of every band of its ads, and ads they belong to
+        self.buckets = {}
+        self.labels = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def get_blocks(self, dept, rooms, surface, price):
+        return np.column_stack([
+            pd.to_numeric(pd.Series(dept)).to_numpy(dtype=np.int64),
+            np.asarray(rooms, dtype=np.int64),
+            np.floor(np.asarray(surface, dtype=float) / self.surface_step).astype(np.int64),
+            np.floor(np.asarray(price, dtype=float) / self.price_step).astype(np.int64),
+        ])
+
+    def get_keys(self, signatures):
+        """Hashes of every band of every signature : array of shape (len(signatures), bands)."""
+        rows = self.num_perm // self.bands
+        keys = np.empty((len(signatures), self.bands), dtype=np.uint64)
+        for band in range(self.bands):
+            values = signatures[:, band * rows:(band + 1) * rows]
+            keys[:, band] = mix(np.full(len(signatures), band), *values.T)
+        return keys
+
+    def get_bucket_keys(self, keys, cells):
+        """
+        Bucket keys of the bands of ads (keys, see get_keys) within their rounded surfaces and prices (cells,
+        array of shape (len(keys), 2)) : flat array of the keys of every band of every ad.
+        """
+        return mix(np.repeat(cells[:, 0], self.bands), np.repeat(cells[:, 1], self.bands), keys.reshape(-1))
+
+    def insert(self, keys, blocks, ids):
+        """
+        Adds the bands of ads (keys, see get_keys) to the buckets of their blocks : the new bucket keys are
+        merged into the sorted keys of the départements and numbers of rooms of the ads only.
+        """
+        for group, rows in group_blocks(blocks[:, :2]):
+            bucket_keys = self.get_bucket_keys(keys[rows], blocks[rows, 2:])
+            order = np.argsort(bucket_keys)
+            bucket_keys, bucket_ids = bucket_keys[order], np.repeat(ids[rows], self.bands)[order]
+            if group in self.buckets:
+                group_keys, group_ids = self.buckets[group]
+                positions = np.searchsorted(group_keys, bucket_keys)
+                bucket_keys, bucket_ids = np.insert(group_keys, positions, bucket_keys), np.insert(group_ids, positions, bucket_ids)
+            self.buckets[group] = bucket_keys, bucket_ids
+
+    def probe(self, keys, blocks, ids):
+        """
+        Pairs (ad, earlier ad) of the ads whose bands (keys, see get_keys) share a bucket with earlier ads of
+        their block or of the neighbouring blocks : array of shape (number of pairs, 2).
+        """
+        pairs = [np.zeros((0, 2), dtype=np.int64)]
+        for group, rows in group_blocks(blocks[:, :2]):
+            if group not in self.buckets:
+                continue
+            group_keys, group_ids = self.buckets[group]
+            # bucket keys of the ads in every neighbouring block, probed at once
+            cells = (blocks[rows, None, 2:] + NEIGHBOURS).reshape(-1, 2)
+            bucket_keys = self.get_bucket_keys(np.repeat(keys[rows], len(NEIGHBOURS), axis=0), cells)
+            query_ids = np.repeat(ids[rows], len(NEIGHBOURS) * self.bands)
+            first, last = np.searchsorted(group_keys, bucket_keys, 'left'), np.searchsorted(group_keys, bucket_keys, 'right')
+            counts = last - first
+            matches = np.repeat(first, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            pairs.append(np.column_stack([np.repeat(query_ids, counts), group_ids[matches]]))
+        pairs = np.concatenate(pairs)
+        return pairs[pairs[:, 1] < pairs[:, 0]]
+
+    def add(self, descr, dept, rooms, surface, price):
+        """
+        Indexes ads and clusters them with their near-duplicates.
+
+        Parameters
+        ----------
+        descr: pandas.Series
+            descriptions of the ads
+        dept: array-like
+            départements of the ads, or postcodes for Paris
+        rooms: array-like
+            numbers of rooms
+        surface: array-like
+            surfaces, in m²
+        price: array-like
+            monthly rents, in €
+
+        Returns
+        -------
+        numpy.ndarray of the cluster of every ad : the position in the index (order of addition) of the
+        first ad of its cluster, an ad being the first of its cluster if it has no earlier near-duplicate
+
+        """
+        start = len(self)
+        descr = pd.Series(descr).reset_index(drop=True)
+        signatures = np.zeros((len(descr), self.num_perm), dtype=np.uint64)
+        counts = np.zeros(len(descr), dtype=np.int64)
+        # signatures are computed by chunks, the words of every description being held in memory at once otherwise
+        for chunk in range(0, len(descr), self.chunk_size):
+            shingles, counts[chunk:chunk + self.chunk_size] = get_shingles(
+                normalize_descr(descr.iloc[chunk:chunk + self.chunk_size]))
+            signatures[chunk:chunk + self.chunk_size] = get_signatures(
+                shingles, counts[chunk:chunk + self.chunk_size], self.num_perm)
+        blocks = self.get_blocks(dept, rooms, surface, price)
+        ids = np.arange(start, start + len(signatures))
+        valid = counts > 0
+
+        # ads without description are only indexed, never matched
+        self.signatures = np.concatenate([self.signatures, signatures])
+        self.blocks = np.concatenate([self.blocks, blocks])
+        keys = self.get_keys(signatures[valid])
+        self.insert(keys, blocks[valid], ids[valid])
+
+        # probe the buckets of the new ads in their block and in the neighbouring blocks by chunks, every
+        # pair being found once : by the latest of its two ads
+        pairs = [np.zeros((0, 2), dtype=np.int64)]
+        for chunk in range(0, valid.sum(), self.chunk_size):
+            rows = slice(chunk, chunk + self.chunk_size)
+            pairs.append(self.probe(keys[rows], blocks[valid][rows], ids[valid][rows]))
+        pairs = np.unique(np.concatenate(pairs), axis=0)
+
+        # check candidates on their whole signatures
+        similarity = (self.signatures[pairs[:, 0]] == self.signatures[pairs[:, 1]]).mean(axis=1)
+        self.edges = np.concatenate([self.edges, pairs[similarity >= self.threshold]])
+        self.update_labels()
+        return self.labels[start:]
+
+    def update_labels(self):
+        """Clusters : connected components of the graph of near-duplicates, labelled by their first ad."""
+        n = len(self)
+        graph = coo_matrix((np.ones(len(self.edges)), (self.edges[:, 0], self.edges[:, 1])), shape=(n, n))
+        _, components = connected_components(graph, directed=False)
+        first = np.full(components.max() + 1 if n else 0, n, dtype=np.int64)
+        np.minimum.at(first, components, np.arange(n))
+        self.labels = first[components]
+
+    def save(self, path):
+        """Writes the index to path (.npz), the bucket keys being recomputed when it's loaded."""
+        np.savez_compressed(path, format_version=FORMAT_VERSION, signatures=self.signatures, blocks=self.blocks,
+                            edges=self.edges, params=np.array([self.threshold, self.num_perm, self.bands,
+                                                               self.surface_step, self.price_step]))
+
+    @classmethod
+    def load(cls, path):
+        """Reads an index written by save."""
+        with np.load(path) as arrays:
+            if int(arrays['format_version']) != FORMAT_VERSION:
+                raise ValueError(f'{path} was written by another version of DedupIndex.')
+            threshold, num_perm, bands, surface_step, price_step = arrays['params'].tolist()
+            index = cls(threshold, int(num_perm), int(bands), surface_step, price_step)
+            index.signatures, index.blocks, index.edges = arrays['signatures'], arrays['blocks'], arrays['edges']
+
+        valid = index.signatures.any(axis=1)
+        index.insert(index.get_keys(index.signatures[valid]), index.blocks[valid], np.flatnonzero(valid))
+        index.update_labels()
+        return index
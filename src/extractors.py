@@ -0,0 +1,185 @@
+import re
+
+import lxml.html
+from bs4 import UnicodeDammit
+from cssselect import GenericTranslator
+from lxml import etree
+
+translator = GenericTranslator()
+
+
+def compile_selector(css):
+    """Compiles a CSS selector once into an XPath expression matching descendants of an element."""
+    return etree.XPath(translator.css_to_xpath(css, prefix='descendant::'))
+
+
+def get_text(element):
+    """Same as BeautifulSoup's .text : concatenation of every text node below element."""
+    return str(element.text_content())
+
+
+class Field:
+    """
+    Declarative description of a field to extract from an ad page.
+
+    Parameters
+    ----------
+    selector: str
+        CSS selector of the element(s) holding the field
+    post: callable or None, default None
+        post-processing applied to the text of the element (to the text of every element if many)
+    many: bool, default False
+        whether to return the list of every matching element instead of the first one
+    index: int, default 0
+        position of the element to use among the matching ones when many is False
+    then: str or None, default None
+        CSS selector applied below the element found with selector (like soup.select(selector)[index].select_one(then))
+    required: bool, default False
+        whether the whole record must be discarded if the field is missing (e.g. dead links)
+    default: any, default None
+        value of the field when it is missing and not required
+
+    """
+    def __init__(self, selector, post=None, many=False, index=0, then=None, required=False, default=None):
+        self.xpath = compile_selector(selector)
+        self.then = compile_selector(then) if then else None
+        self.post = post or (lambda text: text)
+        self.many = many
+        self.index = index
+        self.required = required
+        self.default = default
+
+    def extract(self, tree):
+        """Returns the value of the field in tree, or raises LookupError if it is missing."""
+        elements = self.xpath(tree)
+        if self.many:
+            return [self.post(get_text(element)) for element in elements]
+        if len(elements) <= self.index:
+            raise LookupError
+        element = elements[self.index]
+        if self.then is not None:
+            elements = self.then(element)
+            if not elements:
+                raise LookupError
+            element = elements[0]
+        return self.post(get_text(element))
+
+
+class Extractor:
+    """
+    Per-site extractor compiled once from a {field name: Field} spec, running on lxml.
+
+    Parameters
+    ----------
+    fields: dict
+        mapping of field name -> Field, in the order of the record
+    stop: bytes or None, default None
+        marker of the page-level element following the content region of the page (e.g. the footer) :
+        the page is only parsed up to its last occurrence, so that elements of the same tag nested in
+        the content (e.g. <article><footer>) don't cut it short, and parsed in full if any field is
+        missing from the truncated page (no match for a field with many), as it may come after the marker
+
+    """
+    def __init__(self, fields, stop=None):
+        self.fields = fields
+        self.stop = stop
+
+    @staticmethod
+    def parse(content):
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            text = UnicodeDammit(content).unicode_markup
+        return lxml.html.document_fromstring(text)
+
+    def extract(self, content):
+        """
+        Extracts every field from the raw page content (bytes).
+
+        Returns
+        -------
+        dict of field name -> value, or None if a required field is missing
+
+        """
+        if self.stop is not None:
+            position = content.rfind(self.stop)
+            if position > 0:
+                record = self.extract_tree(self.parse(content[:position]), complete=True)
+                if record is not None:
+                    return record
+        try:
+            return self.extract_tree(self.parse(content))
+        except etree.ParserError:
+            return None # empty document
+
+    def extract_tree(self, tree, complete=False):
+        """
+        Extracts every field from a parsed page.
+
+        Returns
+        -------
+        dict of field name -> value, or None if a required field is missing (any field if complete, a
+        field with many matching no element being missing too)
+
+        """
+        record = {}
+        for name, field in self.fields.items():
+            try:
+                record[name] = field.extract(tree)
+            except LookupError:
+                if field.required or complete:
+                    return None
+                record[name] = field.default
+            if complete and field.many and not record[name]:
+                return None
+        return record
+
+
+def clean_spaces(text):
+    return re.sub(r'\s+', ' ', re.sub(r'\n+', '', text)).strip()
+
+
+LAFORET = Extractor({
+    'ref': Field('div.property__title span', lambda t: t.strip(), required=True),
+    'title': Field('div.property__title h1', required=True),
+    'price': Field('div.property__price',
+                   lambda t: t.replace('\u202f', '').replace('\xa0', '').replace('\n', '').strip(), required=True),
+    'descr': Field('div.property-content__description.mb-4',
+                   lambda t: ' '.join([line.strip() for line in t.split('\n') if line.strip() != '']), required=True),
+    'conso': Field('div.mb-4.col', lambda t: t.replace('\n', '').strip(), index=0, then='span.indicator__value',
+                   default=''),
+    'emiss': Field('div.mb-4.col', lambda t: t.replace('\n', '').strip(), index=1, then='span.indicator__value',
+                   default=''),
+    'feats': Field('div.property-features__content span.property-feature', lambda t: t.replace('\n', '').strip(),
+                   many=True),
+}, stop=b'<footer')
+
+ORPI = Extractor({
+    'ref': Field('span.u-text-xs', required=True),
+    'prop_type': Field('span.u-text-xl', lambda t: t.replace('\n', '').strip(), required=True),
+    'rooms': Field('span.u-h3.u-color-primary', lambda t: t.split(' • ')[0], required=True),
+    'surface': Field('span.u-h3.u-color-primary', lambda t: t.split(' • ')[1], required=True),
+    'city': Field('span.u-text-lg', required=True),
+    'price': Field('span.u-h1', lambda t: t.replace('\xa0', ''), required=True),
+    'descr': Field('div.c-section__inner div.o-container p', lambda t: t.replace('\n', '').strip(), required=True),
+    'feats': Field('span.c-badge__text', many=True),
+    'conso': Field('abbr.c-dpe__index.c-dpe__index--5', default=''),
+    'emiss': Field('abbr.c-dpe__index.c-dpe__index--3', default=''),
+}, stop=b'<footer')
+
+GUY_HOQUET = Extractor({
+    'prop_type': Field('h1.name.property-name', required=True),
+    'city': Field('div.add', required=True),
+    'price': Field('div.price', lambda t: t.replace('\n', '').strip(), required=True),
+    'descr': Field('span.description-more', lambda t: t.replace('\n', '').replace('Voir moins', '').strip(),
+                   required=True),
+    'feats': Field('div.ttl', many=True),
+    'feats2': Field('div.horaires-item', clean_spaces, many=True),
+    'neighborhood': Field('div.quartier-info.mt-4', clean_spaces, required=True),
+}, stop=b'<footer')
+
+EXTRACTORS = {
+    'laforet': LAFORET,
+    'orpi': ORPI,
+    'guy_hoquet': GUY_HOQUET,
+}
@@ -0,0 +1,310 @@
+import asyncio
+import inspect
+import queue
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_session = None
+
+
+def get_session():
+    """
+    Returns the process-wide requests.Session used for listing pages : connections are kept alive
+    and reused across calls instead of opening a new one for every page.
+    """
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+
+def get_page(url, cache=None, retries=3, backoff=.5, timeout=30):
+    """
+    Synchronous GET through the shared keep-alive session, using cache (if any) to skip the request
+    when the cached response is fresh or to revalidate it with a conditional request. Network errors,
+    timeouts and 429/5xx responses are retried with exponential backoff (plus jitter), as in fetch_one.
+
+    Parameters
+    ----------
+    url: str
+        URL to fetch
+    cache: ResponseCache or None, default None
+        response cache to read from and write to
+    retries: int, default 3
+        number of retries after the first attempt
+    backoff: float, default .5
+        base delay in seconds, doubled after every failed attempt
+    timeout: float, default 30
+        timeout in seconds of every attempt (to connect, and between two bytes of the response)
+
+    Returns
+    -------
+    bytes, body of the response
+
+    Raises
+    ------
+    requests.RequestException
+        if every attempt failed, or if the server answered with another error status (e.g. 404)
+
+    """
+    headers, body = {}, None
+    if cache is not None:
+        fresh, headers, body = cache.lookup(url)
+        if fresh:
+            cache.hit(url, body)
+            metrics.count('http.cache', result='hit')
+            return body
+
+    for attempt in range(retries + 1):
+        delay = backoff * 2 ** attempt * (1 + random.random())
+        try:
+            response = get_session().get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            metrics.count('http.error', error=type(e).__name__)
+            if attempt == retries:
+                metrics.count('http.failed')
+                raise
+        else:
+            metrics.count('http.status', status=response.status_code)
+            if response.status_code == 304 and body is not None:
+                cache.revalidated(url, body)
+                metrics.count('http.cache', result='revalidated')
+                return body
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                if response.status_code in RETRY_STATUSES:
+                    metrics.count('http.failed')
+                response.raise_for_status()
+                if cache is not None and response.status_code == 200:
+                    cache.store(url, response.content, response.headers)
+                return response.content
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+        metrics.count('http.retry')
+        time.sleep(delay)
+
+
+class HostRateLimiter:
+    """
+    Polite per-host rate limiter : successive requests to the same host are spaced by at least
+    1 / rate seconds, whatever the number of concurrent workers.
+
+    Parameters
+    ----------
+    rate: float or None, default None
+        maximum number of requests per second sent to a single host, no limit if None
+
+    """
+    def __init__(self, rate=None):
+        self.interval = 1 / rate if rate else 0
+        self.next_slot = defaultdict(float)
+        self.lock = asyncio.Lock()
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        async with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot[host])
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+async def fetch_one(session, url, limiter, host_semaphores, retries=3, backoff=.5, cache=None):
+    """
+    Fetch a single URL, retrying with exponential backoff (plus jitter) on network errors,
+    timeouts and 429/5xx responses.
+
+    Parameters
+    ----------
+    session: aiohttp.ClientSession
+        session used to send the request
+    url: str
+        URL to fetch
+    limiter: HostRateLimiter
+        rate limiter shared by all the requests of a run
+    host_semaphores: dict
+        mapping of host -> asyncio.Semaphore bounding the number of in-flight requests per host
+    retries: int, default 3
+        number of retries after the first attempt
+    backoff: float, default .5
+        base delay in seconds, doubled after every failed attempt
+    cache: ResponseCache or None, default None
+        response cache used to skip or revalidate the request
+
+    Returns
+    -------
+    tuple (url, status, content) where content is None if every attempt failed
+
+    """
+    # cache reads and writes (files and sqlite) run in the default thread pool, not to block the event loop
+    loop = asyncio.get_running_loop()
+    headers, cached = {}, None
+    if cache is not None:
+        fresh, headers, cached = await loop.run_in_executor(None, cache.lookup, url)
+        if fresh:
+            await loop.run_in_executor(None, cache.hit, url, cached)
+            metrics.count('http.cache', result='hit')
+            return url, 200, cached
+
+    host = urlsplit(url).netloc
+    status = None
+    for attempt in range(retries + 1):
+        delay = backoff * 2 ** attempt * (1 + random.random())
+        async with host_semaphores[host]:
+            await limiter.wait(host)
+            try:
+                async with session.get(url, headers=headers) as response:
+                    status = response.status
+                    metrics.count('http.status', status=status)
+                    if status == 304 and cached is not None:
+                        await loop.run_in_executor(None, cache.revalidated, url, cached)
+                        metrics.count('http.cache', result='revalidated')
+                        return url, 200, cached
+                    if status not in RETRY_STATUSES:
+                        content = await response.read()
+                        if cache is not None and status == 200:
+                            await loop.run_in_executor(None, cache.store, url, content, response.headers)
+                        return url, status, content
+                    # honor Retry-After when the server sends one in seconds
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metrics.count('http.error', error=type(e).__name__)
+                status = None
+        if attempt < retries:
+            metrics.count('http.retry')
+            await asyncio.sleep(delay)
+    metrics.count('http.failed')
+    return url, status, None
+
+
+async def fetch_all(urls, callback, concurrency=8, rate_limit=None, max_connections=64, retries=3, backoff=.5,
+                    timeout=30, headers=None, cache=None):
+    """
+    Fetch every URL of urls concurrently and call callback(url, status, content) as soon as each
+    response is available (completion order, not input order).
+
+    Parameters
+    ----------
+    urls: iterable of str
+        URLs to fetch
+    callback: callable
+        function called with (url, status, content) for every URL, content being None on failure. If it
+        returns an awaitable (e.g. a coroutine function), it is awaited before the next URL is scheduled,
+        so that a slow consumer holds back new requests without blocking the event loop
+    concurrency: int, default 8
+        maximum number of in-flight requests per host
+    rate_limit: float or None, default None
+        maximum number of requests per second per host, no limit if None
+    max_connections: int, default 64
+        maximum number of open connections across all hosts
+    retries: int, default 3
+        number of retries after the first attempt
+    backoff: float, default .5
+        base delay in seconds between retries
+    timeout: float, default 30
+        total timeout in seconds for a single attempt
+    headers: dict or None, default None
+        headers sent with every request
+    cache: ResponseCache or None, default None
+        response cache used to skip or revalidate requests for pages that didn't change
+
+    Returns
+    -------
+    None
+
+    """
+    limiter = HostRateLimiter(rate_limit)
+    host_semaphores = defaultdict(lambda: asyncio.Semaphore(concurrency))
+    connector = aiohttp.TCPConnector(limit=max_connections, limit_per_host=concurrency)
+
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+        pending = set()
+        for url in urls:
+            # keep at most max_connections tasks alive so that huge link lists aren't all scheduled at once
+            if len(pending) >= max_connections:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    await _handle_result(callback, task)
+            task = fetch_one(session, url, limiter, host_semaphores, retries, backoff, cache)
+            pending.add(asyncio.ensure_future(task))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                await _handle_result(callback, task)
+
+
+async def _handle_result(callback, task):
+    """Calls callback with the result of a fetch_one task, awaiting its result if it's awaitable."""
+    result = callback(*task.result())
+    if inspect.isawaitable(result):
+        await result
+
+
+def iter_pages(urls, max_queued=256, **kwargs):
+    """
+    Synchronous wrapper around fetch_all meant to be used in the scrapers' for loops : the event loop
+    runs in a background thread and pages are yielded as soon as they are downloaded.
+
+    Parameters
+    ----------
+    urls: iterable of str
+        URLs to fetch
+    max_queued: int, default 256
+        maximum number of downloaded pages waiting to be consumed : fetching pauses when the consumer
+        (e.g. the parsing stage) falls behind, so that memory stays bounded
+    **kwargs:
+        any keyword argument accepted by fetch_all (concurrency, rate_limit, retries, ...)
+
+    Yields
+    ------
+    tuple (url, content) where content is None if the page couldn't be fetched
+
+    """
+    results = queue.Queue(max_queued)
+    done = object()
+    errors = []
+
+    async def put(url, status, content):
+        # the queue is bounded : a blocking put runs in a thread, so that in-flight requests, their timeouts
+        # and the rate limiter keep running on the event loop while the consumer falls behind
+        await asyncio.get_running_loop().run_in_executor(None, results.put, (url, content))
+
+    def run():
+        try:
+            asyncio.run(fetch_all(urls, put, **kwargs))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            results.put(done)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    while True:
+        item = results.get()
+        if item is done:
+            break
+        yield item
+
+    thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,192 @@
+"""
+Local gazetteer of the Paris metro stations (names and coordinates), used to find metro stations in the
+descriptions of ads and to locate them without any geocoding.
+
+The gazetteer is a local JSON file (data/metro_stations.json) built from Wikipedia's "Liste des stations
+du métro de Paris" and its station pages, along with the revision of the list it was built from. Loading
+it never touches the network : it is only downloaded by an explicit refresh, to run once before cleaning
+data (and whenever the list of stations changes) :
+
+    python src/gazetteer.py [--path data/metro_stations.json]
+"""
+import argparse
+import json
+import os
+import re
+from datetime import datetime as dt
+from functools import lru_cache
+from urllib.parse import urljoin
+
+import pandas as pd
+from bs4 import BeautifulSoup
+from unidecode import unidecode
+
+from address import StationMatcher
+from fetcher import get_session, iter_pages
+
+URL = 'https://fr.wikipedia.org/wiki/Liste_des_stations_du_m%C3%A9tro_de_Paris'
+HEADERS = {'User-Agent': 'ile-de-france-rent-prediction/1.0 (metro stations gazetteer)'}
+FORMAT_VERSION = 1
+
+# address built by address.get_addresses_from_descr for ads in Paris quoting a metro station
+METRO_ADDRESS = re.compile(r'^metro (.+) paris \S+ france$')
+
+
+def normalize_station(name):
+    """Name of a station as searched in descriptions : without accents, upper case, 'A - B' written 'A-B'."""
+    return unidecode(name).replace(' - ', '-').upper()
+
+
+class Gazetteer:
+    """
+    Metro stations, in the order of the Wikipedia list (which is also the priority order of the names
+    when several of them match at the same position of a description).
+
+    Parameters
+    ----------
+    stations: pandas.DataFrame
+        one row per station with name, normalized (see normalize_station), lat and lon (NaN if unknown)
+    revision: int or None, default None
+        id of the Wikipedia revision the gazetteer was built from
+    created_at: str or None, default None
+        ISO date of the refresh which built the gazetteer
+
+    """
+    def __init__(self, stations, revision=None, created_at=None):
+        self.stations = stations
+        self.revision = revision
+        self.created_at = created_at
+
+    @property
+    def names(self):
+        return self.stations.normalized.tolist()
+
+    def matcher(self, exclude=()):
+        """StationMatcher of the normalized names, except those in exclude (e.g. names which are common words)."""
+        return StationMatcher([name for name in self.names if name not in exclude])
+
+    def locate_addresses(self, address):
+        """
+        Coordinates of metro addresses (see METRO_ADDRESS), taken from the gazetteer.
+
+        Returns
+        -------
+        pandas.DataFrame with lat and lon columns, NaN for other addresses and stations without coordinates,
+        indexed like address
+
+        """
+        station = address.str.extract(METRO_ADDRESS)[0].str.upper()
+        coords = self.stations.drop_duplicates('normalized').set_index('normalized')[['lat', 'lon']]
+        return coords.reindex(station.to_numpy()).set_axis(address.index).astype(float)
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        stations = self.stations.astype(object).where(self.stations.notna(), None)
+        with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+            json.dump({
+                'format_version': FORMAT_VERSION,
+                'source': URL,
+                'revision': self.revision,
+                'created_at': self.created_at,
+                'stations': stations.to_dict('records'),
+            }, f, ensure_ascii=False, indent=1)
+        os.replace(f'{path}.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            content = json.load(f)
+        if content.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f'Gazetteer {path} has format version {content.get("format_version")} instead of '
+                             f'{FORMAT_VERSION}, refresh it with : python src/gazetteer.py --path {path}')
+        stations = pd.DataFrame(content['stations'], columns=['name', 'normalized', 'lat', 'lon'])
+        stations[['lat', 'lon']] = stations[['lat', 'lon']].astype(float)
+        return cls(stations, content.get('revision'), content.get('created_at'))
+
+
+def parse_coords(content):
+    """Coordinates (lat, lon) of the place described by a Wikipedia page, (None, None) if not found."""
+    soup = BeautifulSoup(content, 'html.parser')
+    maplink = soup.select_one('a.mw-kartographer-maplink[data-lat][data-lon]')
+    if maplink is not None:
+        return float(maplink['data-lat']), float(maplink['data-lon'])
+    geo = soup.select_one('span.geo-dec, span.geo')
+    if geo is not None:
+        numbers = re.findall(r'-?\d+(?:\.\d+)?', geo.text)
+        if len(numbers) == 2:
+            return float(numbers[0]), float(numbers[1])
+    return None, None
+
+
+def refresh(path, with_coords=True, concurrency=4, rate_limit=5):
+    """
+    Downloads the list of stations (and the page of every station to get its coordinates) from
+    Wikipedia, then writes the gazetteer at path.
+
+    Parameters
+    ----------
+    path: str
+        path of the gazetteer file
+    with_coords: bool, default True
+        whether to fetch the station pages to get their coordinates
+    concurrency: int, default 4
+        maximum number of station pages fetched at the same time
+    rate_limit: float, default 5
+        maximum number of requests per second to Wikipedia
+
+    Returns
+    -------
+    Gazetteer
+
+    """
+    response = get_session().get(URL, headers=HEADERS, timeout=30)
+    response.raise_for_status()
+    revision = re.search(rb'"wgRevisionId":(\d+)', response.content)
+    soup = BeautifulSoup(response.content, 'html.parser')
+
+    rows = []
+    for el in soup.select_one('table.wikitable').select('tr')[1:]:
+        link = el.select_one('td a')
+        if link is not None:
+            rows.append({'name': link.text, 'normalized': normalize_station(link.text),
+                         'url': urljoin(URL, link.get('href', ''))})
+    stations = pd.DataFrame(rows, columns=['name', 'normalized', 'url'])
+
+    coords = {}
+    if with_coords:
+        for url, content in iter_pages(stations.url.unique(), concurrency=concurrency, rate_limit=rate_limit,
+                                       headers=HEADERS):
+            if content is not None:
+                coords[url] = parse_coords(content)
+    stations[['lat', 'lon']] = pd.DataFrame([coords.get(url, (None, None)) for url in stations.url],
+                                            index=stations.index, dtype=float)
+
+    gazetteer = Gazetteer(stations.drop('url', axis=1), int(revision.group(1)) if revision else None,
+                          dt.now().isoformat(timespec='seconds'))
+    gazetteer.save(path)
+    load_gazetteer.cache_clear()
+    print(f'Gazetteer {path} refreshed : {len(stations):,} stations, '
+          f'{stations.lat.notna().sum():,} with coordinates (revision {gazetteer.revision}).')
+    return gazetteer
+
+
+@lru_cache(maxsize=None)
+def load_gazetteer(path):
+    """Loads the gazetteer at path, once per process. Raises FileNotFoundError if it doesn't exist."""
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f'Gazetteer {path} not found, build it with : python src/gazetteer.py --path {path}')
+    return Gazetteer.load(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Refresh the gazetteer of the Paris metro stations.')
+    parser.add_argument('--path', default=os.path.join('data', 'metro_stations.json'))
+    parser.add_argument('--no-coords', action='store_true', help="don't fetch the coordinates of the stations")
+    args = parser.parse_args()
+    refresh(args.path, with_coords=not args.no_coords)
+
+
+if __name__ == '__main__':
+    main()
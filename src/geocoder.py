@@ -0,0 +1,218 @@
+import io
+import os
+import random
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime as dt
+
+import numpy as np
+import pandas as pd
+import requests
+from unidecode import unidecode
+
+import metrics
+
+
+def normalize_address(address):
+    """Cache key of an address : accents, case and repeated whitespace don't change the geocoding."""
+    return re.sub(r'\s+', ' ', unidecode(address).lower()).strip()
+
+
+class GeocodeCache:
+    """
+    Persistent geocoding cache keyed by normalized address, so that every unique address is geocoded
+    only once, ever. Addresses which the geocoder couldn't find are cached too (with NULL coordinates),
+    whereas addresses which failed because of a timeout or a network error aren't.
+
+    Parameters
+    ----------
+    path: str
+        path of the sqlite file holding the cache, created when needed
+
+    """
+    def __init__(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self.db = sqlite3.connect(path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS geocodes (address TEXT PRIMARY KEY, lat REAL, lon REAL, '
+                        'geocoded_at TEXT)')
+        self.db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, addresses):
+        """
+        Returns a dict address -> (lat, lon) for the addresses found in the cache, (lat, lon) being
+        (None, None) for addresses the geocoder couldn't find.
+        """
+        found = {}
+        addresses = list(addresses)
+        for i in range(0, len(addresses), 500):
+            chunk = addresses[i:i + 500]
+            for address, lat, lon in self.db.execute(
+                f'SELECT address, lat, lon FROM geocodes WHERE address IN ({",".join("?" * len(chunk))})', chunk
+            ):
+                found[address] = (lat, lon)
+        self.hits += len(found)
+        self.misses += len(addresses) - len(found)
+        return found
+
+    def set_many(self, coords):
+        """Stores a dict address -> (lat, lon), (lat, lon) being (None, None) for addresses which weren't found."""
+        now = dt.now().isoformat(timespec='seconds')
+        self.db.executemany('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)',
+                            [(address, lat, lon, now) for address, (lat, lon) in coords.items()])
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+class BANBatchGeocoder:
+    """
+    Batch geocoder using the CSV bulk endpoint of the Base Adresse Nationale (the API behind geopy's
+    BANFrance) : addresses are sent by batches of batch_size in a CSV file, several batches being
+    geocoded concurrently. Batches failing because of a timeout or an HTTP error are retried with
+    exponential backoff.
+
+    Parameters
+    ----------
+    url: str, default 'https://api-adresse.data.gouv.fr/search/csv/'
+        URL of the CSV bulk geocoding endpoint
+    batch_size: int, default 1000
+        number of addresses per request
+    concurrency: int, default 4
+        number of batches geocoded at the same time
+    timeout: float, default 120
+        timeout in seconds of a single request
+    retries: int, default 3
+        number of retries after the first attempt of a batch
+    backoff: float, default 1
+        base delay in seconds between retries, doubled after every failed attempt
+    min_score: float, default 0
+        results with a lower BAN score are considered as not found
+
+    """
+    def __init__(self, url='https://api-adresse.data.gouv.fr/search/csv/', batch_size=1000, concurrency=4,
+                 timeout=120, retries=3, backoff=1, min_score=0):
+        self.url = url
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.min_score = min_score
+        self.session = requests.Session()
+
+    def geocode_batch(self, addresses):
+        """
+        Returns a dict address -> (lat, lon), (None, None) for addresses which weren't found.
+        Addresses of batches which failed after every retry are left out.
+        """
+        addresses = list(addresses)
+        batches = [addresses[i:i + self.batch_size] for i in range(0, len(addresses), self.batch_size)]
+        coords = {}
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            for result in executor.map(self._geocode_with_retries, batches):
+                coords.update(result)
+        return coords
+
+    def _geocode_with_retries(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timer('geocode.batch'):
+                    return self._geocode(batch)
+            except (requests.RequestException, pd.errors.ParserError) as e:
+                metrics.count('geocode.error', error=type(e).__name__)
+                if attempt < self.retries:
+                    metrics.count('geocode.retry')
+                    time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+        return {}
+
+    def _geocode(self, batch):
+        data = pd.DataFrame({'id': range(len(batch)), 'address': batch}).to_csv(index=False).encode('utf-8')
+        response = self.session.post(self.url, files={'data': ('addresses.csv', data, 'text/csv')},
+                                     data={'columns': 'address'}, timeout=self.timeout)
+        response.raise_for_status()
+        result = pd.read_csv(io.BytesIO(response.content), dtype={'address': str})
+        found = result.latitude.notna() & (result.result_score.fillna(0) >= self.min_score)
+        result.loc[~found, ['latitude', 'longitude']] = np.nan
+        return {
+            batch[i]: (lat, lon) if not np.isnan(lat) else (None, None)
+            for i, lat, lon in zip(result.id, result.latitude, result.longitude)
+        }
+
+
+class GeopyGeocoder:
+    """
+    Adapter turning any geopy geocoder (e.g. BANFrance) into a batch geocoder, addresses being
+    geocoded one at a time. Useful for providers without a bulk endpoint.
+    """
+    def __init__(self, geolocator):
+        self.geolocator = geolocator
+
+    def geocode_batch(self, addresses):
+        from geopy.exc import GeopyError
+
+        coords = {}
+        for address in addresses:
+            try:
+                loc = self.geolocator.geocode(address)
+            except GeopyError:
+                continue
+            coords[address] = (loc.latitude, loc.longitude) if loc is not None else (None, None)
+        return coords
+
+
+def geocode_addresses(addresses, cache=None, geocoder=None):
+    """
+    Geocodes a Series of addresses : addresses are normalized and deduplicated, looked up in the cache,
+    and only the unique addresses missing from the cache are sent to the geocoder (in batches).
+
+    Parameters
+    ----------
+    addresses: pandas.Series
+        addresses to geocode
+    cache: GeocodeCache or None, default None
+        persistent geocoding cache
+    geocoder: object or None, default None
+        any object with a geocode_batch(addresses) method returning a dict address -> (lat, lon),
+        defaults to a BANBatchGeocoder
+
+    Returns
+    -------
+    pandas.DataFrame with lat and lon columns (NaN when the address couldn't be geocoded), indexed like addresses,
+    the number of unique addresses which couldn't be geocoded because of errors being stored in attrs['n_failed']
+
+    """
+    geocoder = geocoder or BANBatchGeocoder()
+
+    keys = addresses.map(normalize_address)
+    unique = keys.unique()
+
+    coords = cache.get_many(unique) if cache is not None else {}
+    missing = [key for key in unique if key not in coords]
+    metrics.count('geocode.cache', len(unique) - len(missing), result='hit')
+    metrics.count('geocode.cache', len(missing), result='miss')
+    print(f'Geocoding {len(unique):,} unique addresses '
+          f'({len(unique) - len(missing):,} cached, {len(missing):,} to geocode) ...')
+
+    n_failed = 0
+    if missing:
+        geocoded = geocoder.geocode_batch(missing)
+        if cache is not None:
+            cache.set_many(geocoded)
+        coords.update(geocoded)
+        n_failed = len(missing) - len(geocoded)
+        metrics.count('geocode.failed', n_failed)
+        if n_failed:
+            print(f'{n_failed:,} addresses couldn\'t be geocoded because of errors, they will be retried next time.')
+
+    table = pd.DataFrame([coords.get(key, (None, None)) for key in unique], index=unique, columns=['lat', 'lon'],
+                         dtype=float)
+    table = table.reindex(keys.values).set_axis(addresses.index)
+    table.attrs['n_failed'] = n_failed
+    return table
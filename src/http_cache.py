@@ -0,0 +1,168 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    On-disk HTTP response cache shared by the scrapers.
+
+    Bodies are content-addressed (stored once per sha256 digest, whatever the number of URLs
+    pointing to them) and indexed by URL in a small sqlite database along with their ETag and
+    Last-Modified validators. Entries younger than ttl are served without any request, older ones
+    are revalidated with a conditional request so that unchanged pages aren't downloaded again.
+    Least recently used entries are evicted once the cache grows over max_size bytes (the size of
+    the stored bodies is tracked as they are stored, not recomputed).
+
+    Parameters
+    ----------
+    cache_dir: str
+        path of the folder where the cache is stored, created when needed
+    ttl: float, default 12 * 3600
+        number of seconds during which a cached response is used without being revalidated
+    max_size: int, default 2 * 1024 ** 3
+        maximum size in bytes of the stored bodies
+
+    """
+    def __init__(self, cache_dir, ttl=12 * 3600, max_size=2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_downloaded': 0}
+
+        os.makedirs(os.path.join(cache_dir, 'bodies'), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'url TEXT PRIMARY KEY, digest TEXT, size INTEGER, etag TEXT, last_modified TEXT, '
+            'fetched_at REAL, accessed_at REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS accessed ON responses (accessed_at)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS digests ON responses (digest)')
+        self.db.commit()
+        # size of the stored bodies, kept up to date by store and evict (bodies shared by several URLs
+        # are only counted once)
+        self.total_size = self.db.execute(
+            'SELECT SUM(size) FROM (SELECT DISTINCT digest, size FROM responses)').fetchone()[0] or 0
+
+    def _body_path(self, digest):
+        return os.path.join(self.cache_dir, 'bodies', digest[:2], digest[2:])
+
+    def lookup(self, url):
+        """
+        Returns (fresh, headers, body) for url : fresh tells whether the cached body can be used
+        without revalidation, headers are the conditional request headers to send otherwise.
+        Returns (False, {}, None) if url isn't cached.
+        """
+        with self.lock:
+            row = self.db.execute('SELECT digest, etag, last_modified, fetched_at FROM responses WHERE url = ?',
+                                  (url,)).fetchone()
+        if row is None:
+            return False, {}, None
+        digest, etag, last_modified, fetched_at = row
+        try:
+            with open(self._body_path(digest), 'rb') as f:
+                body = f.read()
+        except FileNotFoundError:
+            return False, {}, None
+
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        return time.time() - fetched_at < self.ttl, headers, body
+
+    def hit(self, url, body):
+        """Records that the cached body of url was used without any request."""
+        with self.lock:
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += len(body)
+            self.db.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            self.db.commit()
+
+    def revalidated(self, url, body):
+        """Records that the server answered 304 Not Modified for url."""
+        now = time.time()
+        with self.lock:
+            self.stats['revalidated'] += 1
+            self.stats['bytes_saved'] += len(body)
+            self.db.execute('UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?', (now, now, url))
+            self.db.commit()
+
+    def _is_referenced(self, digest):
+        return self.db.execute('SELECT 1 FROM responses WHERE digest = ?', (digest,)).fetchone() is not None
+
+    def _remove_body(self, digest):
+        try:
+            os.remove(self._body_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def store(self, url, body, headers):
+        """
+        Stores a freshly downloaded body along with its validators, then evicts old entries if the
+        cache grew over max_size bytes.
+        """
+        digest = hashlib.sha256(body).hexdigest()
+        path = self._body_path(digest)
+        if not os.path.isfile(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, path)
+
+        now = time.time()
+        with self.lock:
+            self.stats['misses'] += 1
+            self.stats['bytes_downloaded'] += len(body)
+            previous = self.db.execute('SELECT digest, size FROM responses WHERE url = ?', (url,)).fetchone()
+            if not self._is_referenced(digest):
+                self.total_size += len(body)
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (url, digest, len(body), headers.get('ETag'), headers.get('Last-Modified'), now, now))
+            # the previous body of url isn't stored anymore if no other URL points to it
+            if previous is not None and previous[0] != digest and not self._is_referenced(previous[0]):
+                self._remove_body(previous[0])
+                self.total_size -= previous[1]
+            self.db.commit()
+            over = self.total_size > self.max_size
+        if over:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used entries until the bodies fit in 90% of max_size bytes, so that
+        the cache isn't evicted again after every store once it is full.
+        """
+        with self.lock:
+            if self.total_size <= self.max_size:
+                return
+            target = .9 * self.max_size
+            while self.total_size > target:
+                rows = self.db.execute('SELECT url, digest, size FROM responses ORDER BY accessed_at LIMIT 256')\
+                              .fetchall()
+                if not rows:
+                    break
+                for url, digest, size in rows:
+                    self.db.execute('DELETE FROM responses WHERE url = ?', (url,))
+                    if not self._is_referenced(digest):
+                        self._remove_body(digest)
+                        self.total_size -= size
+                    if self.total_size <= target:
+                        break
+            self.db.commit()
+
+    def report(self):
+        """Prints cache hit and miss counts and bytes saved since the cache was opened."""
+        s = self.stats
+        print(f'HTTP cache : {s["hits"]:,} hits, {s["revalidated"]:,} revalidated (304), {s["misses"]:,} misses, '
+              f'{s["bytes_saved"] / 1024 ** 2:,.1f} MB saved, {s["bytes_downloaded"] / 1024 ** 2:,.1f} MB downloaded')
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,296 @@
+"""
+Instrumentation of the scraping and cleaning pipelines : spans (timed sections such as the discovery
+of the links of a département or a stage of data_cleaner.clean), timers (durations aggregated over
+many events, e.g. the parsing of every ad page) and counters (HTTP status codes, retries, geocoding
+cache hits, dropped rows, ...), written to a JSON-lines file that can be compared between runs.
+
+Metrics are recorded by the current run, which discards them unless started with a path :
+
+    with metrics.run('data/metrics.jsonl', profile='sampling'):
+        scrap_orpi()
+        clean(...)
+
+Usage : python src/metrics.py data/metrics.jsonl [other_metrics.jsonl ...]
+"""
+import argparse
+import cProfile
+import json
+import os
+import signal
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime as dt
+from functools import wraps
+
+import pandas as pd
+
+
+def get_key(name, tags):
+    return name, tuple(sorted(tags.items()))
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler of the main thread : its call stack is sampled every interval seconds of CPU
+    time (SIGPROF), and the number of samples of every stack is written as folded stacks (one
+    'module:function;module:function count' line per stack), as read by flamegraph.pl or speedscope.
+    Much lighter than cProfile on long runs, since nothing is recorded between samples.
+
+    Parameters
+    ----------
+    interval: float, default 0.005
+        CPU time between two samples, in seconds
+
+    """
+    def __init__(self, interval=.005):
+        self.interval = interval
+        self.samples = Counter()
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+            frame = frame.f_back
+        self.samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, n in self.samples.most_common():
+                f.write(f'{stack} {n}\n')
+
+
+class Metrics:
+    """
+    Recorder of the metrics of a run, thread-safe (pages are fetched in a background thread).
+
+    Spans are written as soon as they end, timers and counters when the run is closed. Every line
+    is a JSON object with the id of the run, the type of the metric (span, timer or counter), its name
+    and its tags.
+
+    Parameters
+    ----------
+    path: str or None, default None
+        path of the JSON-lines file the metrics are appended to, metrics are only kept in memory if None
+    profile: str or None, any from [None, 'cprofile', 'sampling'], default None
+        profiler run along with the run, whose output is written next to path : path + '.prof' (cProfile
+        statistics, see pstats) or path + '.folded' (folded stacks, see SamplingProfiler)
+    run: str or None, default None
+        id of the run, the start time of the run if None
+
+    """
+    def __init__(self, path=None, profile=None, run=None):
+        self.path = path
+        self.run = run or dt.now().isoformat(timespec='seconds')
+        self.lock = threading.Lock()
+        self.spans = []
+        self.timers = defaultdict(lambda: [0, 0., 0.])  # count, total, max
+        self.counters = Counter()
+        self.file = None
+        if path is not None:
+            folder = os.path.dirname(path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self.file = open(path, 'a')
+
+        self.profile = profile
+        self.profiler = None
+        if profile == 'cprofile':
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        elif profile == 'sampling':
+            self.profiler = SamplingProfiler()
+            self.profiler.start()
+        elif profile is not None:
+            raise ValueError(f'Unknown profiler {profile!r}, expected None, \'cprofile\' or \'sampling\'.')
+
+    def write(self, record):
+        if self.file is not None:
+            self.file.write(json.dumps({'run': self.run, **record}) + '\n')
+            self.file.flush()
+
+    def add_span(self, name, seconds, cpu_seconds=None, **tags):
+        """Records a span which lasted seconds (wall time) and cpu_seconds (CPU time of the process)."""
+        record = {'type': 'span', 'name': name, 'tags': tags, 'seconds': seconds, 'cpu_seconds': cpu_seconds,
+                  'time': dt.now().isoformat(timespec='milliseconds')}
+        with self.lock:
+            self.spans.append(record)
+            self.write(record)
+
+    @contextmanager
+    def span(self, name, **tags):
+        """Context manager recording the wall and CPU time of its block as a span."""
+        start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.add_span(name, time.perf_counter() - start, time.process_time() - cpu_start, **tags)
+
+    def observe(self, name, seconds, **tags):
+        """Adds a duration to a timer."""
+        with self.lock:
+            timer = self.timers[get_key(name, tags)]
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name, **tags):
+        """Context manager adding the duration of its block to a timer."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **tags)
+
+    def timed(self, iterable, name, **tags):
+        """Iterates over iterable, adding the time spent waiting for every item to a timer."""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(name, time.perf_counter() - start, **tags)
+            yield item
+
+    def count(self, name, n=1, **tags):
+        """Adds n to a counter."""
+        with self.lock:
+            self.counters[get_key(name, tags)] += int(n)
+
+    def close(self):
+        """Stops the profiler and writes its output, the timers and the counters."""
+        if self.profiler is not None:
+            if self.profile == 'cprofile':
+                self.profiler.disable()
+                if self.path is not None:
+                    self.profiler.dump_stats(f'{self.path}.prof')
+            else:
+                self.profiler.stop()
+                if self.path is not None:
+                    self.profiler.dump(f'{self.path}.folded')
+        with self.lock:
+            for (name, tags), (n, total, longest) in self.timers.items():
+                self.write({'type': 'timer', 'name': name, 'tags': dict(tags), 'count': n, 'seconds': total,
+                            'max_seconds': longest})
+            for (name, tags), value in self.counters.items():
+                self.write({'type': 'counter', 'name': name, 'tags': dict(tags), 'value': value})
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+# current run, see run
+_metrics = Metrics()
+
+
+def get_metrics():
+    return _metrics
+
+
+@contextmanager
+def run(path=None, profile=None, run_id=None):
+    """
+    Context manager making a new Metrics (see its parameters) the current run for the duration of its
+    block, the metrics being written to path when the block exits.
+
+    Yields
+    ------
+    Metrics
+
+    """
+    global _metrics
+    previous, _metrics = _metrics, Metrics(path, profile, run_id)
+    try:
+        yield _metrics
+    finally:
+        _metrics.close()
+        _metrics = previous
+
+
+# shortcuts to the methods of the current run
+def span(name, **tags):
+    return _metrics.span(name, **tags)
+
+
+def timer(name, **tags):
+    return _metrics.timer(name, **tags)
+
+
+def timed(iterable, name, **tags):
+    return _metrics.timed(iterable, name, **tags)
+
+
+def observe(name, seconds, **tags):
+    _metrics.observe(name, seconds, **tags)
+
+
+def count(name, n=1, **tags):
+    _metrics.count(name, n, **tags)
+
+
+def spanned(name, **tags):
+    """Decorator recording every call of a function as a span."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **tags):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def read_metrics(path):
+    """
+    Reads a metrics file.
+
+    Returns
+    -------
+    pandas.DataFrame with one row per line, tags being flattened into a label column (e.g.
+    'http.status[status=200]')
+
+    """
+    with open(path) as f:
+        df = pd.DataFrame([json.loads(line) for line in f if line.strip()])
+    df['label'] = [name + (f'[{",".join(f"{k}={v}" for k, v in sorted(tags.items()))}]' if tags else '')
+                   for name, tags in zip(df.name, df.tags)]
+    return df
+
+
+def compare(paths):
+    """
+    Totals of every span, timer and counter of the runs of metrics files, side by side : total
+    seconds of spans and timers, values of counters.
+
+    Returns
+    -------
+    pandas.DataFrame indexed by (type, label), with one column per run
+
+    """
+    df = pd.concat([read_metrics(path) for path in paths], ignore_index=True)
+    df['total'] = df.seconds.where(df.type != 'counter', df.get('value'))
+    return df.pivot_table(index=['type', 'label'], columns='run', values='total', aggfunc='sum', sort=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the metrics of runs.')
+    parser.add_argument('paths', nargs='+', help='paths of metrics files')
+    args = parser.parse_args()
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:,.2f}'.format):
+        print(compare(args.paths))
+
+
+if __name__ == '__main__':
+    main()
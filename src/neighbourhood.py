@@ -0,0 +1,280 @@
+"""
+Location features of ads computed from their neighbourhood : rents of the nearest ads, density of
+ads around them and distance to the nearest metro station. Neighbours are found with KD-trees
+(sklearn) over the positions of the ads on the unit sphere, queried by vectorized batches : the
+straight-line (chord) distance between two points of the sphere grows with their great-circle
+distance, so the nearest ads are the same as with the haversine distance, and a KD-tree in 3
+dimensions is much faster to query than a haversine BallTree.
+
+Features of the ads of the dataset are computed out-of-fold : ads are split into folds, and the
+features of an ad are computed from the ads of the other folds only, so that the rent of an ad (or
+of the ads of its fold) never leaks into its own features. The folds are a parameter : to evaluate a
+model, they must be computed within its training rows (see training.get_neighbourhood_features), or
+the rents of its test rows would leak into the features of its training rows. New ads are scored
+with NeighbourhoodFeatures, built from every ad the model was trained on.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+import gazetteer
+from gazetteer import load_gazetteer
+from stages import Pipeline, file_digest
+
+EARTH_RADIUS = 6371.  # km
+
+FEATURES = ['knn_price_m2', 'knn_distance', 'radius_count', 'radius_price_m2', 'metro_distance']
+
+
+def to_unit_vectors(lat, lon):
+    """Cartesian coordinates of locations on the unit sphere."""
+    lat, lon = np.radians(np.asarray(lat, dtype=float)), np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def to_km(chord):
+    """Great-circle distance, in km, of a chord of the unit sphere."""
+    return 2 * EARTH_RADIUS * np.arcsin(np.minimum(chord / 2, 1))
+
+
+def to_chord(km):
+    return 2 * np.sin(km / EARTH_RADIUS / 2)
+
+
+def masked_medians(values, mask):
+    """Median of the values of every row where mask is True (vectorized), NaN for rows without any."""
+    counts = mask.sum(axis=1)
+    values = np.sort(np.where(mask, values, np.inf), axis=1)
+    rows = np.arange(len(values))
+    medians = (values[rows, np.maximum(counts - 1, 0) // 2] + values[rows, counts // 2]) / 2
+    return np.where(counts > 0, medians, np.nan)
+
+
+class Neighbourhood:
+    """
+    KD-tree over the locations of a set of ads, built once and queried by batches.
+
+    Parameters
+    ----------
+    lat: array-like
+        latitudes of the ads
+    lon: array-like
+        longitudes of the ads
+    price_m2: array-like
+        monthly rents per m² of the ads
+
+    """
+    def __init__(self, lat, lon, price_m2):
+        self.tree = KDTree(to_unit_vectors(lat, lon))
+        self.price_m2 = np.asarray(price_m2, dtype=float)
+
+    def query(self, lat, lon, k=10, radius=1., max_neighbours=100, batch_size=10000):
+        """
+        Features of locations from the ads of the tree.
+
+        The number of ads within radius is exact, but their median rent is computed from the
+        max_neighbours nearest ads only, which bounds the cost of a query in dense areas (thousands
+        of ads within 1 km in Paris).
+
+        Parameters
+        ----------
+        lat: array-like
+            latitudes of the locations
+        lon: array-like
+            longitudes of the locations
+        k: int, default 10
+            number of nearest ads
+        radius: float, default 1
+            radius of the neighbourhood, in km
+        max_neighbours: int, default 100
+            largest number of ads within radius the median rent is computed from
+        batch_size: int, default 10000
+            number of locations queried at once
+
+        Returns
+        -------
+        pandas.DataFrame with columns knn_price_m2 (median rent per m² of the k nearest ads), knn_distance
+        (mean distance to the k nearest ads, in km), radius_count (number of ads within radius) and
+        radius_price_m2 (median rent per m² of the ads within radius, NaN if there is none)
+
+        """
+        points = to_unit_vectors(lat, lon)
+        k = min(k, len(self.price_m2))
+        max_neighbours = min(max(k, max_neighbours), len(self.price_m2))
+        features = np.full((len(points), 4), np.nan)
+        for start in range(0, len(points), batch_size):
+            batch = points[start:start + batch_size]
+            # nearest ads, sorted by distance
+            distances, indices = self.tree.query(batch, k=max_neighbours)
+            distances, prices = to_km(distances), self.price_m2[indices]
+            features[start:start + len(batch), 0] = np.median(prices[:, :k], axis=1)
+            features[start:start + len(batch), 1] = distances[:, :k].mean(axis=1)
+            features[start:start + len(batch), 2] = self.tree.query_radius(batch, r=to_chord(radius), count_only=True)
+            features[start:start + len(batch), 3] = masked_medians(prices, distances <= radius)
+        return pd.DataFrame(features, columns=FEATURES[:4])
+
+
+def get_metro_distances(lat, lon, stations):
+    """Distance of locations to the nearest metro station of stations (DataFrame with lat and lon columns), in km."""
+    stations = stations.dropna(subset=['lat', 'lon'])
+    if stations.empty:
+        return np.full(len(lat), np.nan)
+    distances, _ = KDTree(to_unit_vectors(stations.lat, stations.lon)).query(to_unit_vectors(lat, lon), k=1)
+    return to_km(distances[:, 0])
+
+
+class NeighbourhoodFeatures:
+    """
+    Neighbourhood features (see FEATURES) of any location, computed from the ads of a training set :
+    the KD-tree over the ads is built once, and the object can be pickled along with a model trained
+    on the same ads to score new ads (see predictor.RentPredictor).
+
+    Unlike Neighbourhood.query, features are never NaN, as they're inputs of the model : the median
+    rent per m² of the ads within radius is the one of the k nearest ads when there is no ad within
+    radius.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        training ads, with lat, lon, price and surface columns
+    stations: pandas.DataFrame or None, default None
+        metro stations, with lat and lon columns, no metro_distance feature if None (ValueError if
+        none of them has coordinates)
+    k, radius, max_neighbours:
+        see Neighbourhood.query
+
+    """
+    def __init__(self, df, stations=None, k=10, radius=1., max_neighbours=100):
+        if stations is not None:
+            stations = stations.dropna(subset=['lat', 'lon'])
+            if stations.empty:
+                raise ValueError('The metro stations have no coordinates : refresh the gazetteer with '
+                                 'python src/gazetteer.py, or leave the metro_distance feature out.')
+        self.neighbourhood = Neighbourhood(df.lat, df.lon, (df.price / df.surface).to_numpy(dtype=float))
+        self.stations = stations
+        self.k, self.radius, self.max_neighbours = k, radius, max_neighbours
+        self.columns = FEATURES if stations is not None else FEATURES[:4]
+
+    def transform(self, lat, lon):
+        """
+        Features of locations.
+
+        Returns
+        -------
+        pandas.DataFrame of the columns of self.columns
+
+        """
+        features = self.neighbourhood.query(lat, lon, self.k, self.radius, self.max_neighbours)
+        features['radius_price_m2'] = features.radius_price_m2.fillna(features.knn_price_m2)
+        if self.stations is not None:
+            features['metro_distance'] = get_metro_distances(lat, lon, self.stations)
+        return features
+
+
+def neighbourhood_features(df, stations, folds, k=10, radius=1., max_neighbours=100):
+    """
+    Out-of-fold neighbourhood features of the ads of a clean dataset : the features of the ads of
+    every fold are computed from the ads of the other folds (see NeighbourhoodFeatures).
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        clean dataset, with lat, lon, price and surface columns
+    stations: pandas.DataFrame or None
+        metro stations, with lat and lon columns, no metro_distance feature if None
+    folds: iterable of tuples (train, test)
+        positions of the rows of every fold (test) and of the rows its features are computed from
+        (train), e.g. the folds of training.split_folds, every row belonging to a single test set
+    k, radius, max_neighbours:
+        see Neighbourhood.query
+
+    Returns
+    -------
+    pandas.DataFrame of the columns of FEATURES (but metro_distance if stations is None), indexed like df
+
+    """
+    features = None
+    for train, test in folds:
+        fold = NeighbourhoodFeatures(df.iloc[train], stations, k, radius, max_neighbours)
+        if features is None:
+            features = pd.DataFrame(np.nan, index=np.arange(df.shape[0]), columns=fold.columns)
+        features.iloc[test] = fold.transform(df.lat.iloc[test], df.lon.iloc[test]).to_numpy()
+    return features.set_axis(df.index)
+
+
+def dataset_version(df):
+    """Hash of the columns of the dataset the features depend on : changes whenever the dataset changes."""
+    hashes = pd.util.hash_pandas_object(df[['lat', 'lon', 'price', 'surface']], index=False)
+    return hashlib.sha256(hashes.to_numpy().tobytes()).hexdigest()
+
+
+def folds_digest(folds):
+    """Hash of the rows of every fold."""
+    digest = hashlib.sha256()
+    for train, test in folds:
+        digest.update(np.asarray(train, dtype=np.int64).tobytes())
+        digest.update(np.asarray(test, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def load_stations(gazetteer_path):
+    """
+    Metro stations of the gazetteer at gazetteer_path which have coordinates, for the metro_distance
+    feature. None (metro_distance left out) if gazetteer_path is None or if no station has coordinates,
+    e.g. when the gazetteer was refreshed with --no-coords.
+    """
+    if gazetteer_path is None:
+        return None
+    stations = load_gazetteer(gazetteer_path).stations.dropna(subset=['lat', 'lon'])
+    if stations.empty:
+        print(f'Gazetteer {gazetteer_path} has no station coordinates : metro_distance is left out.')
+        return None
+    return stations
+
+
+def compute_features(df, gazetteer_path, folds, **params):
+    return neighbourhood_features(df, load_stations(gazetteer_path), folds, **params)
+
+
+def add_neighbourhood_features(df, folds, data_folder='data', k=10, radius=1., max_neighbours=100,
+                               gazetteer_path=None, use_cache=True):
+    """
+    Adds the out-of-fold neighbourhood features (see neighbourhood_features) to a clean dataset. The
+    features are cached in data_folder/feature_cache, keyed by the version of the dataset (see
+    dataset_version), the folds, the parameters and the code, so that they're only computed once per
+    dataset.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        clean dataset, with lat, lon, price and surface columns
+    folds: list of tuples (train, test)
+        folds of the dataset, see neighbourhood_features
+    data_folder: str, default 'data'
+        path of the folder of the feature cache
+    k, radius, max_neighbours:
+        see neighbourhood_features
+    gazetteer_path: str or None, default None
+        path of the metro stations gazetteer (e.g. data/metro_stations.json, see gazetteer.refresh) of the
+        metro_distance feature, left out if None or if the gazetteer has no coordinates (see load_stations)
+    use_cache: bool, default True
+        whether to reuse cached features
+
+    Returns
+    -------
+    pandas.DataFrame, df with the columns of FEATURES (but metro_distance if it's left out)
+
+    """
+    params = {'k': k, 'radius': radius, 'max_neighbours': max_neighbours}
+    pipeline = Pipeline(os.path.join(data_folder, 'feature_cache'), use_cache)
+    features = pipeline.stage('neighbourhood', compute_features,
+                              inputs=[dataset_version(df), folds_digest(folds), json.dumps(params),
+                                      file_digest(gazetteer_path) if gazetteer_path is not None else ''],
+                              code=[load_stations, neighbourhood_features, NeighbourhoodFeatures, Neighbourhood, get_metro_distances,
+                                    masked_medians, to_unit_vectors, to_km, to_chord, gazetteer], df=df,
+                              gazetteer_path=gazetteer_path, folds=folds, **params)
+    return pd.concat([df, features.result().set_axis(df.index)], axis=1)
@@ -0,0 +1,185 @@
+"""
+NumPy-only inference engine for the rent model of modeling.ipynb (embeddings of the categorical
+features concatenated with the numerical features, followed by dense layers) : export_model writes
+the weights of the trained Keras model to a .npz file, which NumpyModel scores without importing
+TensorFlow.
+
+Usage : python src/numpy_model.py output/rent_predictor.h5 output/rent_predictor.npz
+"""
+import argparse
+
+import numpy as np
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': lambda x: 1 / (1 + np.exp(-x)),
+    'tanh': np.tanh,
+}
+
+
+def get_operation(tensor):
+    """Layer which output tensor, in Keras 3 and in tf.keras 2."""
+    history = tensor._keras_history
+    return history.operation if hasattr(history, 'operation') else history.layer
+
+
+def get_inputs(layer):
+    return layer.input if isinstance(layer.input, list) else [layer.input]
+
+
+def export_model(model, path):
+    """
+    Writes the weights of a Keras model built by make_model (modeling.ipynb) to a .npz file : the
+    embedding table of every categorical input, and the kernel, bias and activation of every dense
+    layer, batch normalizations being folded into the dense layer before them (if it has no
+    activation) or after them. Dropouts and reshapes don't change the predictions and aren't exported.
+
+    Parameters
+    ----------
+    model: keras Model
+        trained model
+    path: str
+        path of the .npz file
+
+    Returns
+    -------
+    None
+
+    """
+    concat = next(layer for layer in model.layers if type(layer).__name__ == 'Concatenate')
+
+    # follow every input of the concatenation back to an input of the model, through its embedding if any
+    arrays = {}
+    inputs, widths = [], []
+    for tensor in get_inputs(concat):
+        layer = get_operation(tensor)
+        embedding = None
+        while type(layer).__name__ != 'InputLayer':
+            if type(layer).__name__ == 'Embedding':
+                embedding = layer.get_weights()[0]
+            elif type(layer).__name__ not in ('Reshape', 'SpatialDropout1D', 'Dropout'):
+                raise ValueError(f'Layer {layer.name} ({type(layer).__name__}) isn\'t supported.')
+            layer = get_operation(get_inputs(layer)[0])
+        inputs.append(layer.name)
+        widths.append(tensor.shape[-1])
+        if embedding is not None:
+            arrays[f'embedding_{layer.name}'] = embedding
+
+    # dense layers after the concatenation, in order, a batch normalization being kept as a pending affine
+    # transformation (scale, shift) of the input of the next dense layer when it can't be folded into the previous one
+    kernels, biases, activations = [], [], []
+    pending = None
+    for layer in model.layers[model.layers.index(concat) + 1:]:
+        kind = type(layer).__name__
+        if kind == 'Dense':
+            weights = layer.get_weights()
+            kernel, bias = weights[0], weights[1] if layer.use_bias else np.zeros(weights[0].shape[1])
+            if pending is not None:
+                scale, shift = pending
+                kernel, bias = scale[:, None] * kernel, bias + shift @ kernel
+                pending = None
+            kernels.append(kernel)
+            biases.append(bias)
+            activations.append(layer.activation.__name__)
+        elif kind == 'BatchNormalization':
+            # y = gamma * (x - mean) / sqrt(var + epsilon) + beta = scale * x + shift
+            mean, var = layer.moving_mean.numpy(), layer.moving_variance.numpy()
+            gamma = layer.gamma.numpy() if layer.scale else np.ones_like(mean)
+            beta = layer.beta.numpy() if layer.center else np.zeros_like(mean)
+            scale = gamma / np.sqrt(var + layer.epsilon)
+            shift = beta - mean * scale
+            if pending is None and activations and activations[-1] == 'linear':
+                kernels[-1], biases[-1] = kernels[-1] * scale, biases[-1] * scale + shift
+            elif pending is not None:
+                pending = (pending[0] * scale, pending[1] * scale + shift)
+            else:
+                pending = (scale, shift)
+        elif kind not in ('Dropout', 'Reshape'):
+            raise ValueError(f'Layer {layer.name} ({kind}) isn\'t supported.')
+    if pending is not None:
+        kernels.append(np.diag(pending[0]))
+        biases.append(pending[1])
+        activations.append('linear')
+
+    for i, (kernel, bias) in enumerate(zip(kernels, biases)):
+        arrays[f'kernel_{i}'] = kernel.astype(np.float32)
+        arrays[f'bias_{i}'] = bias.astype(np.float32)
+    np.savez_compressed(path, inputs=np.array(inputs), widths=np.array(widths), activations=np.array(activations),
+                        **arrays)
+
+
+class NumpyModel:
+    """
+    Forward pass of a model exported by export_model, with NumPy only.
+
+    The embedding tables are multiplied by their block of the kernel of the first dense layer when the
+    model is loaded, so that the concatenation and the first matrix product become a sum of table
+    lookups and of the product of the numerical features by their block of the kernel.
+
+    Parameters
+    ----------
+    path: str
+        path of the .npz file written by export_model
+
+    """
+    def __init__(self, path):
+        with np.load(path) as arrays:
+            self.inputs = [str(name) for name in arrays['inputs']]
+            widths = arrays['widths'].tolist()
+            activations = [str(name) for name in arrays['activations']]
+            kernels = [arrays[f'kernel_{i}'] for i in range(len(activations))]
+            self.biases = [arrays[f'bias_{i}'] for i in range(len(activations))]
+            embeddings = {name: arrays[f'embedding_{name}'] for name in self.inputs
+                          if f'embedding_{name}' in arrays}
+        self.activations = [ACTIVATIONS[name] for name in activations]
+
+        # split the kernel of the first dense layer by input
+        self.tables = {}
+        self.blocks = {}
+        start = 0
+        for name, width in zip(self.inputs, widths):
+            if name in embeddings:
+                self.tables[name] = embeddings[name] @ kernels[0][start:start + width]
+            else:
+                self.blocks[name] = kernels[0][start:start + width]
+            start += width
+        self.kernels = kernels[1:]
+
+    def predict_on_batch(self, inputs):
+        """
+        Predictions for a batch of inputs.
+
+        Parameters
+        ----------
+        inputs: dict of input name -> numpy.ndarray
+            inputs of the model, indices of shape (n, 1) for embedded inputs and features of shape (n, k)
+            for the others
+
+        Returns
+        -------
+        numpy.ndarray of shape (n, units of the last dense layer)
+
+        """
+        h = sum(self.tables[name][np.asarray(inputs[name]).reshape(-1)] for name in self.tables)
+        for name, block in self.blocks.items():
+            h = h + np.asarray(inputs[name], dtype=np.float32) @ block
+        h = self.activations[0](h + self.biases[0])
+        for kernel, bias, activation in zip(self.kernels, self.biases[1:], self.activations[1:]):
+            h = activation(h @ kernel + bias)
+        return h
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exports a trained Keras rent model to a .npz file.')
+    parser.add_argument('model', help='path of the Keras model (e.g. output/rent_predictor.h5)')
+    parser.add_argument('path', help='path of the .npz file')
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+
+    export_model(load_model(args.model, compile=False), args.path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import metrics
+from extractors import EXTRACTORS
+
+
+def parse_page(site, url, content):
+    """
+    Worker function : turns the raw content of an ad page of site into a record, along with the time
+    spent parsing it (workers can't record metrics of the run themselves).
+    """
+    start = time.perf_counter()
+    record = EXTRACTORS[site].extract(content)
+    return url, record, time.perf_counter() - start
+
+
+def collect(site, result):
+    """Records the parsing time of a page parsed by parse_page and returns (url, record)."""
+    url, record, seconds = result
+    metrics.observe('parse', seconds, source=site)
+    return url, record
+
+
+def parse_pages(site, pages, executor=None, ordered=False, max_pending=64):
+    """
+    Parsing stage of the scraping pipeline, decoupled from fetching : raw pages coming from the
+    fetchers (e.g. iter_pages) are handed over to a pool of parser processes which turn them into
+    records, so that parsing runs on every core while the network loop keeps downloading.
+
+    At most max_pending pages are submitted to the pool at once : the pages iterator isn't consumed
+    any further until workers catch up, which in turn pauses the fetchers (backpressure).
+
+    Parameters
+    ----------
+    site: str, any from ['laforet', 'orpi', 'guy_hoquet']
+        website the pages come from
+    pages: iterable of (url, content)
+        raw pages, content being None for pages that couldn't be fetched (those are dropped)
+    executor: concurrent.futures.ProcessPoolExecutor or None, default None
+        pool of parser workers, pages are parsed in the current process if None
+    ordered: bool, default False
+        whether to yield records in the order of pages instead of as soon as they are parsed
+    max_pending: int, default 64
+        maximum number of pages submitted to the pool and not yielded yet
+
+    Yields
+    ------
+    tuple (url, record) where record is None if a required field is missing (e.g. dead link)
+
+    """
+    if executor is None:
+        for url, content in pages:
+            if content is not None:
+                yield collect(site, parse_page(site, url, content))
+        return
+
+    pending = deque() if ordered else set()
+    for url, content in pages:
+        if content is None:
+            continue
+        future = executor.submit(parse_page, site, url, content)
+        if ordered:
+            pending.append(future)
+            while len(pending) >= max_pending or (pending and pending[0].done()):
+                yield collect(site, pending.popleft().result())
+        else:
+            pending.add(future)
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield collect(site, future.result())
+
+    if ordered:
+        while pending:
+            yield collect(site, pending.popleft().result())
+    else:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield collect(site, future.result())
@@ -0,0 +1,325 @@
+"""
+Inference service around the model trained in modeling.ipynb (output/rent_predictor.h5) and the
+RobustScaler of its numerical features (output/scaler.pkl) : both are loaded once, and ads are scored
+by batches, their features being encoded with array operations only.
+
+Usage : python src/predictor.py ads.jsonl > predictions.jsonl
+"""
+import argparse
+import io
+import json
+import os
+import pickle
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+
+from numpy_model import NumpyModel
+
+# inputs of the model : one embedding per categorical feature and the scaled numerical features
+CATCOLS = ['rooms', 'bedrooms', 'is_house', 'furnished']
+NUMCOLS = ['surface', 'lat', 'lon']
+
+# rooms and bedrooms are binned (≥5 rooms, ≥3 bedrooms) before being encoded, as in modeling.ipynb
+ROOMS_BINS = 5
+BEDROOMS_BINS = 3
+
+
+def load_model(path):
+    """
+    Loads the model at path for inference only : a .npz file written by numpy_model.export_model, scored
+    with NumPy only, or a Keras model.
+    """
+    if path.endswith('.npz'):
+        return NumpyModel(path)
+
+    from tensorflow.keras.models import load_model as load_keras_model
+
+    return load_keras_model(path, compile=False)
+
+
+def load_scaler(path):
+    """
+    Loads the scaling of the numerical features saved by modeling.ipynb : the fitted
+    sklearn.preprocessing.RobustScaler (medians and interquartile ranges, as computed by
+    training.get_fold).
+
+    Returns
+    -------
+    tuple (centers, scales) of numpy.ndarray, in the order of NUMCOLS
+
+    Raises
+    ------
+    ValueError
+        if the file holds anything else, e.g. the [medians, standard deviations] pair older versions of
+        modeling.ipynb saved, which would silently scale the features differently from the training
+
+    """
+    with open(path, 'rb') as f:
+        scaler = pickle.load(f)
+    if not hasattr(scaler, 'center_') or not hasattr(scaler, 'scale_'):
+        raise ValueError(f'{path} does not hold a fitted RobustScaler (legacy [medians, stds] scaler?) : '
+                         'dump the RobustScaler of the numerical features again, as modeling.ipynb does.')
+    return np.asarray(scaler.center_, dtype=np.float32), np.asarray(scaler.scale_, dtype=np.float32)
+
+
+def load_neighbourhood(path):
+    """Loads the neighbourhood.NeighbourhoodFeatures of the ads the model was trained on, pickled at path."""
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def get_columns(data, columns):
+    """
+    Columns of ads as numpy arrays, without going through rows.
+
+    Parameters
+    ----------
+    data: pandas.DataFrame, pyarrow.Table, pyarrow.RecordBatch or dict
+        ads, a dict being a single ad (scalar values) or several ads (lists)
+    columns: list of str
+        names of the columns
+
+    Returns
+    -------
+    dict of column name -> numpy.ndarray
+
+    """
+    if isinstance(data, pd.DataFrame):
+        return {col: data[col].to_numpy() for col in columns}
+    if isinstance(data, dict):
+        return {col: np.atleast_1d(np.asarray(data[col])) for col in columns}
+    # pyarrow Table and RecordBatch
+    return {col: data.column(col).to_numpy() for col in columns}
+
+
+def read_jsonl(lines):
+    """
+    Reads ads written as JSON lines.
+
+    Parameters
+    ----------
+    lines: str, file object or iterable of str
+        JSON lines, one ad per line
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    """
+    if isinstance(lines, str):
+        lines = io.StringIO(lines)
+    elif not hasattr(lines, 'read'):
+        lines = io.StringIO(''.join(line if line.endswith('\n') else f'{line}\n' for line in lines))
+    return pd.read_json(lines, lines=True, dtype=False)
+
+
+class RentPredictor:
+    """
+    Monthly rent predictor : the model and the scaler are loaded once, then predict scores any number
+    of ads by batches of batch_size.
+
+    Parameters
+    ----------
+    model_path: str, default 'output/rent_predictor.h5'
+        path of the model saved by modeling.ipynb, or of its export by numpy_model.export_model (.npz) to
+        score ads without TensorFlow
+    scaler_path: str, default 'output/scaler.pkl'
+        path of the RobustScaler of the numerical features saved by modeling.ipynb (see load_scaler)
+    batch_size: int, default 4096
+        maximum number of ads fed to the model at once
+    model: object or None, default None
+        model to use instead of the one at model_path, with the predict_on_batch method of Keras models
+    neighbourhood: neighbourhood.NeighbourhoodFeatures or None, default None
+        neighbourhood features built from the ads the model was trained on, for a model trained with
+        them (see training.py) : they're added after NUMCOLS to the numerical features, the scaler
+        being fitted on both
+
+    """
+    def __init__(self, model_path=os.path.join('output', 'rent_predictor.h5'),
+                 scaler_path=os.path.join('output', 'scaler.pkl'), batch_size=4096, model=None, neighbourhood=None):
+        self.model = model if model is not None else load_model(model_path)
+        self.centers, self.scales = load_scaler(scaler_path)
+        self.batch_size = batch_size
+        self.neighbourhood = neighbourhood
+
+    def encode(self, data):
+        """
+        Inputs of the model for ads (vectorized).
+
+        Parameters
+        ----------
+        data: pandas.DataFrame, pyarrow.Table, pyarrow.RecordBatch or dict
+            ads, with the columns of CATCOLS and NUMCOLS
+
+        Returns
+        -------
+        dict of input name -> numpy.ndarray, as fed to the model in modeling.ipynb
+
+        Raises
+        ------
+        ValueError
+            if an ad has less than 1 room or a negative number of bedrooms, which have no embedding
+
+        """
+        columns = get_columns(data, CATCOLS + NUMCOLS)
+        rooms = columns['rooms'].astype(np.int32)
+        bedrooms = columns['bedrooms'].astype(np.int32)
+        # out of range indices would silently select another row of the embeddings (e.g. rooms = 0 -> -1)
+        if (rooms < 1).any() or (bedrooms < 0).any():
+            raise ValueError('ads must have at least 1 room and a non-negative number of bedrooms.')
+        rooms = np.minimum(rooms, ROOMS_BINS) - 1
+        bedrooms = np.minimum(bedrooms, BEDROOMS_BINS)
+        # numerical features are scaled as by the RobustScaler saved along with the model : (x - median) / IQR
+        numcols = np.column_stack([columns[col].astype(np.float32) for col in NUMCOLS])
+        if self.neighbourhood is not None:
+            features = self.neighbourhood.transform(columns['lat'], columns['lon'])
+            numcols = np.hstack([numcols, features.to_numpy(np.float32)])
+        return {
+            'rooms': rooms[:, None],
+            'bedrooms': bedrooms[:, None],
+            'is_house': columns['is_house'].astype(np.int32)[:, None],
+            'furnished': columns['furnished'].astype(np.int32)[:, None],
+            'numcols': (numcols - self.centers) / self.scales,
+        }
+
+    def predict_inputs(self, inputs):
+        """Predictions of the model for encoded inputs, fed by batches of batch_size."""
+        n = len(inputs['numcols'])
+        predictions = np.empty(n, dtype=np.float32)
+        for start in range(0, n, self.batch_size):
+            batch = {name: values[start:start + self.batch_size] for name, values in inputs.items()}
+            # predict_on_batch runs the compiled graph of the model, without the overhead of predict (callbacks,
+            # data adapters) which dominates the latency of small batches
+            predictions[start:start + self.batch_size] = np.asarray(self.model.predict_on_batch(batch)).reshape(-1)
+        return predictions
+
+    def predict(self, data):
+        """
+        Predicts the monthly rents of ads.
+
+        Parameters
+        ----------
+        data: pandas.DataFrame, pyarrow.Table, pyarrow.RecordBatch or dict
+            ads (see encode), a dict being a single ad (scalar values) or several ads (lists)
+
+        Returns
+        -------
+        numpy.ndarray of monthly rents, in €
+
+        """
+        return self.predict_inputs(self.encode(data))
+
+    def predict_jsonl(self, lines):
+        """Predicts the monthly rents of ads written as JSON lines (see read_jsonl)."""
+        return self.predict(read_jsonl(lines))
+
+
+class MicroBatcher:
+    """
+    Groups single prediction requests coming from several threads (e.g. the handlers of a web server)
+    into micro-batches : a background thread waits for up to max_batch_size requests, or for max_wait
+    seconds after the first one, then scores them with a single call to the model.
+
+    Parameters
+    ----------
+    predictor: RentPredictor
+        predictor scoring the micro-batches
+    max_batch_size: int, default 64
+        maximum number of requests per micro-batch
+    max_wait: float, default 0.002
+        maximum time in seconds a request waits for others before its micro-batch is scored
+
+    """
+    def __init__(self, predictor, max_batch_size=64, max_wait=.002):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.n_batches = 0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, ad):
+        """
+        Submits a prediction request.
+
+        Parameters
+        ----------
+        ad: dict
+            features of a single ad (see RentPredictor.encode)
+
+        Returns
+        -------
+        concurrent.futures.Future whose result is the predicted monthly rent
+
+        """
+        future = Future()
+        self.requests.put((ad, future))
+        return future
+
+    def predict(self, ad):
+        """Predicts the monthly rent of a single ad, blocking until its micro-batch is scored."""
+        return self.submit(ad).result()
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            if batch[0] is None:
+                return
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+
+            ads, futures = zip(*batch)
+            try:
+                predictions = self.predictor.predict({col: [ad[col] for ad in ads] for col in CATCOLS + NUMCOLS})
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future, prediction in zip(futures, predictions):
+                    future.set_result(float(prediction))
+            self.n_batches += 1
+
+    def close(self):
+        """Scores pending requests then stops the background thread."""
+        self.requests.put(None)
+        self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predicts the monthly rents of ads written as JSON lines.')
+    parser.add_argument('path', nargs='?', help='JSON lines file, standard input if missing')
+    parser.add_argument('--model', default=os.path.join('output', 'rent_predictor.h5'))
+    parser.add_argument('--scaler', default=os.path.join('output', 'scaler.pkl'))
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--neighbourhood', default=None,
+                        help='pickled NeighbourhoodFeatures, for a model trained with the neighbourhood features')
+    args = parser.parse_args()
+
+    neighbourhood = load_neighbourhood(args.neighbourhood) if args.neighbourhood is not None else None
+    predictor = RentPredictor(args.model, args.scaler, args.batch_size, neighbourhood=neighbourhood)
+    if args.path is None:
+        predictions = predictor.predict_jsonl(sys.stdin)
+    else:
+        with open(args.path, encoding='utf-8') as f:
+            predictions = predictor.predict_jsonl(f)
+    for prediction in predictions:
+        print(json.dumps({'price': round(float(prediction), 2)}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import glob
+import os
+import shutil
+
+import pandas as pd
+
+
+class RecordWriter:
+    """
+    Crash-safe, append-only writer for scraped records.
+
+    Records are buffered and committed to disk every batch_size links as numbered CSV chunks in a
+    <path>.part folder, along with the list of links they come from (links which didn't yield any
+    record are committed too). A chunk is committed by atomically renaming it, so that a crash never
+    leaves a half-written chunk behind. If the scraping is restarted after a crash, the links of the
+    chunks committed by the previous run are available in done and don't need to be fetched again. Once the scraping is
+    over, close concatenates the chunks into the final pipe-separated CSV file at path.
+
+    Memory usage only depends on batch_size, not on the number of scraped ads. Committed chunks can
+    also be fed to a sink (e.g. the partition of the raw Parquet dataset, see
+    storage.RawPartitionWriter) as they are committed, the chunks of a previous run included.
+
+    Parameters
+    ----------
+    path: str
+        path of the final CSV file
+    columns: list of str
+        names of the columns of the records
+    replace_strategy: str, any from ['abort', 'replace'], default 'abort'
+        strategy to follow if a file with the same name as the data file already exists
+    batch_size: int, default 200
+        number of links processed between two commits
+    on_commit: callable or None, default None
+        function called without arguments after every commit
+    sink: object or None, default None
+        object whose write method is called with the DataFrame of every committed chunk, and whose
+        close method is called by close
+
+    """
+    def __init__(self, path, columns, replace_strategy='abort', batch_size=200, on_commit=None, sink=None):
+        if os.path.isfile(path) and replace_strategy == 'abort':
+            raise FileExistsError(f"File {path} already exists. Scraping aborted. To replace the existing file, change replace_strategy to 'replace'.")
+
+        self.path = path
+        self.columns = columns
+        self.replace_strategy = replace_strategy
+        self.batch_size = batch_size
+        self.on_commit = on_commit
+        self.sink = sink
+        self.part_folder = f'{path}.part'
+        self.records = []
+        self.links = []
+        self.n_records = 0
+
+        # resume from the chunks committed by a previous run, if any
+        os.makedirs(self.part_folder, exist_ok=True)
+        self.done = set()
+        self.n_chunks = 0
+        for chunk in sorted(glob.glob(os.path.join(self.part_folder, 'chunk_*.csv'))):
+            with open(chunk[:-len('.csv')] + '.links', encoding='utf-8') as f:
+                self.done.update(line.rstrip('\n') for line in f)
+            self.n_chunks += 1
+            if sink is not None:
+                sink.write(pd.read_csv(chunk, sep='|', header=None, names=columns, dtype=str))
+        if self.done:
+            print(f'Resuming from {len(self.done):,} links committed by a previous run.')
+
+    def write(self, link, record):
+        """Buffers the record scraped from link, committing a chunk when the batch is full."""
+        self.records.append(record)
+        self.n_records += 1
+        self.skip(link)
+
+    def skip(self, link):
+        """Marks link as processed without any record (e.g. a dead link)."""
+        self.links.append(link)
+        if len(self.links) >= self.batch_size:
+            self.commit()
+
+    def commit(self):
+        """Writes buffered records to a new chunk, the rename of the chunk being the commit point."""
+        if not self.links:
+            return
+        name = os.path.join(self.part_folder, f'chunk_{self.n_chunks:06d}')
+
+        with open(f'{name}.links', 'w', encoding='utf-8') as f:
+            f.write(''.join(f'{link}\n' for link in self.links))
+            f.flush()
+            os.fsync(f.fileno())
+
+        df = pd.DataFrame(self.records, columns=self.columns)
+        with open(f'{name}.csv.tmp', 'w', encoding='utf-8', newline='') as f:
+            df.to_csv(f, sep='|', index=False, header=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f'{name}.csv.tmp', f'{name}.csv')
+        if self.sink is not None:
+            self.sink.write(df)
+
+        self.n_chunks += 1
+        self.records = []
+        self.links = []
+        if self.on_commit is not None:
+            self.on_commit()
+
+    def close(self):
+        """
+        Commits remaining records, closes the sink and concatenates every chunk into the final CSV file.
+        """
+        self.commit()
+        if self.sink is not None:
+            self.sink.close()
+
+        if os.path.isfile(self.path) and self.replace_strategy != 'replace':
+            return
+
+        with open(f'{self.path}.tmp', 'w', encoding='utf-8', newline='') as out:
+            pd.DataFrame(columns=self.columns).to_csv(out, sep='|', index=False)
+            for chunk in sorted(glob.glob(os.path.join(self.part_folder, 'chunk_*.csv'))):
+                with open(chunk, encoding='utf-8', newline='') as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(f'{self.path}.tmp', self.path)
+        shutil.rmtree(self.part_folder)
@@ -1,9 +1,288 @@
-import requests
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime as dt
+from multiprocessing import get_context
+from urllib.parse import urljoin
+
+import pandas as pd
 from bs4 import BeautifulSoup
-from selenium import webdriver
 from tqdm import tqdm
 
-def scrap_laforet(data_folder='data', replace_strategy='abort'):
+import metrics
+from ad_index import AdIndex
+from fetcher import get_page, iter_pages
+from http_cache import ResponseCache
+from parse_pool import parse_pages
+from record_writer import RecordWriter
+from storage import RawPartitionWriter
+
+def get_filename(source, suffix=''):
+    """Returns the name of the data file of source for today, e.g. laforet_2020_10_27.csv"""
+    return f'{source}_{dt.now().year}_{dt.now().month}_{dt.now().day}{suffix}.csv'
+
+def get_writer(source, columns, data_folder, replace_strategy, index=None):
+    """
+    Returns the RecordWriter streaming scraped records to data_folder/<source>_<year>_<month>_<day>.csv
+    and, chunk by chunk, to the partition of the raw Parquet dataset for source and today (see
+    storage.RawPartitionWriter).
+
+    In incremental mode (index is not None) the file and the partition only hold the ads that are new
+    since the previous run, the file is suffixed with _delta, and the index is committed along with every chunk of
+    records so that a restarted run doesn't consider committed ads as new.
+
+    Parameters
+    ----------
+    source: str
+        name of the website, used as a prefix for file names and as a namespace in the index
+    columns: list of str
+        names of the columns of the scraped records
+    data_folder: str
+        path of the folder where the data will be written
+    replace_strategy: str, any from ['abort', 'replace']
+        strategy to follow if a file with the same name as the data file already exists
+    index: AdIndex or None, default None
+        index of the ads seen in previous runs, only used in incremental mode
+
+    Returns
+    -------
+    RecordWriter
+
+    """
+    sink = RawPartitionWriter(data_folder, source, columns)
+    if index is None:
+        return RecordWriter(os.path.join(data_folder, get_filename(source)), columns, replace_strategy, sink=sink)
+
+    removed_path = os.path.join(data_folder, get_filename(source, '_removed'))
+    if os.path.isfile(removed_path) and replace_strategy == 'abort':
+        raise FileExistsError(f"File {removed_path} already exists. Scraping aborted. To replace the existing file, change replace_strategy to 'replace'.")
+    return RecordWriter(os.path.join(data_folder, get_filename(source, '_delta')), columns, replace_strategy,
+                        on_commit=index.commit, sink=sink)
+
+def save_data(writer, source, data_folder, replace_strategy, index=None):
+    """
+    Finalizes the data file and the partition of the raw Parquet dataset written by writer. In
+    incremental mode, the ads that disappeared from the listing pages are also tombstoned in the index
+    and written to a _removed file.
+
+    Parameters
+    ----------
+    writer: RecordWriter
+        writer returned by get_writer
+    source: str
+        name of the website
+    data_folder: str
+        path of the folder where the data will be written
+    replace_strategy: str, any from ['abort', 'replace']
+        strategy to follow if a file with the same name as the data file already exists
+    index: AdIndex or None, default None
+        index of the ads seen in previous runs, only used in incremental mode
+
+    Returns
+    -------
+    None
+
+    """
+    writer.close()
+    metrics.count('ads.written', writer.n_records, source=source)
+
+    if index is not None:
+        removed = pd.DataFrame(index.tombstone(source), columns=['key', 'url', 'first_seen', 'last_seen'])
+        print(f'{writer.n_records:,} new ads, {removed.shape[0]:,} removed ads since the previous run.')
+
+        removed_path = os.path.join(data_folder, get_filename(source, '_removed'))
+        if not os.path.isfile(removed_path) or replace_strategy == 'replace':
+            removed.to_csv(removed_path, sep='|', index=False)
+
+@contextmanager
+def open_resources(data_folder, use_cache, incremental, parse_workers):
+    """
+    Context manager opening the resources shared by the scrapers, which are released when its block
+    exits, whether the scraping succeeded or not.
+
+    Parameters
+    ----------
+    data_folder: str
+        path of the folder holding the response cache and the index
+    use_cache: bool
+        whether to open the response cache (data_folder/http_cache)
+    incremental: bool
+        whether to open the index of the ads seen in previous runs (data_folder/ad_index.sqlite)
+    parse_workers: int or None
+        number of processes of the parse pool, no pool (pages parsed in the main process) if 0 or None
+
+    Yields
+    ------
+    tuple (ResponseCache or None, AdIndex or None, ProcessPoolExecutor or None)
+
+    """
+    cache = index = executor = None
+    try:
+        cache = ResponseCache(os.path.join(data_folder, 'http_cache')) if use_cache else None
+        index = AdIndex(os.path.join(data_folder, 'ad_index.sqlite')) if incremental else None
+        # the pool is opt-in : spawning the workers and importing the parsers in each of them costs more
+        # than parsing a few hundred pages in the main process. Workers are started lazily, once the fetch
+        # thread is running : they are spawned, as forking a multi-threaded process isn't safe
+        executor = ProcessPoolExecutor(parse_workers, mp_context=get_context('spawn')) if parse_workers else None
+        yield cache, index, executor
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if index is not None:
+            index.close()
+        if cache is not None:
+            cache.close()
+
+def get_links_http(url_template, link_selector, has_next, cache=None, max_pages=1000):
+    """
+    Lightweight pagination : listing pages are requested directly over HTTP through the shared
+    keep-alive session (the page number being part of the URL) and parsed with the same selectors
+    as the ones used in the browser, until there is no next page.
+
+    Parameters
+    ----------
+    url_template: str
+        URL of the listing pages with a {page} placeholder for the page number (starting at 1)
+    link_selector: str
+        CSS selector of the links to property ads
+    has_next: callable
+        function taking the soup of a listing page and returning whether there is a next page
+    cache: ResponseCache or None, default None
+        response cache used for listing pages
+    max_pages: int, default 1000
+        maximum number of listing pages to read
+
+    Returns
+    -------
+    list of str, absolute URLs of property ads
+
+    """
+    links = []
+    for page in range(1, max_pages + 1):
+        url = url_template.format(page=page)
+        soup = BeautifulSoup(get_page(url, cache))
+        links.extend([urljoin(url, a.get('href')) for a in soup.select(link_selector)])
+        if not has_next(soup):
+            break
+    return links
+
+def orpi_has_next(soup):
+    """Whether an Orpi listing page has a next page, i.e. its last pagination link reads 'Suivant'."""
+    pagination = soup.select('a.c-pagination__link')
+    return bool(pagination) and pagination[-1].select_one('span') is not None \
+        and pagination[-1].select_one('span').text.strip() == 'Suivant'
+
+def guy_hoquet_has_next(soup):
+    """Whether a Guy Hoquet listing page has a next page link."""
+    return soup.select_one('li.page-item.next a') is not None
+
+def use_browser(pagination, links, source, **tags):
+    """
+    Whether listing pages must be read in the browser : always with pagination='browser', and with
+    'http+browser' only if no ad was found over HTTP. Searches without any ad over HTTP are reported
+    and counted (metric discovery.empty), along with the fallbacks to the browser (discovery.fallback).
+    """
+    if pagination == 'browser':
+        return True
+    if links:
+        return False
+    metrics.count('discovery.empty', source=source, **tags)
+    if pagination == 'http+browser':
+        print(f'No {source} ad found over HTTP ({", ".join(map(str, tags.values())) or "all"}), '
+              'reading the listing pages in the browser.')
+        metrics.count('discovery.fallback', source=source, **tags)
+        return True
+    print(f'No {source} ad found over HTTP ({", ".join(map(str, tags.values())) or "all"}).')
+    return False
+
+def get_orpi_links_browser(url):
+    """
+    Browser pagination fallback for www.orpi.com : clicks through the listing pages in Firefox.
+    Selenium is only imported when this fallback is used.
+
+    Parameters
+    ----------
+    url: str
+        URL of the first listing page
+
+    Returns
+    -------
+    list of str, absolute URLs of property ads
+
+    """
+    from selenium import webdriver
+
+    links = []
+
+    driver = webdriver.Firefox()
+
+    driver.get(url)
+
+    # accept cookies
+    driver.find_element_by_css_selector('button.c-btn.c-btn--lg').click()
+
+    # append property ads links
+    soup = BeautifulSoup(driver.page_source)
+    links.extend([urljoin(url, a.get('href')) for a in soup.select('a.u-link-unstyled.c-overlay__link')])
+
+    # repeat for every page
+    next_page = driver.find_elements_by_css_selector('a.c-pagination__link')[-1] \
+                      .find_element_by_css_selector('span') \
+                      .text == 'Suivant'
+    while next_page:
+        driver.find_elements_by_css_selector('a.c-pagination__link')[-1].click()
+        next_page = driver.find_elements_by_css_selector('a.c-pagination__link')[-1] \
+                          .find_element_by_css_selector('span') \
+                          .text == 'Suivant'
+        soup = BeautifulSoup(driver.page_source)
+        links.extend([urljoin(url, a.get('href')) for a in soup.select('a.u-link-unstyled.c-overlay__link')])
+
+    driver.close()
+
+    return links
+
+def get_guy_hoquet_links_browser(url):
+    """
+    Browser pagination fallback for www.guy-hoquet.com : clicks through the listing pages in Firefox.
+    Selenium is only imported when this fallback is used.
+
+    Parameters
+    ----------
+    url: str
+        URL of the first listing page
+
+    Returns
+    -------
+    list of str, absolute URLs of property ads
+
+    """
+    from selenium import webdriver
+    from selenium.common.exceptions import NoSuchElementException
+
+    links = []
+
+    driver = webdriver.Firefox()
+    driver.implicitly_wait(5) # seconds
+    driver.get(url)
+
+    driver.find_element_by_css_selector('div#accept-all-cookies').click()
+    links.extend([a.get_attribute('href') for a in driver.find_elements_by_css_selector('a.property_link_block')])
+
+    while True:
+        try:
+            driver.find_element_by_css_selector('li.page-item.next a').click()
+        except NoSuchElementException:
+            break
+        links.extend([a.get_attribute('href') for a in driver.find_elements_by_css_selector('a.property_link_block')])
+
+    driver.close()
+
+    return links
+
+
+@metrics.spanned('scrape', source='laforet')
+def scrap_laforet(data_folder='data', replace_strategy='abort', concurrency=8, rate_limit=4,
+                  parse_workers=None, use_cache=True, incremental=False, base_url='https://www.laforet.com'):
     """
     Web scrapping function for www.laforet.com meant to retrieve relevant info from property ads
     in Ile-de-France.
@@ -14,6 +293,22 @@ def scrap_laforet(data_folder='data', replace_strategy='abort'):
         path of the folder where the data will be written, created when needed
     replace_strategy: str, any from ['abort', 'replace'], default 'abort'
         strategy to follow if a file with the same name as the data file already exists
+    concurrency: int, default 8
+        maximum number of ad pages downloaded at the same time
+    rate_limit: float or None, default 4
+        maximum number of ad pages requested per second, no limit if None
+    parse_workers: int or None, default None
+        number of processes parsing ad pages while they are being downloaded, pages are parsed in the
+        main process if 0 or None (worth it for thousands of pages on several CPUs only)
+    use_cache: bool, default True
+        whether to keep downloaded pages in an on-disk cache (data_folder/http_cache) so that pages
+        that didn't change since the previous run aren't downloaded again
+    incremental: bool, default False
+        whether to only scrap the ads that weren't seen in previous runs (tracked in
+        data_folder/ad_index.sqlite) : the data file then only holds new ads and is written along
+        with the list of removed ads
+    base_url: str, default 'https://www.laforet.com'
+        root URL of the website, e.g. the URL of a local fixture server in the benchmarks
 
     Returns
     -------
@@ -21,80 +316,71 @@ def scrap_laforet(data_folder='data', replace_strategy='abort'):
 
     """
     def get_soup(URL):
-        return BeautifulSoup(requests.get(URL).content)
+        return BeautifulSoup(get_page(URL, cache))
 
-    BASE_URL = 'https://www.laforet.com/louer/rechercher?'
+    BASE_URL = f'{base_url}/louer/rechercher?'
     depts = [75, 77, 78, 91, 92, 93, 94, 95]
 
     # Create data folder if it doesn't exist
     if not os.path.isdir(data_folder):
         os.mkdir(data_folder)
 
-    # Instanciate data container
-    data = []
-
-    for dept in depts:
-        for filter_ in ('is_furnished', 'is_not_furnished'):
-            print(f'Scraping {"furnished" if filter_ == "is_furnished" else "unfurnished"} properties in dept. {dept} ...')
-
-            url = f'{BASE_URL}filter[cities]={dept}&filter[types]=house%2Capartment&filter[{filter_}]=true&next=5'
-
-            # Get search soup
-            soup = get_soup(url)
-
-            # Find all property ad links
-            elements = soup.select('a.property-card__link')
-            links = set([el.attrs['href'] for el in elements])
-
-            for link in tqdm(links):
-
-                # Get ad soup
-                temp_soup = get_soup('https://www.laforet.com' + link)
-
-                # Scrap
-                try:
-                    ref = temp_soup.select_one('div.property__title span').text.strip()
-                except AttributeError:
-                    continue # in case a link is dead
-                title = temp_soup.select_one('div.property__title h1').text
-                price = (
-                    temp_soup.select_one('div.property__price').text
-                    .replace('\u202f', '').replace('\xa0', '').replace('\n', '').strip()
-                )
-                descr = ' '.join([text.strip()
-                                  for text in temp_soup.select_one('div.property-content__description.mb-4').text.split('\n')
-                                  if text.strip() != ''])
-                try:
-                    conso = temp_soup.select('div.mb-4.col')[0].select_one('span.indicator__value').text.replace('\n', '').strip()
-                except AttributeError:
-                    conso = ''
-                try:
-                    emiss = temp_soup.select('div.mb-4.col')[1].select_one('span.indicator__value').text.replace('\n', '').strip()
-                except AttributeError:
-                    emiss = ''
-                feats = [feat.text.replace('\n', '').strip()
-                         for feat in temp_soup.select('div.property-features__content span.property-feature')]
-                feats = '#'.join(feats)
-
-                # Append data
-                data.append([ref, title, price, descr, conso, emiss, feats, dept, filter_])
+    with open_resources(data_folder, use_cache, incremental, parse_workers) as (cache, index, executor):
+        # Instanciate data writer, records are streamed to disk as they are scraped
+        writer = get_writer('laforet', ['ref', 'title', 'price', 'descr', 'conso', 'emiss', 'feats', 'dept', 'furnitures'],
+                            data_folder, replace_strategy, index)
+
+        # département and furniture filter of the search every ad was found by (the first one if several)
+        searches = {}
+        print('Getting links to property ads for each département ...')
+        for dept in depts:
+            for filter_ in ('is_furnished', 'is_not_furnished'):
+                url = f'{BASE_URL}filter[cities]={dept}&filter[types]=house%2Capartment&filter[{filter_}]=true&next=5'
+
+                with metrics.span('discovery', source='laforet', dept=dept, filter=filter_):
+                    # Get search soup
+                    soup = get_soup(url)
+
+                    # Find all property ad links
+                    for el in soup.select('a.property-card__link'):
+                        searches.setdefault(base_url + el.attrs['href'], (dept, filter_))
+
+        print(f'Scraping {len(searches):,} properties ...')
+
+        # Download the ad pages of every search at once, concurrently, and parse them in worker processes as
+        # soon as they are available
+        urls = list(searches)
+        if index is not None:
+            urls = index.diff('laforet', urls)
+        urls = [url for url in urls if url not in writer.done]
+        pages = metrics.timed(iter_pages(urls, concurrency=concurrency, rate_limit=rate_limit, cache=cache),
+                              'fetch', source='laforet')
+        for url, record in tqdm(parse_pages('laforet', pages, executor), total=len(urls)):
+            if record is None:
+                metrics.count('ads.dead', source='laforet')
+                writer.skip(url)
+                continue # in case a link is dead
+            record['feats'] = '#'.join(record['feats'])
+            record['dept'], record['furnitures'] = searches[url]
+
+            # Write data
+            if index is not None:
+                index.add('laforet', record['ref'], url)
+            with metrics.timer('write', source='laforet'):
+                writer.write(url, [record[col] for col in writer.columns])
 
-            print('\n')
+        print('\n')
 
-    # Store data in a DataFrame and write it on disk
-    df = pd.DataFrame(data, columns=['ref', 'title', 'price', 'descr', 'conso', 'emiss', 'feats', 'dept', 'furnitures'])
+        with metrics.span('save', source='laforet'):
+            save_data(writer, 'laforet', data_folder, replace_strategy, index)
 
-    # Check if data file name already exists : if so follow replace_strategy, if not then create it
-    filename = f'laforet_{dt.now().year}_{dt.now().month}_{dt.now().day}.csv'
-    if not os.path.isfile(os.path.join(data_folder, filename)):
-        df.to_csv(os.path.join(data_folder, filename), sep='|', index=False)
-    else:
-        if replace_strategy == 'abort':
-            raise FileExistsError(f"File {os.path.join(data_folder, file_name)} already exists. Scraping aborted. To replace the existing file, change replace_strategy to 'replace'.")
-        elif replace_strategy == 'replace':
-            df.to_csv(os.path.join(data_folder, filename), sep='|', index=False)
+        if cache is not None:
+            cache.report()
 
-def scrap_orpi(data_folder='data', replace_strategy='abort'):
+@metrics.spanned('scrape', source='orpi')
+def scrap_orpi(data_folder='data', replace_strategy='abort', concurrency=8, rate_limit=4,
+               parse_workers=None, use_cache=True, incremental=False, pagination='http',
+               base_url='https://www.orpi.com'):
     """
     Web scrapping function for www.orpi.com meant to retrieve relevant info from property ads
     in Ile-de-France.
@@ -105,6 +391,25 @@ def scrap_orpi(data_folder='data', replace_strategy='abort'):
         path of the folder where the data will be written, created when needed
     replace_strategy: str, any from ['abort', 'replace'], default 'abort'
         strategy to follow if a file with the same name as the data file already exists
+    concurrency: int, default 8
+        maximum number of ad pages downloaded at the same time
+    rate_limit: float or None, default 4
+        maximum number of ad pages requested per second, no limit if None
+    parse_workers: int or None, default None
+        number of processes parsing ad pages while they are being downloaded, pages are parsed in the
+        main process if 0 or None (worth it for thousands of pages on several CPUs only)
+    use_cache: bool, default True
+        whether to keep downloaded pages in an on-disk cache (data_folder/http_cache) so that pages
+        that didn't change since the previous run aren't downloaded again
+    incremental: bool, default False
+        whether to only scrap the ads that weren't seen in previous runs (tracked in
+        data_folder/ad_index.sqlite) : the data file then only holds new ads and is written along
+        with the list of removed ads
+    pagination: str, any from ['http', 'browser', 'http+browser'], default 'http'
+        how listing pages are read : directly over HTTP, by clicking through them in Firefox (requires
+        selenium), or over HTTP with the browser as a fallback when no ad is found over HTTP
+    base_url: str, default 'https://www.orpi.com'
+        root URL of the website, e.g. the URL of a local fixture server in the benchmarks
 
     Returns
     -------
@@ -112,107 +417,82 @@ def scrap_orpi(data_folder='data', replace_strategy='abort'):
 
     """
 
-    BASE_URL = 'https://www.orpi.com/recherche/rent?'
+    BASE_URL = f'{base_url}/recherche/rent?'
     depts = ['paris', 'seine-et-marne', 'yvelines', 'essonne', 'hauts-de-seine',
              'seine-saint-denis', 'val-de-marne', 'val-d-oise']
 
-    links = {
-        dept: []
-        for dept in depts
-    }
+    if not os.path.isdir(data_folder):
+        os.mkdir(data_folder)
 
-    print('Getting links to property ads for each département ...')
+    with open_resources(data_folder, use_cache, incremental, parse_workers) as (cache, index, executor):
+        # Instanciate data writer, records are streamed to disk as they are scraped
+        writer = get_writer('orpi', ['ref', 'prop_type', 'city', 'dept', 'rooms',
+                                     'surface', 'price', 'descr', 'conso', 'emiss', 'feats'],
+                            data_folder, replace_strategy, index)
 
-    for dept in tqdm(depts):
-        url = f'{BASE_URL}transaction=rent&resultUrl=&realEstateTypes[0]=maison&realEstateTypes[1]=appartement&locations[0][value]={dept}&agency=&minSurface=&maxSurface=&newBuild=&oldBuild=&minPrice=&maxPrice=&sort=date-down&layoutType=mixte&nbBedrooms=&page=&minLotSurface=&maxLotSurface=&minStoryLocation=&maxStoryLocation='
+        links = {
+            dept: []
+            for dept in depts
+        }
 
-        driver = webdriver.Firefox()
+        print('Getting links to property ads for each département ...')
 
-        driver.get(url)
+        for dept in tqdm(depts):
+            url = f'{BASE_URL}transaction=rent&resultUrl=&realEstateTypes[0]=maison&realEstateTypes[1]=appartement&locations[0][value]={dept}&agency=&minSurface=&maxSurface=&newBuild=&oldBuild=&minPrice=&maxPrice=&sort=date-down&layoutType=mixte&nbBedrooms=&page={{page}}&minLotSurface=&maxLotSurface=&minStoryLocation=&maxStoryLocation='
 
-        # accept cookies
-        driver.find_element_by_css_selector('button.c-btn.c-btn--lg').click()
+            with metrics.span('discovery', source='orpi', dept=dept, pagination=pagination):
+                if pagination in ('http', 'http+browser'):
+                    links[dept] = get_links_http(url, 'a.u-link-unstyled.c-overlay__link', orpi_has_next, cache)
+                if use_browser(pagination, links[dept], 'orpi', dept=dept):
+                    links[dept] = get_orpi_links_browser(url.format(page=''))
 
-        # append property ads links
-        soup = BeautifulSoup(driver.page_source)
-        links[dept].extend([a.get('href') for a in soup.select('a.u-link-unstyled.c-overlay__link')])
+        print('\n')
 
-        # repeat for every page
-        next_page = driver.find_elements_by_css_selector('a.c-pagination__link')[-1] \
-                          .find_element_by_css_selector('span') \
-                          .text == 'Suivant'
-        while next_page:
-            driver.find_elements_by_css_selector('a.c-pagination__link')[-1].click()
-            next_page = driver.find_elements_by_css_selector('a.c-pagination__link')[-1] \
-                              .find_element_by_css_selector('span') \
-                              .text == 'Suivant'
-            soup = BeautifulSoup(driver.page_source)
-            links[dept].extend([a.get('href') for a in soup.select('a.u-link-unstyled.c-overlay__link')])
-
-        driver.close()
-
-    print('\n')
-
-    word2num = {
-        'paris': 75,
-        'seine-et-marne': 77,
-        'yvelines': 78,
-        'essonne': 91,
-        'hauts-de-seine': 92,
-        'seine-saint-denis': 93,
-        'val-de-marne': 94,
-        'val-d-oise': 95
-    }
-
-    data = []
-
-    for dept in links.keys():
-        print(f'Scraping {dept} ...')
-
-        for link in tqdm(links[dept]):
-
-            url = 'https://www.orpi.com' + link
-            soup = BeautifulSoup(requests.get(url).content)
-
-            try:
-                ref = soup.select_one('span.u-text-xs').text
-            except AttributeError:
-                continue
-            prop_type = soup.select_one('span.u-text-xl').text.replace('\n', '').strip()
-            rooms, surface = soup.select_one('span.u-h3.u-color-primary').text.split(' • ')
-            city = soup.select_one('span.u-text-lg').text
-            price = soup.select_one('span.u-h1').text.replace('\xa0', '')
-            descr = soup.select_one('div.c-section__inner div.o-container p').text.replace('\n', '').strip()
-            feats = [span.text for span in soup.select('span.c-badge__text')]
-            try:
-                conso = soup.select_one('abbr.c-dpe__index.c-dpe__index--5').text
-            except AttributeError:
-                conso = ''
-
-            try:
-                emiss = soup.select_one('abbr.c-dpe__index.c-dpe__index--3').text
-            except AttributeError:
-                emiss = ''
-
-            data.append([ref, prop_type, city, word2num[dept], rooms, surface, price, descr, conso, emiss, feats])
+        word2num = {
+            'paris': 75,
+            'seine-et-marne': 77,
+            'yvelines': 78,
+            'essonne': 91,
+            'hauts-de-seine': 92,
+            'seine-saint-denis': 93,
+            'val-de-marne': 94,
+            'val-d-oise': 95
+        }
+
+        for dept in links.keys():
+            print(f'Scraping {dept} ...')
+
+            urls = links[dept]
+            if index is not None:
+                urls = index.diff('orpi', urls)
+            urls = [url for url in urls if url not in writer.done]
+            pages = metrics.timed(iter_pages(urls, concurrency=concurrency, rate_limit=rate_limit, cache=cache),
+                              'fetch', source='orpi')
+            for url, record in tqdm(parse_pages('orpi', pages, executor), total=len(urls)):
+                if record is None:
+                    metrics.count('ads.dead', source='orpi')
+                    writer.skip(url)
+                    continue
+                record['feats'] = '#'.join(record['feats'])
+                record['dept'] = word2num[dept]
+
+                if index is not None:
+                    index.add('orpi', record['ref'], url)
+                with metrics.timer('write', source='orpi'):
+                    writer.write(url, [record[col] for col in writer.columns])
 
-        print('\n')
+            print('\n')
+
+        with metrics.span('save', source='orpi'):
+            save_data(writer, 'orpi', data_folder, replace_strategy, index)
 
-    df = pd.DataFrame(data,
-                      columns=['ref', 'prop_type', 'city', 'dept', 'rooms',
-                               'surface', 'price', 'descr', 'conso', 'emiss', 'feats'])
-
-    # Check if data file name already exists : if so follow replace_strategy, if not then create it
-    filename = f'orpi_{dt.now().year}_{dt.now().month}_{dt.now().day}.csv'
-    if not os.path.isfile(os.path.join(data_folder, filename)):
-        df.to_csv(os.path.join(data_folder, filename), sep='|', index=False)
-    else:
-        if replace_strategy == 'abort':
-            raise FileExistsError(f"File {os.path.join(data_folder, file_name)} already exists. Scraping aborted. To replace the existing file, change replace_strategy to 'replace'.")
-        elif replace_strategy == 'replace':
-            df.to_csv(os.path.join(data_folder, filename), sep='|', index=False)
-
-def scrap_guy_hoquet(data_folder='data', replace_strategy='abort'):
+        if cache is not None:
+            cache.report()
+
+@metrics.spanned('scrape', source='guy_hoquet')
+def scrap_guy_hoquet(data_folder='data', replace_strategy='abort', concurrency=8, rate_limit=4,
+                     parse_workers=None, use_cache=True, incremental=False, pagination='http',
+                     base_url='https://www.guy-hoquet.com'):
     """
     Web scrapping function for www.guy-hoquet.com meant to retrieve relevant info from property ads
     in Ile-de-France.
@@ -223,6 +503,25 @@ def scrap_guy_hoquet(data_folder='data', replace_strategy='abort'):
         path of the folder where the data will be written, created when needed
     replace_strategy: str, any from ['abort', 'replace'], default 'abort'
         strategy to follow if a file with the same name as the data file already exists
+    concurrency: int, default 8
+        maximum number of ad pages downloaded at the same time
+    rate_limit: float or None, default 4
+        maximum number of ad pages requested per second, no limit if None
+    parse_workers: int or None, default None
+        number of processes parsing ad pages while they are being downloaded, pages are parsed in the
+        main process if 0 or None (worth it for thousands of pages on several CPUs only)
+    use_cache: bool, default True
+        whether to keep downloaded pages in an on-disk cache (data_folder/http_cache) so that pages
+        that didn't change since the previous run aren't downloaded again
+    incremental: bool, default False
+        whether to only scrap the ads that weren't seen in previous runs (tracked in
+        data_folder/ad_index.sqlite) : the data file then only holds new ads and is written along
+        with the list of removed ads
+    pagination: str, any from ['http', 'browser', 'http+browser'], default 'http'
+        how listing pages are read : directly over HTTP, by clicking through them in Firefox (requires
+        selenium), or over HTTP with the browser as a fallback when no ad is found over HTTP
+    base_url: str, default 'https://www.guy-hoquet.com'
+        root URL of the website, e.g. the URL of a local fixture server in the benchmarks
 
     Returns
     -------
@@ -230,53 +529,48 @@ def scrap_guy_hoquet(data_folder='data', replace_strategy='abort'):
 
     """
 
-    url = 'https://www.guy-hoquet.com/biens/result#1&p=1&f10=2&f20=75_c2,77_c2,78_c2,91_c2,92_c2,93_c2,94_c2,95_c2&f30=appartement,maison'
-
-    links = []
+    url = f'{base_url}/biens/result#1&p=1&f10=2&f20=75_c2,77_c2,78_c2,91_c2,92_c2,93_c2,94_c2,95_c2&f30=appartement,maison'
 
-    driver = webdriver.Firefox()
-    driver.implicitly_wait(5) # seconds
-    driver.get(url)
-
-    driver.find_element_by_css_selector('div#accept-all-cookies').click()
-    links.extend([a.get_attribute('href') for a in driver.find_elements_by_css_selector('a.property_link_block')])
-
-    while True:
-        try:
-            driver.find_element_by_css_selector('li.page-item.next a').click()
-        except NoSuchElementException:
-            break
-        links.extend([a.get_attribute('href') for a in driver.find_elements_by_css_selector('a.property_link_block')])
+    if not os.path.isdir(data_folder):
+        os.mkdir(data_folder)
 
-    driver.close()
+    with open_resources(data_folder, use_cache, incremental, parse_workers) as (cache, index, executor):
+        # Instanciate data writer, records are streamed to disk as they are scraped
+        writer = get_writer('guy_hoquet', ['prop_type', 'city', 'price', 'descr', 'feats', 'feats2', 'neighborhood'],
+                            data_folder, replace_strategy, index)
+
+        links = []
+        with metrics.span('discovery', source='guy_hoquet', pagination=pagination):
+            if pagination in ('http', 'http+browser'):
+                # the search parameters of the result page are passed in the query string instead of the fragment
+                links = get_links_http(url.replace('result#1&p=1&', 'result?p={page}&'), 'a.property_link_block',
+                                       guy_hoquet_has_next, cache)
+            if use_browser(pagination, links, 'guy_hoquet'):
+                links = get_guy_hoquet_links_browser(url)
+
+        # Guy Hoquet ads don't display any reference, they are identified by their URL
+        if index is not None:
+            links = index.diff('guy_hoquet', links)
+        links = [link for link in links if link not in writer.done]
+
+        pages = metrics.timed(iter_pages(links, concurrency=concurrency, rate_limit=rate_limit, cache=cache),
+                              'fetch', source='guy_hoquet')
+        for url, record in tqdm(parse_pages('guy_hoquet', pages, executor), total=len(links)):
+            if record is None:
+                metrics.count('ads.dead', source='guy_hoquet')
+                writer.skip(url)
+                continue
 
-    data = []
+            record['feats'] = '#'.join(record['feats'])
+            record['feats2'] = '#'.join(record['feats2'])
 
-    for link in tqdm(links):
+            if index is not None:
+                index.add('guy_hoquet', url, url)
+            with metrics.timer('write', source='guy_hoquet'):
+                writer.write(url, [record[col] for col in writer.columns])
 
-        soup = BeautifulSoup(requests.get(link).content)
+        with metrics.span('save', source='guy_hoquet'):
+            save_data(writer, 'guy_hoquet', data_folder, replace_strategy, index)
 
-        try:
-            prop_type = soup.select_one('h1.name.property-name').text
-            city = soup.select_one('div.add').text
-            price = soup.select_one('div.price').text.replace('\n', '').strip()
-            descr = soup.select_one('span.description-more').text.replace('\n', '').replace('Voir moins', '').strip()
-            feats = [tag.text for tag in soup.select('div.ttl')]
-            feats2 = [re.sub(r'\s+', ' ',re.sub(r'\n+', '', tag.text)).strip() for tag in soup.select('div.horaires-item')]
-            neighborhood = re.sub(r'\s+', ' ',re.sub(r'\n+', '', soup.select_one('div.quartier-info.mt-4').text)).strip()
-        except AttributeError:
-            continue
-
-        data.append([prop_type, city, price, descr, feats, feats2, neighborhood])
-
-    df = pd.DataFrame(data, columns=['prop_type', 'city', 'price', 'descr', 'feats', 'feats2', 'neighborhood'])
-
-    # Check if data file name already exists : if so follow replace_strategy, if not then create it
-    filename = f'guy_hoquet_{dt.now().year}_{dt.now().month}_{dt.now().day}.csv'
-    if not os.path.isfile(os.path.join(data_folder, filename)):
-        df.to_csv(os.path.join(data_folder, filename), sep='|', index=False)
-    else:
-        if replace_strategy == 'abort':
-            raise FileExistsError(f"File {os.path.join(data_folder, file_name)} already exists. Scraping aborted. To replace the existing file, change replace_strategy to 'replace'.")
-        elif replace_strategy == 'replace':
-            df.to_csv(os.path.join(data_folder, filename), sep='|', index=False)
+        if cache is not None:
+            cache.report()
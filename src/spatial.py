@@ -0,0 +1,174 @@
+"""
+Local geocoding engine built on the shapefiles of the départements of Ile-de-France and of the
+arrondissements of Paris (data/shapefiles) : centroids of arrondissements without any remote call,
+and vectorized check that geocoded points fall in the département of their ad.
+"""
+import os
+import re
+from functools import lru_cache
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely import STRtree
+
+# the shapefiles come without their attribute table (.dbf) : each polygon is identified by a
+# well-known place (lon, lat) it contains
+DEPARTMENT_LANDMARKS = {
+    75: (2.3499, 48.8530),  # Notre-Dame de Paris
+    77: (2.6553, 48.5397),  # Melun
+    78: (2.1204, 48.8049),  # Versailles
+    91: (2.4294, 48.6239),  # Evry
+    92: (2.2069, 48.8924),  # Nanterre
+    93: (2.4397, 48.9086),  # Bobigny
+    94: (2.4556, 48.7904),  # Creteil
+    95: (2.0761, 49.0364),  # Cergy
+}
+
+# town halls of the arrondissements
+ARRONDISSEMENT_LANDMARKS = {
+    75001: (2.3411, 48.8603), 75002: (2.3404, 48.8666), 75003: (2.3601, 48.8638), 75004: (2.3544, 48.8565),
+    75005: (2.3447, 48.8462), 75006: (2.3327, 48.8510), 75007: (2.3170, 48.8566), 75008: (2.3175, 48.8775),
+    75009: (2.3400, 48.8722), 75010: (2.3575, 48.8720), 75011: (2.3796, 48.8579), 75012: (2.3877, 48.8404),
+    75013: (2.3560, 48.8322), 75014: (2.3268, 48.8331), 75015: (2.3000, 48.8412), 75016: (2.2769, 48.8637),
+    75017: (2.3219, 48.8845), 75018: (2.3444, 48.8922), 75019: (2.3822, 48.8826), 75020: (2.3990, 48.8650),
+}
+
+# address built by address.get_addresses_from_city_and_dept for ads in Paris
+ARRONDISSEMENT_ADDRESS = re.compile(r'^paris (\d+)(?:er|e) arrondissement france$')
+
+
+def read_areas(path, landmarks):
+    """
+    Reads the polygons of the shapefile at path.
+
+    Returns
+    -------
+    geopandas.GeoSeries of polygons, indexed by the code of the landmark each one contains
+
+    """
+    polygons = gpd.read_file(path).geometry.values
+    point_idx, polygon_idx = STRtree(polygons).query(shapely.points(list(landmarks.values())), predicate='within')
+    if len(point_idx) != len(landmarks) or len(set(polygon_idx)) != len(polygons):
+        raise ValueError(f'The landmarks of {path} don\'t match its polygons one to one.')
+    return gpd.GeoSeries(polygons[polygon_idx], index=np.array(list(landmarks))[point_idx]).sort_index()
+
+
+def to_department(dept):
+    """Département (e.g. 75) of the dept column of ads, which holds postcodes (e.g. 75011) for Paris."""
+    return dept.astype(str).str[:2].astype(int)
+
+
+class AdminAreas:
+    """
+    Départements of Ile-de-France and arrondissements of Paris, held in memory with an STRtree spatial
+    index on the départements.
+
+    Parameters
+    ----------
+    folder: str, default 'data/shapefiles'
+        folder of geoflar-departements.shp and arrondissements.shp
+
+    """
+    def __init__(self, folder=os.path.join('data', 'shapefiles')):
+        self.departments = read_areas(os.path.join(folder, 'geoflar-departements.shp'), DEPARTMENT_LANDMARKS)
+        self.arrondissements = read_areas(os.path.join(folder, 'arrondissements.shp'), ARRONDISSEMENT_LANDMARKS)
+        shapely.prepare(self.departments.values)
+        self.tree = STRtree(self.departments.values)
+
+        # départements and arrondissements, for joins on both levels at once
+        self.areas = pd.concat([self.departments, self.arrondissements])
+        shapely.prepare(self.arrondissements.values)
+        self.areas_tree = STRtree(self.areas.values)
+
+        centroids = shapely.centroid(self.areas.values)
+        self.centroids = pd.DataFrame({'lat': shapely.get_y(centroids), 'lon': shapely.get_x(centroids)},
+                                      index=self.areas.index)
+
+    def locate_addresses(self, address):
+        """
+        Coordinates of arrondissement addresses (see ARRONDISSEMENT_ADDRESS) : centroids of the arrondissements.
+
+        Returns
+        -------
+        pandas.DataFrame with lat and lon columns, NaN for other addresses, indexed like address
+
+        """
+        arrn = address.str.extract(ARRONDISSEMENT_ADDRESS)[0].astype(float) + 75000
+        return self.centroids.reindex(arrn.to_numpy()).set_axis(address.index)
+
+    def query(self, lat, lon):
+        """
+        Pairs (point index, département index) of the points falling in départements (vectorized) : candidate
+        départements are found with the STRtree on bounding boxes, then checked against the prepared polygons.
+        """
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        point_idx, area_idx = self.tree.query(shapely.points(lon, lat))
+        inside = shapely.intersects_xy(self.departments.values[area_idx], lon[point_idx], lat[point_idx])
+        return point_idx[inside], area_idx[inside]
+
+    def get_departments(self, lat, lon):
+        """
+        Départements of points (vectorized).
+
+        Returns
+        -------
+        numpy.ndarray of départements, 0 for points outside of Ile-de-France or without coordinates
+
+        """
+        point_idx, area_idx = self.query(lat, lon)
+        departments = np.zeros(len(lat), dtype=int)
+        departments[point_idx] = self.departments.index.to_numpy()[area_idx]
+        return departments
+
+    def locate(self, lat, lon):
+        """
+        Départements and arrondissements of points, with a single spatial join (vectorized) against both.
+
+        Returns
+        -------
+        pandas.DataFrame with dept (e.g. 75) and arrn (e.g. 75011) columns, 0 for points outside of
+        Ile-de-France (dept) or of Paris (arrn) and for points without coordinates
+
+        """
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        point_idx, area_idx = self.areas_tree.query(shapely.points(lon, lat))
+        inside = shapely.intersects_xy(self.areas.values[area_idx], lon[point_idx], lat[point_idx])
+        point_idx, codes = point_idx[inside], self.areas.index.to_numpy()[area_idx[inside]]
+        located = pd.DataFrame(0, index=np.arange(len(lat)), columns=['dept', 'arrn'])
+        is_arrn = codes >= 75000
+        located.iloc[point_idx[~is_arrn], 0] = codes[~is_arrn]
+        located.iloc[point_idx[is_arrn], 1] = codes[is_arrn]
+        return located
+
+    def contains(self, lat, lon, dept):
+        """
+        Whether each point falls in its département (vectorized), points on the border of two
+        départements being in both.
+
+        Parameters
+        ----------
+        lat: pandas.Series
+            latitudes, NaN if unknown
+        lon: pandas.Series
+            longitudes, NaN if unknown
+        dept: pandas.Series
+            département of every point, or postcode for Paris
+
+        Returns
+        -------
+        numpy.ndarray of bool
+
+        """
+        point_idx, area_idx = self.query(lat, lon)
+        match = self.departments.index.to_numpy()[area_idx] == to_department(dept).to_numpy()[point_idx]
+        valid = np.zeros(len(lat), dtype=bool)
+        valid[point_idx[match]] = True
+        return valid
+
+
+@lru_cache(maxsize=None)
+def load_areas(folder):
+    """AdminAreas of the shapefiles in folder, read once per process."""
+    return AdminAreas(folder)
@@ -0,0 +1,160 @@
+import hashlib
+import inspect
+import os
+import re
+import time
+
+import pandas as pd
+
+import metrics
+
+MISSING = object()
+
+
+def file_digest(path):
+    """
+    SHA-256 of the content of the file at path, or of the names and contents of the files of the
+    folder at path (e.g. a partition of a Parquet dataset), '' if it doesn't exist.
+    """
+    if os.path.isdir(path):
+        digest = hashlib.sha256()
+        for folder, _, files in sorted(os.walk(path)):
+            for name in sorted(files):
+                digest.update(os.path.relpath(os.path.join(folder, name), path).encode('utf-8'))
+                digest.update(file_digest(os.path.join(folder, name)).encode('utf-8'))
+        return digest.hexdigest()
+    if not os.path.isfile(path):
+        return ''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def code_digest(*objects):
+    """
+    SHA-256 of the source code of functions, classes or modules, and of the pattern and flags of
+    compiled regular expressions : changes whenever their code changes.
+    """
+    digest = hashlib.sha256()
+    for obj in objects:
+        if isinstance(obj, re.Pattern):
+            digest.update(f'{obj.pattern!r}/{obj.flags}'.encode('utf-8'))
+        else:
+            digest.update(inspect.getsource(obj).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Stage:
+    """
+    Node of a Pipeline, evaluated lazily : its result is loaded from the cache if a result with the
+    same key exists, computed from the results of its dependencies otherwise. Use Pipeline.stage to
+    create stages.
+    """
+    def __init__(self, pipeline, name, func, deps, key, cache, kwargs):
+        self.pipeline = pipeline
+        self.name = name
+        self.func = func
+        self.deps = deps
+        self.key = key
+        self.cache = cache
+        self.kwargs = kwargs
+        self.path = os.path.join(pipeline.folder, f'{name}.{key[:16]}.pkl')
+        self._result = MISSING
+
+    def result(self):
+        if self._result is not MISSING:
+            return self._result
+
+        if self.pipeline.use_cache and os.path.isfile(self.path):
+            start = time.perf_counter()
+            self._result = pd.read_pickle(self.path)
+            self.pipeline.record(self.name, time.perf_counter() - start, cached=True)
+            return self._result
+
+        args = [dep.result() for dep in self.deps]
+        start = time.perf_counter()
+        self._result = self.func(*args, **self.kwargs)
+        elapsed = time.perf_counter() - start
+
+        if self.cache(self._result) if callable(self.cache) else self.cache:
+            self.pipeline.store(self)
+        self.pipeline.record(self.name, elapsed, cached=False)
+        return self._result
+
+
+class Pipeline:
+    """
+    Graph of stages whose results are cached on disk, so that reruns only recompute the stages
+    whose inputs or code changed.
+
+    The key of a stage is a hash of its name, of the source code of its function (and of any other
+    code it depends on), of the digests of its external inputs (e.g. the content of the files it
+    reads) and of the keys of the stages it depends on : a change anywhere upstream changes the key
+    of every downstream stage. Only the latest result of every stage is kept.
+
+    Parameters
+    ----------
+    folder: str
+        folder of the cached results
+    use_cache: bool, default True
+        whether to read cached results, every stage being recomputed (and cached) if False
+
+    """
+    def __init__(self, folder, use_cache=True):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.use_cache = use_cache
+        self.timings = []
+
+    def stage(self, name, func, *deps, inputs=(), code=(), cache=True, **kwargs):
+        """
+        Declares a stage computing func(*[dep.result() for dep in deps], **kwargs).
+
+        Parameters
+        ----------
+        name: str
+            name of the stage, unique in the pipeline
+        func: callable
+            function of the stage
+        *deps: Stage
+            stages whose results are the positional arguments of func
+        inputs: iterable of str, default ()
+            digests of the external inputs of the stage (see file_digest), kwargs not being part of the key
+        code: iterable, default ()
+            functions, classes or modules used by func whose code is part of the key
+        cache: bool or callable, default True
+            whether to cache the result, or function of the result telling whether to cache it
+            (e.g. to avoid caching results of a run which met network errors)
+
+        Returns
+        -------
+        Stage
+
+        """
+        digest = hashlib.sha256(name.encode('utf-8'))
+        digest.update(code_digest(func, *code).encode('utf-8'))
+        for part in list(inputs) + [dep.key for dep in deps]:
+            digest.update(part.encode('utf-8'))
+        return Stage(self, name, func, deps, digest.hexdigest(), cache, kwargs)
+
+    def store(self, stage):
+        for name in os.listdir(self.folder):
+            if name.startswith(f'{stage.name}.') and name.endswith('.pkl'):
+                os.remove(os.path.join(self.folder, name))
+        pd.to_pickle(stage.result(), f'{stage.path}.tmp')
+        os.replace(f'{stage.path}.tmp', stage.path)
+
+    def record(self, name, seconds, cached):
+        self.timings.append((name, seconds, cached))
+        metrics.get_metrics().add_span('stage', seconds, stage=name, cached=cached)
+        print(f'[{name}] {seconds:.2f} s{" (cached)" if cached else ""}')
+
+    def report(self):
+        """Prints the time spent in every evaluated stage."""
+        print('Stage timings')
+        print('=============')
+        for name, seconds, cached in self.timings:
+            print(f'{name:<20} {seconds:8.2f} s{"  (cached)" if cached else ""}')
+        print(f'{"total":<20} {sum(seconds for _, seconds, _ in self.timings):8.2f} s')
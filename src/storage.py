@@ -0,0 +1,328 @@
+"""
+Columnar storage of the raw and clean datasets as Parquet datasets partitioned by source and scrape
+date (data_folder/raw/source=<source>/date=<YYYY-MM-DD>/ and data_folder/clean/source=<source>/date=<YYYY-MM-DD>/),
+with compact dtypes. Reads support column projection and predicate pushdown : partitions and row
+groups which can't match the filters aren't read at all.
+
+Existing CSV files can be converted with : python src/storage.py data/laforet_2020_10_27.csv ...
+"""
+import argparse
+import glob
+import os
+import re
+import shutil
+from datetime import datetime as dt
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# compact dtypes of the columns of the raw data written by the scrapers (other columns are text)
+RAW_DTYPES = {
+    'laforet': {'dept': 'int8', 'conso': 'category', 'emiss': 'category', 'furnitures': 'category'},
+    'orpi': {'prop_type': 'category', 'city': 'category', 'dept': 'int8', 'rooms': 'category', 'conso': 'category',
+             'emiss': 'category'},
+    'guy_hoquet': {'prop_type': 'category', 'city': 'category', 'neighborhood': 'category'},
+}
+
+# compact dtypes of the columns of the clean data, dept (département or postcode) being stored as
+# integers and read as a categorical
+CLEAN_DTYPES = {
+    'price': 'int32',
+    'is_house': 'int8',
+    'surface': 'float32',
+    'rooms': 'int8',
+    'bedrooms': 'int8',
+    'furnished': 'int8',
+    'dept': 'int32',
+    'lat': 'float32',
+    'lon': 'float32',
+}
+
+# names of the data files written by the scrapers and by data_cleaner.clean
+RAW_FILENAME = re.compile(r'^(laforet|orpi|guy_hoquet)_(\d{4})_(\d{1,2})_(\d{1,2})\.csv$')
+CLEAN_FILENAME = re.compile(r'^locations_(\d{4})_(\d{1,2})_clean\.csv$')
+
+
+def compact(df, dtypes):
+    """Casts the columns of df found in dtypes to their compact dtype."""
+    return df.astype({col: dtype for col, dtype in dtypes.items() if col in df.columns})
+
+
+def get_partition(root, **keys):
+    """Path of the partition of the dataset at root with the given keys, e.g. root/source=orpi/date=2020-10-27."""
+    return os.path.join(root, *[f'{key}={value}' for key, value in keys.items()])
+
+
+def write_partition(df, root, row_group_size=65536, **keys):
+    """
+    Writes df as the partition of the dataset at root with the given keys, replacing the previous
+    content of the partition. The partition is written in a temporary folder which is then renamed,
+    so that readers never see a half-written partition.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        data of the partition, without the partition keys
+    root: str
+        path of the dataset
+    row_group_size: int, default 65536
+        number of rows per row group, the unit of predicate pushdown within a file
+    **keys:
+        values of the partition keys, e.g. source='orpi', date='2020-10-27'
+
+    Returns
+    -------
+    str, path of the partition
+
+    """
+    path = get_partition(root, **keys)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    shutil.rmtree(f'{path}.tmp', ignore_errors=True)
+    os.makedirs(f'{path}.tmp')
+    df.to_parquet(os.path.join(f'{path}.tmp', 'part-0.parquet'), engine='pyarrow', index=False,
+                  row_group_size=row_group_size)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(f'{path}.tmp', path)
+    return path
+
+
+def get_raw_schema(source, columns):
+    """Arrow schema of the raw data of source : compact dtypes of RAW_DTYPES, other columns being text."""
+    types = {'int8': pa.int8(), 'category': pa.dictionary(pa.int32(), pa.string())}
+    return pa.schema([(col, types.get(RAW_DTYPES[source].get(col), pa.string())) for col in columns])
+
+
+def to_table(df, schema):
+    """
+    Converts df to an Arrow table with the given schema, values of text and categorical columns being
+    converted to strings, and empty strings to nulls (as read_csv does).
+    """
+    arrays = []
+    for field in schema:
+        values = df[field.name]
+        if pa.types.is_integer(field.type):
+            arrays.append(pa.array(pd.to_numeric(values), type=field.type))
+            continue
+        strings = pa.array([None if pd.isna(value) or value == '' else str(value) for value in values],
+                           type=pa.string())
+        arrays.append(strings.dictionary_encode() if pa.types.is_dictionary(field.type) else strings)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+class RawPartitionWriter:
+    """
+    Writer of the partition data_folder/raw/source=<source>/date=<date> of the raw dataset, fed with
+    chunks of records as they are scraped (see record_writer.RecordWriter) : rows are buffered and
+    written as row groups of row_group_size rows, so that memory usage doesn't depend on the number of
+    rows. The partition is written in a temporary folder (created by the first write of a row group)
+    which replaces the previous content of the partition when the writer is closed, so that readers
+    never see a half-written partition.
+
+    Parameters
+    ----------
+    data_folder: str
+        path of the data folder
+    source: str, any from ['laforet', 'orpi', 'guy_hoquet']
+        name of the website
+    columns: list of str
+        names of the columns of the records
+    date: str or None, default None
+        scrape date (YYYY-MM-DD), defaults to today
+    row_group_size: int, default 16384
+        number of rows per row group
+
+    """
+    def __init__(self, data_folder, source, columns, date=None, row_group_size=16384):
+        self.path = get_partition(os.path.join(data_folder, 'raw'), source=source, date=date or today())
+        self.schema = get_raw_schema(source, columns)
+        self.row_group_size = row_group_size
+        self.tables = []
+        self.n_buffered = 0
+        self.writer = None
+
+    def write(self, df):
+        """Buffers the rows of df, writing a row group once row_group_size rows are buffered."""
+        self.tables.append(to_table(df, self.schema))
+        self.n_buffered += df.shape[0]
+        if self.n_buffered >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.writer is None:
+            shutil.rmtree(f'{self.path}.tmp', ignore_errors=True)
+            os.makedirs(f'{self.path}.tmp')
+            self.writer = pq.ParquetWriter(os.path.join(f'{self.path}.tmp', 'part-0.parquet'), self.schema)
+        if self.tables:
+            self.writer.write_table(pa.concat_tables(self.tables).unify_dictionaries(),
+                                    row_group_size=self.row_group_size)
+        self.tables = []
+        self.n_buffered = 0
+
+    def close(self):
+        """
+        Writes the buffered rows and moves the partition in place.
+
+        Returns
+        -------
+        str, path of the partition
+
+        """
+        self.flush()
+        self.writer.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.replace(f'{self.path}.tmp', self.path)
+        return self.path
+
+
+def read_dataset(root, columns=None, filters=None):
+    """
+    Reads the dataset at root (or one of its partitions), partition keys being read as categorical columns.
+
+    Parameters
+    ----------
+    root: str
+        path of the dataset or of a partition
+    columns: list of str or None, default None
+        columns to read, every column if None
+    filters: list of tuples or None, default None
+        predicates (column, op, value) the rows must match, e.g. [('source', '=', 'orpi'), ('price', '<', 1000)],
+        pushed down to the partitions and to the statistics of the row groups
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    """
+    return pd.read_parquet(root, engine='pyarrow', columns=columns, filters=filters)
+
+
+def read_table(path, columns=None):
+    """
+    Reads a raw data file, either a CSV file written by the scrapers or a partition of the raw dataset.
+
+    Parameters
+    ----------
+    path: str
+        path of the CSV file or of the partition
+    columns: list of str or None, default None
+        columns to read, every column if None
+
+    Returns
+    -------
+    pandas.DataFrame
+
+    """
+    if os.path.isdir(path):
+        return read_dataset(path, columns)
+    return pd.read_csv(path, sep='|', usecols=columns)
+
+
+def today():
+    return dt.now().strftime('%Y-%m-%d')
+
+
+def write_raw(df, data_folder, source, date=None):
+    """
+    Writes the raw data scraped from source in the partition data_folder/raw/source=<source>/date=<date>.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        raw data, as written by the scraper of source
+    data_folder: str
+        path of the data folder
+    source: str, any from ['laforet', 'orpi', 'guy_hoquet']
+        name of the website
+    date: str or None, default None
+        scrape date (YYYY-MM-DD), defaults to today
+
+    Returns
+    -------
+    str, path of the partition
+
+    """
+    writer = RawPartitionWriter(data_folder, source, df.columns, date, row_group_size=65536)
+    writer.write(df)
+    return writer.close()
+
+
+def read_raw(data_folder, source, columns=None, filters=None):
+    """
+    Reads the raw data scraped from source in the raw dataset of data_folder (every scrape date, unless
+    filtered on the date column), see read_dataset.
+    """
+    return read_dataset(get_partition(os.path.join(data_folder, 'raw'), source=source), columns, filters)
+
+
+def write_clean(df, data_folder, date=None):
+    """
+    Writes the clean data in the partitions data_folder/clean/source=<source>/date=<date>, rows being
+    sorted by département so that filters on dept skip most row groups.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        clean data, with a source column
+    data_folder: str
+        path of the data folder
+    date: str or None, default None
+        scrape date (YYYY-MM-DD), defaults to today
+
+    Returns
+    -------
+    list of str, paths of the partitions
+
+    """
+    df = compact(df.assign(dept=pd.to_numeric(df.dept)), CLEAN_DTYPES).sort_values('dept')
+    return [write_partition(part.drop('source', axis=1), os.path.join(data_folder, 'clean'), source=source,
+                            date=date or today())
+            for source, part in df.groupby('source', observed=True)]
+
+
+def read_clean(data_folder, columns=None, filters=None):
+    """Reads the clean dataset of data_folder, see read_dataset."""
+    df = read_dataset(os.path.join(data_folder, 'clean'), columns, filters)
+    return df.astype({'dept': 'category'}) if 'dept' in df.columns else df
+
+
+def convert_csv(path, data_folder):
+    """
+    Converts a raw data file written by the scrapers (e.g. laforet_2020_10_27.csv) or a clean data file
+    written by data_cleaner.clean (locations_2020_10_clean.csv) into the matching partitions of the
+    datasets of data_folder. Clean files don't tell the source of their rows (written in the source=all
+    partition) and only carry a month (their date being the first day of the month).
+
+    Returns
+    -------
+    list of str, paths of the partitions
+
+    """
+    name = os.path.basename(path)
+    match = RAW_FILENAME.match(name)
+    if match is not None:
+        source, year, month, day = match.groups()
+        return [write_raw(pd.read_csv(path, sep='|', dtype=str), data_folder, source,
+                          f'{year}-{int(month):02d}-{int(day):02d}')]
+    match = CLEAN_FILENAME.match(name)
+    if match is not None:
+        year, month = match.groups()
+        df = pd.read_csv(path, sep='|')
+        return write_clean(df.assign(source='all'), data_folder, f'{year}-{int(month):02d}-01')
+    raise ValueError(f'{name} is neither a raw nor a clean data file.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Converts CSV data files into the Parquet datasets.')
+    parser.add_argument('paths', nargs='+', help='CSV data files (glob patterns are expanded)')
+    parser.add_argument('--data-folder', default='data')
+    args = parser.parse_args()
+
+    for pattern in args.paths:
+        for path in sorted(glob.glob(pattern)):
+            for partition in convert_csv(path, args.data_folder):
+                print(f'{path} -> {partition}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,480 @@
+"""
+Cross-validated training of the rent model of modeling.ipynb and hyperparameter search : every
+combination of hyperparameters is trained on the k folds (stratified by département) of one or
+several seeds, the folds being run by a pool of worker processes.
+
+The dataset is encoded once (categorical codes, numerical features and target as NumPy arrays) and
+saved as .npy files, which every worker maps in memory once instead of rebuilding the inputs of the
+model from a DataFrame for each fold : a fold only selects rows and scales the numerical features.
+Neighbourhood features (see neighbourhood.py), which depend on the rents of other ads, are computed
+within every fold from its training rows only.
+
+Usage : python src/training.py data/locations_2020_10_clean.csv --seeds 0 1 2 --embedding-size 16 32
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import StratifiedKFold
+
+from neighbourhood import NeighbourhoodFeatures, load_stations, neighbourhood_features
+from predictor import BEDROOMS_BINS, CATCOLS, ROOMS_BINS
+
+# hyperparameters of fit_model in modeling.ipynb
+DEFAULT_PARAMS = {
+    'embedding_size': 32,
+    'units': (96, 48),
+    'dropout': .3,
+    'learning_rate': .005,
+    'batch_size': 32,
+    'dropcols': (),
+}
+
+# dataset of the worker process, see init_worker
+DATASET = {}
+
+
+def encode_dataset(df):
+    """
+    Inputs and target of the model for a clean dataset, as in modeling.ipynb : rooms and bedrooms are
+    binned (≥5 rooms, ≥3 bedrooms) and every column but price, dept and the categorical features is a
+    numerical feature (e.g. surface, lat, lon and any added feature). Numerical features aren't scaled,
+    their scaler being fitted on the training rows of every fold.
+
+    Returns
+    -------
+    dict of name -> numpy.ndarray, with one array of codes per categorical feature, numcols (numerical
+    features, float32), price (float32) and dept (strata of the folds), and list of str, names of the
+    numerical features
+
+    """
+    numcols = [col for col in df.columns if col not in CATCOLS + ['price', 'dept']]
+    arrays = {
+        'rooms': np.minimum(df.rooms.to_numpy(np.int32), ROOMS_BINS) - 1,
+        'bedrooms': np.minimum(df.bedrooms.to_numpy(np.int32), BEDROOMS_BINS),
+        'is_house': df.is_house.to_numpy(np.int32),
+        'furnished': df.furnished.to_numpy(np.int32),
+        'numcols': df[numcols].to_numpy(np.float32),
+        'price': df.price.to_numpy(np.float32),
+        'dept': np.asarray(df.dept.astype(str), dtype=str),
+    }
+    return arrays, numcols
+
+
+def save_dataset(df, cache_folder):
+    """
+    Encodes a clean dataset (see encode_dataset) into a folder of cache_folder named after a hash of
+    its content, unless it's already there.
+
+    Returns
+    -------
+    str, path of the folder
+
+    """
+    digest = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    digest.update(json.dumps(list(df.columns)).encode('utf-8'))
+    folder = os.path.join(cache_folder, digest.hexdigest()[:16])
+    if os.path.isdir(folder):
+        return folder
+
+    arrays, numcols = encode_dataset(df)
+    os.makedirs(f'{folder}.tmp', exist_ok=True)
+    for name, values in arrays.items():
+        np.save(os.path.join(f'{folder}.tmp', f'{name}.npy'), values)
+    with open(os.path.join(f'{folder}.tmp', 'numcols.json'), 'w') as f:
+        json.dump(numcols, f)
+    os.replace(f'{folder}.tmp', folder)
+    return folder
+
+
+def load_dataset(folder):
+    """Dataset saved by save_dataset, its arrays being mapped in memory (read-only)."""
+    with open(os.path.join(folder, 'numcols.json')) as f:
+        numcols = json.load(f)
+    arrays = {name: np.load(os.path.join(folder, f'{name}.npy'), mmap_mode='r')
+              for name in CATCOLS + ['numcols', 'price', 'dept']}
+    return arrays, numcols
+
+
+def init_worker(folder, threads=1, gazetteer_path=None):
+    """
+    Initializer of the worker processes : loads the dataset (and the metro stations of the gazetteer at
+    gazetteer_path, if any, see neighbourhood.load_stations) once per process, and limits the number of threads of TensorFlow so that
+    workers don't compete for the cores.
+    """
+    import tensorflow as tf
+
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(threads)
+    DATASET.clear()
+    DATASET['arrays'], DATASET['numcols'] = load_dataset(folder)
+    DATASET['stations'] = load_stations(gazetteer_path)
+
+
+def make_model(n_categories, n_numerical, embedding_size=32, units=(96, 48), dropout=.3, learning_rate=.005):
+    """
+    Model of modeling.ipynb (make_model) : an embedding per categorical feature concatenated with the
+    numerical features, followed by dense layers with batch normalization and dropout.
+
+    Parameters
+    ----------
+    n_categories: dict of str -> int
+        number of codes of every categorical feature
+    n_numerical: int
+        number of numerical features
+    embedding_size: int, default 32
+        size of the embeddings
+    units: tuple of int, default (96, 48)
+        units of the hidden dense layers
+    dropout: float, default 0.3
+        dropout rate of the embeddings and of the hidden layers
+    learning_rate: float, default 0.005
+        learning rate of Adam
+
+    Returns
+    -------
+    compiled keras Model
+
+    """
+    from tensorflow.keras import layers
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.optimizers import Adam
+
+    inputs, outputs = [], []
+    for col, n in n_categories.items():
+        inp = layers.Input(shape=(1,), name=col)
+        h = layers.Embedding(n + 1, embedding_size)(inp)
+        h = layers.SpatialDropout1D(dropout)(h)
+        outputs.append(layers.Reshape(target_shape=(embedding_size,))(h))
+        inputs.append(inp)
+    num_input = layers.Input(shape=(n_numerical,), name='numcols')
+    inputs.append(num_input)
+    outputs.append(num_input)
+
+    h = layers.Concatenate()(outputs)
+    for n in units:
+        h = layers.Dense(n, activation='relu')(h)
+        h = layers.BatchNormalization()(h)
+        h = layers.Dropout(dropout)(h)
+
+    model = Model(inputs=inputs, outputs=layers.Dense(1, activation='linear')(h))
+    model.compile(optimizer=Adam(learning_rate), loss='mean_squared_error')
+    return model
+
+
+def split_folds(dept, n_folds, seed):
+    """
+    Train and test rows of the folds of a seed, stratified by département.
+
+    Parameters
+    ----------
+    dept: array-like
+        département of every row
+    n_folds: int
+        number of folds
+    seed: int
+        seed of the split
+
+    Returns
+    -------
+    list of tuples (train, test) of numpy.ndarray, positions of the rows
+
+    """
+    dept = np.asarray(dept)
+    return list(StratifiedKFold(n_folds, shuffle=True, random_state=seed).split(dept, dept))
+
+
+def get_folds(n_folds, seed):
+    """Train and test rows of the folds of a seed (see split_folds), split once per worker process."""
+    if (n_folds, seed) not in DATASET:
+        DATASET[n_folds, seed] = split_folds(DATASET['arrays']['dept'], n_folds, seed)
+    return DATASET[n_folds, seed]
+
+
+def get_neighbourhood_features(n_folds, seed, fold, train, test, params):
+    """
+    Neighbourhood features (see neighbourhood.NeighbourhoodFeatures) of the training and test rows of
+    a fold of the dataset of the worker process, computed from its training rows only : the features
+    of the test rows from every training row, and those of the training rows out-of-fold, over the
+    folds of the training rows split as the dataset (see split_folds). The rents of the test rows
+    never leak into the inputs of the model. Computed once per fold and worker process.
+
+    Parameters
+    ----------
+    n_folds, seed, fold:
+        see get_fold
+    train: numpy.ndarray
+        positions of the training rows, in the order of the rows of the returned features
+    test: numpy.ndarray
+        positions of the test rows
+    params: dict
+        parameters of NeighbourhoodFeatures (k, radius, max_neighbours)
+
+    Returns
+    -------
+    tuple (features_train, features_test) of numpy.ndarray (float32), and list of str, names of the features
+
+    """
+    key = 'neighbourhood', n_folds, seed, fold, json.dumps(params, sort_keys=True)
+    if key not in DATASET:
+        arrays, numcols = DATASET['arrays'], DATASET['numcols']
+        df = pd.DataFrame({col: arrays['numcols'][:, numcols.index(col)] for col in ['lat', 'lon', 'surface']})
+        df['price'] = arrays['price']
+        rows = np.sort(train)
+        inner_folds = split_folds(arrays['dept'][rows], n_folds, seed)
+        features_train = neighbourhood_features(df.iloc[rows], DATASET['stations'], inner_folds, **params)
+        model = NeighbourhoodFeatures(df.iloc[rows], DATASET['stations'], **params)
+        features_test = model.transform(df.lat.iloc[test], df.lon.iloc[test])
+        DATASET[key] = (rows, features_train.to_numpy(np.float32), features_test.to_numpy(np.float32),
+                        list(model.columns))
+    rows, features_train, features_test, columns = DATASET[key]
+    return features_train[np.searchsorted(rows, train)], features_test, columns
+
+
+def get_fold(n_folds, seed, fold, dropcols=(), neighbourhood=None):
+    """
+    Inputs and target of the model for the training and test rows of a fold of the dataset of the
+    worker process, the numerical features being scaled as by RobustScaler fitted on the training rows.
+
+    Parameters
+    ----------
+    n_folds: int
+        number of folds
+    seed: int
+        seed of the split into folds and of the shuffling of the training rows
+    fold: int
+        index of the fold
+    dropcols: iterable of str, default ()
+        numerical features to leave out
+    neighbourhood: dict or None, default None
+        parameters of the neighbourhood features added to the numerical features (see
+        get_neighbourhood_features), no neighbourhood feature if None
+
+    Returns
+    -------
+    tuple (inputs_train, y_train, inputs_test, y_test), inputs being dicts of input name -> numpy.ndarray
+
+    """
+    arrays, numcols = DATASET['arrays'], DATASET['numcols']
+    train, test = get_folds(n_folds, seed)[fold]
+    train = np.random.default_rng(seed).permutation(train)
+
+    x_train, x_test = arrays['numcols'][train], arrays['numcols'][test]
+    if neighbourhood is not None:
+        features_train, features_test, columns = get_neighbourhood_features(n_folds, seed, fold, train, test,
+                                                                            neighbourhood)
+        x_train, x_test = np.hstack([x_train, features_train]), np.hstack([x_test, features_test])
+        numcols = numcols + columns
+
+    keep = [i for i, col in enumerate(numcols) if col not in dropcols]
+    x_train, x_test = x_train[:, keep], x_test[:, keep]
+    medians = np.median(x_train, axis=0)
+    iqrs = np.subtract(*np.quantile(x_train, [.75, .25], axis=0))
+    iqrs[iqrs == 0] = 1
+
+    def get_inputs(rows, x):
+        inputs = {col: arrays[col][rows][:, None] for col in CATCOLS}
+        inputs['numcols'] = (x - medians) / iqrs
+        return inputs
+
+    return get_inputs(train, x_train), arrays['price'][train], get_inputs(test, x_test), arrays['price'][test]
+
+
+def fit_fold(task):
+    """
+    Worker function : trains the model with the hyperparameters of task on the training rows of a fold
+    and scores it on its test rows. A tenth of the training rows is held out for early stopping and
+    the reduction of the learning rate, so that the test rows aren't used for training in any way.
+
+    Parameters
+    ----------
+    task: dict
+        params (hyperparameters, see DEFAULT_PARAMS), seed, fold, n_folds, neighbourhood (see get_fold),
+        epochs and patience
+
+    Returns
+    -------
+    dict, row of the results table
+
+    """
+    from sklearn.metrics import mean_absolute_error, r2_score
+    from tensorflow.keras import backend
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+
+    start = time.perf_counter()
+    params = {**DEFAULT_PARAMS, **task['params']}
+    inputs_train, y_train, inputs_test, y_test = get_fold(task['n_folds'], task['seed'], task['fold'],
+                                                          params['dropcols'], task['neighbourhood'])
+
+    backend.clear_session()
+    n_categories = {col: int(DATASET['arrays'][col].max()) + 1 for col in CATCOLS}
+    model = make_model(n_categories, inputs_train['numcols'].shape[1], params['embedding_size'], params['units'],
+                       params['dropout'], params['learning_rate'])
+    callbacks = [EarlyStopping(monitor='val_loss', patience=task['patience'], restore_best_weights=True),
+                 ReduceLROnPlateau(monitor='val_loss', patience=max(task['patience'] // 2, 1), factor=.5)]
+    history = model.fit(inputs_train, y_train, validation_split=.1, epochs=task['epochs'],
+                        batch_size=params['batch_size'], callbacks=callbacks, verbose=0)
+
+    y_pred = model.predict(inputs_test, batch_size=4096, verbose=0).reshape(-1)
+    return {
+        **{name: str(value) if isinstance(value, tuple) else value for name, value in params.items()},
+        'seed': task['seed'],
+        'fold': task['fold'],
+        'n_train': len(y_train),
+        'n_test': len(y_test),
+        'epochs': len(history.history['loss']),
+        'r2': r2_score(y_test, y_pred),
+        'mae': mean_absolute_error(y_test, y_pred),
+        'seconds': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+
+
+def get_grid(param_grid):
+    """Every combination of the values of param_grid (dict of name -> list of values)."""
+    names = list(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*param_grid.values())]
+
+
+def cross_validate(df, param_grid=None, n_folds=5, seeds=(0,), n_workers=None, threads=1, epochs=500, patience=30,
+                   cache_folder=os.path.join('output', 'training_cache'), output_path=None, neighbourhood=None,
+                   gazetteer_path=None):
+    """
+    Trains and scores the model on every fold of every seed for every combination of hyperparameters.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        clean dataset
+    param_grid: dict of str -> list or None, default None
+        values of the hyperparameters to search (see DEFAULT_PARAMS), the defaults of DEFAULT_PARAMS if None
+    n_folds: int, default 5
+        number of folds, stratified by département
+    seeds: iterable of int, default (0,)
+        seeds of the split into folds and of the shuffling of the training rows
+    n_workers: int or None, default None
+        number of worker processes (one fold per process at a time), os.cpu_count() if None, folds are
+        run in the current process if 0
+    threads: int, default 1
+        number of threads of TensorFlow per worker process (0 to let TensorFlow decide)
+    epochs: int, default 500
+        maximum number of epochs
+    patience: int, default 30
+        patience of early stopping (and twice that of the reduction of the learning rate)
+    cache_folder: str, default 'output/training_cache'
+        folder of the encoded datasets (see save_dataset)
+    output_path: str or None, default None
+        path of the CSV file of the results table, not written if None
+    neighbourhood: dict or None, default None
+        parameters of the neighbourhood features (k, radius, max_neighbours, see
+        neighbourhood.NeighbourhoodFeatures) computed within every fold, no neighbourhood feature if None
+    gazetteer_path: str or None, default None
+        path of the metro stations gazetteer of the metro_distance neighbourhood feature, left out if None or
+        if the gazetteer has no coordinates
+
+    Returns
+    -------
+    pandas.DataFrame, results table with one row per fold (hyperparameters, seed, fold, number of
+    epochs, R², MAE and wall time)
+
+    """
+    folder = save_dataset(df, cache_folder)
+    tasks = [{'params': params, 'seed': seed, 'fold': fold, 'n_folds': n_folds, 'neighbourhood': neighbourhood,
+              'epochs': epochs, 'patience': patience}
+             for params in get_grid(param_grid or {}) for seed in seeds for fold in range(n_folds)]
+
+    start = time.perf_counter()
+    if n_workers == 0:
+        init_worker(folder, threads, gazetteer_path)
+        rows = []
+        for task in tasks:
+            rows.append(fit_fold(task))
+            print_row(rows[-1], len(rows), len(tasks))
+    else:
+        # TensorFlow isn't fork-safe : workers are spawned
+        with ProcessPoolExecutor(n_workers or os.cpu_count(), mp_context=get_context('spawn'),
+                                 initializer=init_worker, initargs=(folder, threads, gazetteer_path)) as executor:
+            rows = []
+            for row in executor.map(fit_fold, tasks):
+                rows.append(row)
+                print_row(row, len(rows), len(tasks))
+    print(f'{len(tasks)} folds trained in {time.perf_counter() - start:.1f} s')
+
+    results = pd.DataFrame(rows)
+    if output_path is not None:
+        folder = os.path.dirname(output_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        results.to_csv(output_path, sep='|', index=False)
+    return results
+
+
+def print_row(row, i, n):
+    print(f'[{i}/{n}] seed {row["seed"]} fold {row["fold"]} : R² {row["r2"]:.2%}, MAE {row["mae"]:.0f} €, '
+          f'{row["epochs"]} epochs in {row["seconds"]:.1f} s')
+
+
+def summarize(results):
+    """Mean and standard deviation of the scores of every combination of hyperparameters, best first."""
+    params = [name for name in DEFAULT_PARAMS if name in results.columns]
+    summary = results.groupby(params, sort=False).agg(
+        r2=('r2', 'mean'), r2_std=('r2', 'std'), mae=('mae', 'mean'), seconds=('seconds', 'sum'), folds=('fold', 'size'))
+    return summary.sort_values('r2', ascending=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cross-validated training of the rent model and hyperparameter search.')
+    parser.add_argument('path', help='path of the clean dataset (CSV file or folder of the Parquet dataset)')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--embedding-size', type=int, nargs='+', default=[DEFAULT_PARAMS['embedding_size']])
+    parser.add_argument('--units', nargs='+', default=['96,48'], help='units of the hidden layers, e.g. 96,48 64,32')
+    parser.add_argument('--dropout', type=float, nargs='+', default=[DEFAULT_PARAMS['dropout']])
+    parser.add_argument('--learning-rate', type=float, nargs='+', default=[DEFAULT_PARAMS['learning_rate']])
+    parser.add_argument('--batch-size', type=int, nargs='+', default=[DEFAULT_PARAMS['batch_size']])
+    parser.add_argument('--dropcols', nargs='+', default=[''],
+                        help='numerical features to drop, e.g. "" lat,lon to compare with and without coordinates')
+    parser.add_argument('--neighbourhood', action='store_true',
+                        help='add the neighbourhood features, computed within every fold')
+    parser.add_argument('--k', type=int, default=10, help='nearest ads of the neighbourhood features')
+    parser.add_argument('--radius', type=float, default=1., help='radius of the neighbourhood features, in km')
+    parser.add_argument('--gazetteer', default=None,
+                        help='metro stations gazetteer of the metro_distance feature (built with python '
+                             'src/gazetteer.py), left out if not given or without coordinates')
+    parser.add_argument('--epochs', type=int, default=500)
+    parser.add_argument('--patience', type=int, default=30)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--output', default=os.path.join('output', 'cv_results.csv'))
+    args = parser.parse_args()
+
+    from storage import read_table
+
+    # partition keys of the Parquet dataset aren't features
+    df = read_table(args.path)
+    df = df.drop(columns=[col for col in ['source', 'date'] if col in df.columns])
+    param_grid = {
+        'embedding_size': args.embedding_size,
+        'units': [tuple(int(n) for n in units.split(',')) for units in args.units],
+        'dropout': args.dropout,
+        'learning_rate': args.learning_rate,
+        'batch_size': args.batch_size,
+        'dropcols': [tuple(col for col in cols.split(',') if col) for cols in args.dropcols],
+    }
+    neighbourhood = {'k': args.k, 'radius': args.radius} if args.neighbourhood else None
+    results = cross_validate(df, param_grid, args.folds, args.seeds, args.workers, args.threads, args.epochs,
+                             args.patience, output_path=args.output, neighbourhood=neighbourhood,
+                             gazetteer_path=args.gazetteer)
+    print(summarize(results).to_string())
+
+
+if __name__ == '__main__':
+    main()